@@ -4,14 +4,20 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 import time
 import csv
 from datetime import datetime
+from driver_factory import chrome_service
+from browser_profile import apply_lean_options, activate_lean_profile
+from records import ListingRecord, LISTING_HEADERS, normalize_batch
+from writers import CsvRowWriter
 
-def init_auto24_driver(headless=True):
-    """Initialise le driver Chrome avec les options personnalisées"""
+def init_auto24_driver(headless=True, lean=None):
+    """Initialise le driver Chrome avec les options personnalisées
+
+    `lean` (LeanProfile) active le profil léger : chargement eager et blocage des
+    images, polices, médias et traceurs tiers.
+    """
     options = Options()
     
     # Configuration de base
@@ -28,8 +34,13 @@ def init_auto24_driver(headless=True):
     options.add_argument("--disable-gpu")
     options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.212 Safari/537.36")
 
-    service = Service(ChromeDriverManager().install())
+    if lean is not None:
+        apply_lean_options(options, lean)
+
+    service = chrome_service()
     driver = webdriver.Chrome(service=service, options=options)
+    if lean is not None:
+        activate_lean_profile(driver, lean)
     return driver
 
 def scrape_auto24():
@@ -73,7 +84,7 @@ def scrape_auto24():
                 )
                 transmission = features[0].text.split('\n')[-1].strip() if len(features) > 0 else "N/A"
                 fuel_type = features[1].text.split('\n')[-1].strip() if len(features) > 1 else "N/A"
-                mileage = features[2].text.split('\n')[-1].replace('KM', '').strip() if len(features) > 2 else "N/A"
+                mileage = features[2].text.split('\n')[-1].strip() if len(features) > 2 else "N/A"
 
                 # Détection vendeur pro
                 seller_type = "Professionnel" if listing.find_elements(By.CSS_SELECTOR, "div.card-brand-logo") else "Particulier"
@@ -84,16 +95,16 @@ def scrape_auto24():
                     listing
                 )
 
-                data.append([
-                    idx,
-                    title,
-                    _clean_price(price),
-                    transmission,
-                    fuel_type,
-                    mileage,
-                    seller_type,
-                    link
-                ])
+                data.append(ListingRecord(
+                    listing_id=idx,
+                    title=title,
+                    price=price,
+                    gearbox=transmission,
+                    fuel=fuel_type,
+                    mileage=mileage,
+                    seller=seller_type,
+                    url=link
+                ))
 
                 print(f"✔ Annonce {idx} traitée")
 
@@ -105,36 +116,13 @@ def scrape_auto24():
         driver.quit()
         save_to_csv(data)
 
-def _clean_price(price_str):
-    """Nettoyage du prix"""
-    try:
-        return int(price_str.replace('DH', '')
-                   .replace(' ', '')
-                   .replace('\u202f', '')
-                   .strip())
-    except:
-        return 0
-
 def save_to_csv(data):
-    """Sauvegarde des données"""
-    columns = [
-        "ID", 
-        "Titre", 
-        "Prix (DH)", 
-        "Transmission", 
-        "Type de carburant", 
-        "Kilométrage", 
-        "Vendeur", 
-        "URL"
-    ]
-    
+    """Sauvegarde des données (prix et kilométrages normalisés par lot)"""
     filename = f"auto24_{datetime.now().strftime('%Y%m%d_%H%M')}.csv"
-    
-    with open(filename, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f, delimiter=';')
-        writer.writerow(columns)
-        writer.writerows(data)
-    
+
+    with CsvRowWriter(filename, LISTING_HEADERS) as writer:
+        writer.write_many(normalize_batch(data))
+
     print(f"\n✅ Fichier {filename} généré avec {len(data)} annonces")
 
 if __name__ == "__main__":
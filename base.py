@@ -1,17 +1,24 @@
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
-from webdriver_manager.chrome import ChromeDriverManager
 import csv
 from datetime import datetime
 import os
-import time
-
-def init_auto24_driver(headless=True):
-    """Initialise le driver Chrome avec les options personnalisées"""
+from detail_pool import iter_pool
+from driver_factory import chrome_service
+from browser_profile import apply_lean_options, activate_lean_profile
+from writers import CsvRowWriter
+from records import ListingRecord, CarRecord, DETAILED_HEADERS, EQUIPMENT_SEPARATOR, normalize_batch
+from rate_limit import limited_driver_get
+
+def init_auto24_driver(headless=True, lean=None):
+    """Initialise le driver Chrome avec les options personnalisées
+
+    `lean` (LeanProfile) active le profil léger : chargement eager et blocage des
+    images, polices, médias et traceurs tiers.
+    """
     options = Options()
     options.add_argument("--headless=new" if headless else "--start-maximized")
     options.add_argument("--window-size=1920,1080")
@@ -22,15 +29,22 @@ def init_auto24_driver(headless=True):
     options.add_experimental_option("useAutomationExtension", False)
     options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.212 Safari/537.36")
 
-    service = Service(ChromeDriverManager().install())
-    return webdriver.Chrome(service=service, options=options)
+    if lean is not None:
+        apply_lean_options(options, lean)
+
+    service = chrome_service()
+    driver = webdriver.Chrome(service=service, options=options)
+    if lean is not None:
+        activate_lean_profile(driver, lean)
+    return driver
 
 def scrape_car_details(driver, url):
     """Scrape les détails complets d'une annonce Auto24.ma"""
-    driver.get(url)
+    # Débit réglé par le limiteur adaptatif partagé (remplace la pause fixe de 2 s)
+    limited_driver_get(driver, url)
     details = {
         'date_mise_circulation': 'N/A',
-        'kilometrage': 0,
+        'kilometrage': 'N/A',
         'carburant': 'N/A',
         'transmission': 'N/A',
         'places': 'N/A',
@@ -113,60 +127,43 @@ def scrape_car_details(driver, url):
         details['couleur_int'],
         details['nb_proprietaires'],
         details['condition'],
-        " | ".join(details['equipements']),
+        EQUIPMENT_SEPARATOR.join(details['equipements']),
         details['prix']
     ]
 
-def process_csv(input_csv, output_csv):
+def process_csv(input_csv, output_csv, workers=4):
     """Lit le CSV principal et scrape les détails supplémentaires pour chaque annonce"""
-    driver = init_auto24_driver()
-    
-    # Lire les URLs depuis le CSV
+    # Lire les annonces depuis le CSV (colonnes de records.LISTING_COLUMNS)
     with open(input_csv, "r", encoding="utf-8") as file:
         reader = csv.reader(file, delimiter=';')
         headers = next(reader)
-        listings = [row for row in reader]
-
-    # Nouveaux en-têtes pour Auto24
-    new_headers = [
-        "ID", "Titre", "Prix (DH)", "Transmission", "Type de carburant", 
-        "Vendeur", "URL", "Date mise circulation", "Kilométrage", 
-        "Places", "Carrosserie", "Nombre de clés", "Couleur extérieure",
-        "Couleur intérieure", "Nombre propriétaires", "Condition", 
-        "Équipements", "Prix détaillé"
-    ]
+        listings = normalize_batch([ListingRecord.from_row(row) for row in reader])
 
-    detailed_data = [new_headers]
+    total = len(listings)
 
-    for idx, row in enumerate(listings, start=1):
-        try:
-            if len(row) < 8:
-                print(f"❌ Ligne {idx} invalide: {row}")
-                continue
-                
-            url = row[7]  # Correction: URL à l'index 7
-            print(f"🔎 Traitement annonce {idx}/{len(listings)} : {url}")
-            
-            details = scrape_car_details(driver, url)
-            
-            # Combiner données originales + détails
-            combined_data = row + details  # Conserver toutes les colonnes originales
-            detailed_data.append(combined_data)
-            
-            # Pause anti-bot
-            time.sleep(2)
-            
-        except Exception as e:
-            print(f"❌ Erreur avec l'annonce {idx} : {str(e)[:50]}...")
-            continue
+    def handle(ctx, item):
+        idx, listing = item
+        if not listing.url:
+            print(f"❌ Ligne {idx} invalide: {listing.to_row()}")
+            return None
+
+        print(f"🔎 [W{ctx.worker_id}] Traitement annonce {idx}/{total} : {listing.url}")
+
+        details = scrape_car_details(ctx.driver, listing.url)
+
+        # Annonce + détails, normalisés selon le schéma commun
+        return normalize_batch([CarRecord.from_listing(listing, details)])[0]
 
-    driver.quit()
+    def on_error(item, exc):
+        print(f"❌ Erreur avec l'annonce {item[0]} : {str(exc)[:50]}...")
+        return None
 
-    # Sauvegarder les résultats
-    os.makedirs(os.path.dirname(output_csv), exist_ok=True)
-    with open(output_csv, "w", newline="", encoding="utf-8") as file:
-        writer = csv.writer(file, delimiter=';')
-        writer.writerows(detailed_data)
+    # Chaque ligne est écrite dès qu'elle est disponible
+    with CsvRowWriter(output_csv, DETAILED_HEADERS) as writer:
+        for _, record in iter_pool(enumerate(listings, start=1), handle, init_auto24_driver,
+                                   workers=workers, on_error=on_error):
+            if record is not None:
+                writer.write(record)
 
     print(f"✅ Données enrichies sauvegardées dans {output_csv}")
 
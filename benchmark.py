@@ -0,0 +1,521 @@
+# benchmark.py
+"""Banc d'essai hors ligne : un faux Auto24 local et des mesures reproductibles du scraper.
+
+Exemple :
+    python benchmark.py --listings 300 --latency-ms 50 --image-kb 120 --output bench.json
+    python benchmark.py --compare bench.json
+    python benchmark.py --no-browser --queue-processes 1,2,4   # passage à l'échelle de la file partagée
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+BRANDS = ["Renault Clio", "Dacia Logan", "Peugeot 208", "Volkswagen Golf", "Hyundai Tucson", "Toyota Yaris"]
+FUELS = ["Diesel", "Essence", "Hybride"]
+GEARBOXES = ["Manuelle", "Automatique"]
+EQUIPMENTS = ["GPS", "Climatisation", "Caméra de recul", "Jantes alliage", "Toit ouvrant", "Bluetooth"]
+
+PAGE_SIZE = 20
+
+
+class FakeCatalogue:
+    """Annonces synthétiques déterministes"""
+
+    def __init__(self, listings=200, images_per_listing=5, image_kb=80, seed=24):
+        rng = random.Random(seed)
+        self.images_per_listing = images_per_listing
+        # Nombre de visites par page de détail (détection des pages scrapées deux fois)
+        self.hits = Counter()
+        self._hits_lock = threading.Lock()
+        self.image_bytes = rng.randbytes(image_kb * 1024)
+        self.cars = []
+        for index in range(listings):
+            self.cars.append({
+                "id": f"{100000 + index}",
+                "title": f"{rng.choice(BRANDS)} {rng.randint(2010, 2024)}",
+                "price": rng.randrange(40_000, 600_000, 500),
+                "mileage": rng.randrange(0, 300_000, 1000),
+                "fuel": rng.choice(FUELS),
+                "gearbox": rng.choice(GEARBOXES),
+                "year": rng.randint(2010, 2024),
+                "pro": rng.random() < 0.4,
+                "equipments": rng.sample(EQUIPMENTS, rng.randint(0, len(EQUIPMENTS))),
+            })
+
+    def record_hit(self, car_id):
+        with self._hits_lock:
+            self.hits[car_id] += 1
+
+    @staticmethod
+    def _amount(value):
+        return f"{value:,}".replace(",", " ")
+
+    def card_html(self, car):
+        logo = '<div class="card-brand-logo"></div>' if car["pro"] else ""
+        return f"""
+<div class="card-holder">
+  <a class="card-link" href="/car/{car['id']}">
+    <span class="card-model">{car['title']}</span>
+    <span class="card-price">{self._amount(car['price'])} DH</span>
+    <div class="card-features">
+      <span class="features-container">Transmission<br>{car['gearbox']}</span>
+      <span class="features-container">Carburant<br>{car['fuel']}</span>
+      <span class="features-container">Kilométrage<br>{self._amount(car['mileage'])} KM</span>
+    </div>
+    {logo}
+  </a>
+</div>"""
+
+    def listing_page(self, page=None):
+        # Sans ?page= : premier lot + scroll infini via /api/cards ; avec : pagination classique
+        start = (page - 1) * PAGE_SIZE if page else 0
+        cards = "".join(self.card_html(car) for car in self.cars[start:start + PAGE_SIZE])
+        script = "" if page else f"""
+<script>
+let offset = {PAGE_SIZE}, loading = false;
+const loader = document.querySelector('.lds-roller');
+window.addEventListener('scroll', async () => {{
+  if (loading || window.innerHeight + window.scrollY < document.body.scrollHeight - 50) return;
+  loading = true; loader.style.display = 'block';
+  const html = await (await fetch('/api/cards?offset=' + offset)).text();
+  document.getElementById('cards').insertAdjacentHTML('beforeend', html);
+  offset += {PAGE_SIZE}; loader.style.display = 'none';
+  loading = html.trim() === '';
+}});
+</script>"""
+        return f"""<!doctype html><html><head><meta charset="utf-8"><title>Auto24 bench</title>
+<style>.card-holder {{ height: 300px; }}</style></head><body>
+<div id="cards">{cards}</div>
+<div class="card-holder lds-roller" style="display:none"></div>
+{script}</body></html>"""
+
+    def cards_fragment(self, offset):
+        return "".join(self.card_html(car) for car in self.cars[offset:offset + PAGE_SIZE])
+
+    def detail_page(self, car):
+        specs = [
+            ("Année", str(car["year"])),
+            ("Kilométrage", f"{self._amount(car['mileage'])} KM"),
+            ("Carburant", car["fuel"]),
+            ("Boîte de vitesses", car["gearbox"]),
+            ("Places", "5"),
+            ("Carrosserie", "Berline"),
+        ]
+        spec_html = "".join(
+            f'<div class="spec-item"><span class="spec-label">{label}</span>'
+            f'<span class="spec-value">{value}</span></div>' for label, value in specs)
+        features = "".join(f'<div class="feature-item">{item}</div>' for item in car["equipments"])
+        images = "".join(
+            f'<div class="carousel-image"><img src="/img/{car["id"]}/{n}.jpg"></div>'
+            for n in range(1, self.images_per_listing + 1))
+        return f"""<!doctype html><html><head><meta charset="utf-8"><title>{car['title']}</title></head><body>
+<div class="ant-col content-container">
+  <h1>{car['title']}</h1>
+  <span class="card-price">{self._amount(car['price'])} DH</span>
+  <div class="carousel">{images}</div>
+  <div class="specs-container">{spec_html}</div>
+  <div class="features-container">{features}</div>
+</div></body></html>"""
+
+
+def make_handler(catalogue, latency):
+    cars = {car["id"]: car for car in catalogue.cars}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, body, content_type, status=200, headers=None):
+            if isinstance(body, str):
+                body = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if latency:
+                time.sleep(latency)
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            parts = url.path.strip("/").split("/")
+
+            if url.path == "/buy-cars":
+                page = int(query["page"][0]) if "page" in query else None
+                self._send(catalogue.listing_page(page), "text/html; charset=utf-8")
+            elif url.path == "/api/cards":
+                self._send(catalogue.cards_fragment(int(query.get("offset", ["0"])[0])), "text/html; charset=utf-8")
+            elif parts[0] == "car" and len(parts) == 2 and parts[1] in cars:
+                catalogue.record_hit(parts[1])
+                self._send(catalogue.detail_page(cars[parts[1]]), "text/html; charset=utf-8")
+            elif parts[0] == "img":
+                etag = '"bench-image"'
+                if self.headers.get("If-None-Match") == etag:
+                    self._send(b"", "image/jpeg", status=304, headers={"ETag": etag})
+                else:
+                    self._send(catalogue.image_bytes, "image/jpeg", headers={"ETag": etag})
+            else:
+                self._send("introuvable", "text/plain", status=404)
+
+    return Handler
+
+
+class FakeAuto24Server:
+    """Serveur HTTP local lancé dans un thread"""
+
+    def __init__(self, catalogue, latency_ms=0, port=0):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), make_handler(catalogue, latency_ms / 1000))
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def count_webdriver_calls(driver):
+    """Compte les commandes WebDriver envoyées par ce driver"""
+    counts = Counter()
+    original_execute = driver.execute
+
+    def execute(driver_command, params=None):
+        counts[driver_command] += 1
+        return original_execute(driver_command, params)
+
+    driver.execute = execute
+    return counts
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def peak_rss_mb():
+    """RSS maximal du processus et de ses enfants (Chrome, chromedriver)"""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {"self": own / scale, "children": children / scale}
+
+
+def _timed_pages(fn, urls):
+    latencies = []
+    started = time.perf_counter()
+    for url in urls:
+        t0 = time.perf_counter()
+        fn(url)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    return {
+        "pages": len(urls),
+        "elapsed_s": elapsed,
+        "pages_per_s": len(urls) / elapsed if elapsed else None,
+        "p50_s": percentile(latencies, 0.50),
+        "p95_s": percentile(latencies, 0.95),
+    }
+
+
+def _queue_worker_process(queue_path, threads):
+    """Processus worker de la file partagée (scénario queue_scaling)"""
+    import rate_limit
+    from fast_details import create_http_session, fetch_car_details
+    from work_queue import SqliteWorkQueue, run_worker
+
+    # Le faux serveur local n'a pas besoin d'être ménagé : le limiteur ne doit pas brider la mesure
+    rate_limit.default_limiter = _unthrottled_limiter()
+    queue = SqliteWorkQueue(queue_path, lease_seconds=30)
+    session = create_http_session()
+    run_worker(queue, lambda index, task: fetch_car_details(session, task.url).details, threads=threads)
+    queue.close()
+
+
+def queue_scaling(server, catalogue, pages, process_counts=(1, 2, 4), threads=1):
+    """Débit de la file SQLite partagée selon le nombre de processus workers.
+
+    `double_scraped` compte les pages visitées plus d'une fois (doit rester à 0).
+    """
+    from work_queue import SqliteWorkQueue
+
+    results = {}
+    cars = catalogue.cars[:pages]
+    for count in process_counts:
+        path = os.path.abspath(f"work_queue_{count}.sqlite")
+        queue = SqliteWorkQueue(path)
+        queue.enqueue((car["id"], f"{server.base_url}/car/{car['id']}", None) for car in cars)
+        catalogue.hits.clear()
+
+        started = time.perf_counter()
+        processes = [multiprocessing.Process(target=_queue_worker_process, args=(path, threads))
+                     for _ in range(count)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        done = len(queue.results())
+        results[str(count)] = {
+            "pages": done,
+            "elapsed_s": elapsed,
+            "pages_per_s": done / elapsed if elapsed else None,
+            "double_scraped": sum(1 for hits in catalogue.hits.values() if hits > 1),
+        }
+        queue.close()
+        print(f"🧵 {count} processus : {done} pages en {elapsed:.2f}s "
+              f"({results[str(count)]['pages_per_s']:.1f} pages/s), "
+              f"{results[str(count)]['double_scraped']} doublons")
+    return results
+
+
+def _unthrottled_limiter():
+    """Limiteur qui ne freine pas : on mesure le scraper face au faux serveur, pas la montée en débit"""
+    import rate_limit
+
+    return rate_limit.RateLimiter(initial_rate=1000, max_rate=1000, burst=100)
+
+
+def _backpressure_scenario(scraper, server, listings, time_budget=10):
+    """Scan en flux dont le consommateur (étape 2 simulée) met deux fois le budget du scroll :
+    l'attente du consommateur ne doit pas être décomptée, le scan doit atteindre la fin du catalogue"""
+    delay = 2 * time_budget / listings
+    scan = scraper.iter_auto24(time_budget=time_budget, listing_url=f"{server.base_url}/buy-cars")
+    read = 0
+    started = time.perf_counter()
+    while True:
+        try:
+            next(scan)
+        except StopIteration as stop:
+            complete = bool(stop.value)
+            break
+        read += 1
+        time.sleep(delay)
+    elapsed = time.perf_counter() - started
+    return {"listings": read, "elapsed_s": elapsed, "time_budget_s": time_budget, "reached_end": complete}
+
+
+def check_invariants(results):
+    """Propriétés qui doivent tenir quel que soit le matériel ; renvoie la liste des échecs"""
+    failures = []
+    backpressure = results["scenarios"].get("scan_backpressure")
+    if backpressure is not None and not backpressure["reached_end"]:
+        failures.append("scan_backpressure.reached_end")
+    return failures
+
+
+def run_benchmark(listings=200, detail_pages=30, latency_ms=20, image_kb=80, images_per_listing=5,
+                  browser=True, queue_processes=()):
+    """Lance les scénarios et renvoie un dictionnaire de résultats sérialisable"""
+    import rate_limit
+    import main as scraper
+    from fast_details import create_http_session, fetch_car_details
+
+    catalogue = FakeCatalogue(listings, images_per_listing, image_kb)
+    results = {
+        "config": {"listings": listings, "detail_pages": detail_pages, "latency_ms": latency_ms,
+                   "image_kb": image_kb, "images_per_listing": images_per_listing},
+        "scenarios": {},
+    }
+
+    workdir = tempfile.mkdtemp(prefix="auto24_bench_")
+    previous_dir = os.getcwd()
+    os.chdir(workdir)  # les sorties data/ du scraper restent dans le dossier temporaire
+    previous_limiter = rate_limit.default_limiter
+    rate_limit.default_limiter = _unthrottled_limiter()
+    try:
+        with FakeAuto24Server(catalogue, latency_ms) as server:
+            urls = [f"{server.base_url}/car/{car['id']}" for car in catalogue.cars[:detail_pages]]
+
+            session = create_http_session()
+            results["scenarios"]["details_http"] = _timed_pages(lambda url: fetch_car_details(session, url), urls)
+
+            if queue_processes:
+                results["scenarios"]["queue_scaling"] = queue_scaling(server, catalogue, detail_pages, queue_processes)
+
+            if browser:
+                results["scenarios"].update(_browser_scenarios(scraper, server, urls, listings))
+    finally:
+        rate_limit.default_limiter = previous_limiter
+        os.chdir(previous_dir)
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def _browser_scenarios(scraper, server, urls, listings):
+    from selenium.webdriver.common.by import By
+    from driver_factory import browser_rss_mb
+
+    scenarios = {}
+
+    # Étape 1 : scroll infini + extraction des cartes
+    started = time.perf_counter()
+    rows = scraper.scrape_auto24(target_count=listings, time_budget=120,
+                                 listing_url=f"{server.base_url}/buy-cars")
+    elapsed = time.perf_counter() - started
+    scenarios["listing_scan"] = {
+        "listings": len(rows),
+        "elapsed_s": elapsed,
+        "listings_per_s": len(rows) / elapsed if elapsed else None,
+    }
+
+    # Étapes 1 et 2 en flux : les pages de détail démarrent pendant le scroll
+    started = time.perf_counter()
+    streamed = scraper.process_listings(
+        scraper.iter_auto24(target_count=listings, time_budget=120, listing_url=f"{server.base_url}/buy-cars"),
+        os.path.join("data", "bench_pipeline.csv"))
+    elapsed = time.perf_counter() - started
+    scenarios["pipeline"] = {
+        "listings": streamed,
+        "elapsed_s": elapsed,
+        "listings_per_s": streamed / elapsed if elapsed else None,
+    }
+    scenarios["scan_backpressure"] = _backpressure_scenario(scraper, server, listings)
+
+    driver = scraper.init_auto24_driver()
+    try:
+        # Pages de détail via Selenium (images téléchargées en synchrone)
+        calls = count_webdriver_calls(driver)
+        scenarios["details_selenium"] = _timed_pages(lambda url: scraper.scrape_car_details(driver, url), urls)
+        scenarios["details_selenium"]["webdriver_calls"] = sum(calls.values())
+        scenarios["details_selenium"]["webdriver_calls_per_page"] = sum(calls.values()) / len(urls)
+        scenarios["details_selenium"]["webdriver_commands"] = dict(calls.most_common(10))
+        rss = browser_rss_mb(driver)
+        scenarios["details_selenium"]["rss_mb"] = rss
+        scenarios["details_selenium"]["pages_per_gb"] = 1024 / rss if rss else None
+
+        # Ancien chemin image par image
+        driver.get(urls[0])
+        images = driver.find_elements(By.CSS_SELECTOR, "div.carousel-image img")
+        os.makedirs("bench_images", exist_ok=True)
+        latencies = []
+        for idx, img in enumerate(images, 1):
+            t0 = time.perf_counter()
+            scraper.download_image(driver, img, "bench_images", f"image_{idx}")
+            latencies.append(time.perf_counter() - t0)
+        scenarios["download_image"] = {
+            "images": len(latencies),
+            "p50_s": percentile(latencies, 0.50),
+            "p95_s": percentile(latencies, 0.95),
+        }
+    finally:
+        driver.quit()
+
+    # Mêmes pages dans plusieurs onglets d'un seul Chrome (moteur DevTools)
+    scenarios["details_cdp"] = _cdp_scenario(scraper, urls)
+    return scenarios
+
+
+def _cdp_scenario(scraper, urls, tabs=4):
+    """Débit et pages simultanées par Go de RAM du moteur multi-onglets"""
+    import functools
+    from cdp_engine import CdpEngine, BACKGROUND_TAB_ARGS
+    from detail_pool import run_pool
+    from driver_factory import browser_rss_mb
+
+    engine = CdpEngine(functools.partial(scraper.init_auto24_driver, extra_args=BACKGROUND_TAB_ARGS), tabs=tabs)
+    engine.start()
+    try:
+        started = time.perf_counter()
+        run_pool(urls, lambda ctx, url: scraper.scrape_car_details_cdp(engine, url), None, workers=tabs)
+        elapsed = time.perf_counter() - started
+        rss = browser_rss_mb(engine.driver)
+    finally:
+        engine.close()
+    return {
+        "pages": len(urls),
+        "tabs": tabs,
+        "elapsed_s": elapsed,
+        "pages_per_s": len(urls) / elapsed if elapsed else None,
+        "rss_mb": rss,
+        "pages_per_gb": tabs * 1024 / rss if rss else None,
+    }
+
+
+# Métriques comparées : (scénario, clé, True si plus grand = mieux)
+COMPARED_METRICS = [
+    ("details_http", "pages_per_s", True),
+    ("details_http", "p95_s", False),
+    ("details_selenium", "pages_per_s", True),
+    ("details_selenium", "p95_s", False),
+    ("details_selenium", "webdriver_calls_per_page", False),
+    ("details_cdp", "pages_per_s", True),
+    ("details_cdp", "pages_per_gb", True),
+    ("listing_scan", "listings_per_s", True),
+    ("pipeline", "listings_per_s", True),
+    ("download_image", "p95_s", False),
+]
+
+
+def compare(previous, current, tolerance=0.10):
+    """Affiche l'évolution des métriques ; renvoie la liste des régressions au-delà de `tolerance`"""
+    regressions = []
+    for scenario, key, higher_is_better in COMPARED_METRICS:
+        before = previous["scenarios"].get(scenario, {}).get(key)
+        after = current["scenarios"].get(scenario, {}).get(key)
+        if not before or after is None:
+            continue
+        change = (after - before) / before
+        worse = -change if higher_is_better else change
+        flag = "❌" if worse > tolerance else "✅"
+        print(f"{flag} {scenario}.{key} : {before:.4g} -> {after:.4g} ({change:+.1%})")
+        if worse > tolerance:
+            regressions.append(f"{scenario}.{key}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Banc d'essai hors ligne du scraper Auto24")
+    parser.add_argument("--listings", type=int, default=200)
+    parser.add_argument("--detail-pages", type=int, default=30)
+    parser.add_argument("--latency-ms", type=int, default=20)
+    parser.add_argument("--image-kb", type=int, default=80)
+    parser.add_argument("--images-per-listing", type=int, default=5)
+    parser.add_argument("--no-browser", action="store_true", help="uniquement les scénarios sans Chrome")
+    parser.add_argument("--output", default=f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    parser.add_argument("--compare", help="résultats JSON d'un run précédent")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    parser.add_argument("--queue-processes", default="1,2,4",
+                        help="nombres de processus workers de la file partagée à comparer (vide : scénario omis)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = run_benchmark(args.listings, args.detail_pages, args.latency_ms, args.image_kb,
+                            args.images_per_listing, browser=not args.no_browser,
+                            queue_processes=[int(n) for n in args.queue_processes.split(",") if n])
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"✅ Résultats écrits dans {args.output}")
+
+    failures = check_invariants(results)
+    if failures:
+        print(f"❌ Invariants non respectés : {', '.join(failures)}")
+        sys.exit(1)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(json.load(f), results, args.tolerance)
+        if regressions:
+            print(f"❌ Régressions : {', '.join(regressions)}")
+            sys.exit(1)
@@ -0,0 +1,136 @@
+# browser_profile.py
+"""Profil navigateur "léger" : chargement eager et blocage CDP des ressources inutiles au scraping."""
+import json
+import threading
+
+# Ressources bloquées par type (motifs d'URL compris par Network.setBlockedURLs)
+RESOURCE_PATTERNS = {
+    "image": ["*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico"],
+    "font": ["*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot"],
+    "media": ["*.mp4", "*.webm", "*.m3u8", "*.mp3"],
+    "stylesheet": ["*.css"],
+}
+
+# Analytics, publicité et traceurs tiers
+THIRD_PARTY_PATTERNS = [
+    "*google-analytics.com*",
+    "*googletagmanager.com*",
+    "*googlesyndication.com*",
+    "*doubleclick.net*",
+    "*adservice.google.*",
+    "*connect.facebook.net*",
+    "*facebook.com/tr*",
+    "*hotjar.com*",
+    "*clarity.ms*",
+    "*analytics.tiktok.com*",
+    "*snap.licdn.com*",
+]
+
+
+class LeanProfile:
+    """Configuration du profil léger.
+
+    - `block_types` : types de ressources bloqués (clés de RESOURCE_PATTERNS)
+    - `block_hosts` : motifs d'hôtes tiers bloqués
+    - `allow` : types ou fragments d'URL à ne jamais bloquer (ex. "stylesheet" pour
+      garder la mise en page du carrousel, ou un hôte de CDN)
+    - `track` : compte requêtes et octets par page via les logs réseau de Chrome
+    """
+
+    def __init__(self, block_types=("image", "font", "media"), block_hosts=THIRD_PARTY_PATTERNS,
+                 allow=(), track=True):
+        self.block_types = tuple(block_types)
+        self.block_hosts = list(block_hosts)
+        self.allow = tuple(allow)
+        self.track = track
+
+    def blocked_urls(self):
+        patterns = []
+        for resource_type in self.block_types:
+            if resource_type not in self.allow:
+                patterns.extend(RESOURCE_PATTERNS.get(resource_type, []))
+        patterns.extend(
+            pattern for pattern in self.block_hosts
+            if not any(allowed in pattern for allowed in self.allow)
+        )
+        return patterns
+
+
+def apply_lean_options(options, profile):
+    """Options Chrome du profil léger (à appeler avant la création du driver)"""
+    options.page_load_strategy = "eager"
+    if "image" in profile.block_types and "image" not in profile.allow:
+        # Les balises <img> gardent leur src : seul le téléchargement est évité
+        options.add_argument("--blink-settings=imagesEnabled=false")
+    if profile.track:
+        options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+
+
+def discard_network_log(driver):
+    """Vide le log de performance d'un driver suivi : il ne grossit pas pendant le scan et
+    le trafic déjà passé n'est pas attribué à la prochaine page de détail"""
+    tracker = getattr(driver, "page_weight", None)
+    if tracker is not None:
+        tracker.discard()
+
+
+def activate_lean_profile(driver, profile):
+    """Active le blocage CDP sur un driver créé avec `apply_lean_options`"""
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": profile.blocked_urls()})
+    if profile.track:
+        driver.page_weight = PageWeightTracker(driver)
+    return driver
+
+
+class PageWeightTracker:
+    """Requêtes, octets transférés et requêtes bloquées par page, lus dans les logs réseau"""
+
+    _totals_lock = threading.Lock()
+    totals = {"pages": 0, "requests": 0, "bytes": 0, "blocked": 0}
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def record(self, url=None):
+        """Lit les événements réseau depuis le dernier appel et les attribue à la page courante"""
+        requests_count = blocked = transferred = 0
+        for entry in self.driver.get_log("performance"):
+            message = json.loads(entry["message"])["message"]
+            method = message.get("method")
+            params = message.get("params", {})
+            if method == "Network.requestWillBeSent":
+                requests_count += 1
+            elif method == "Network.loadingFinished":
+                transferred += int(params.get("encodedDataLength", 0))
+            elif method == "Network.loadingFailed" and params.get("blockedReason"):
+                blocked += 1
+
+        with PageWeightTracker._totals_lock:
+            totals = PageWeightTracker.totals
+            totals["pages"] += 1
+            totals["requests"] += requests_count
+            totals["bytes"] += transferred
+            totals["blocked"] += blocked
+        return {"url": url, "requests": requests_count, "bytes": transferred, "blocked": blocked}
+
+    def discard(self):
+        """Vide les logs réseau sans les compter (scan des annonces, pages de résultats)"""
+        self.driver.get_log("performance")
+
+    @classmethod
+    def reset(cls):
+        """Remet les totaux à zéro au début d'un run (plusieurs runs dans un même processus)"""
+        with cls._totals_lock:
+            cls.totals = dict.fromkeys(cls.totals, 0)
+
+    @classmethod
+    def summary(cls):
+        with cls._totals_lock:
+            totals = dict(cls.totals)
+        if totals["pages"]:
+            print(f"🪶 Profil léger : {totals['pages']} pages, "
+                  f"{totals['requests'] / totals['pages']:.0f} requêtes/page, "
+                  f"{totals['bytes'] / totals['pages'] / 1e3:.0f} Ko/page, "
+                  f"{totals['blocked']} requêtes bloquées")
+        return totals
@@ -0,0 +1,235 @@
+# catalog_index.py
+"""Index local des annonces détaillées (SQLite) : filtres indexés et recherche plein texte.
+
+Alimenté en flux par le pipeline (sortie `.sqlite` de writers.open_writer) : chaque
+ligne est insérée ou mise à jour par vehicle_id, sans reconstruction.
+
+    python catalog_index.py --fuel diesel --transmission automatique --max-price 150000 --text GPS
+    python catalog_index.py --import data/auto24_details.csv
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from listing_cards import vehicle_id_from_url
+
+DEFAULT_INDEX_PATH = os.path.join("data", "auto24_index.sqlite")
+URL_COLUMN = "URL de l'annonce"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    vehicle_id TEXT PRIMARY KEY,
+    listing_id INTEGER,
+    title TEXT,
+    price INTEGER,
+    mileage INTEGER,
+    year INTEGER,
+    fuel TEXT COLLATE NOCASE,
+    transmission TEXT COLLATE NOCASE,
+    seller TEXT,
+    url TEXT,
+    equipements TEXT,
+    record TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS listings_price ON listings (price);
+CREATE INDEX IF NOT EXISTS listings_mileage ON listings (mileage);
+CREATE INDEX IF NOT EXISTS listings_year ON listings (year);
+CREATE INDEX IF NOT EXISTS listings_fuel ON listings (fuel, price);
+CREATE INDEX IF NOT EXISTS listings_transmission ON listings (transmission, price);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS listings_fts USING fts5(
+    title, equipements, content='listings', content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS listings_ai AFTER INSERT ON listings BEGIN
+    INSERT INTO listings_fts (rowid, title, equipements) VALUES (new.rowid, new.title, new.equipements);
+END;
+CREATE TRIGGER IF NOT EXISTS listings_ad AFTER DELETE ON listings BEGIN
+    INSERT INTO listings_fts (listings_fts, rowid, title, equipements)
+    VALUES ('delete', old.rowid, old.title, old.equipements);
+END;
+CREATE TRIGGER IF NOT EXISTS listings_au AFTER UPDATE ON listings BEGIN
+    INSERT INTO listings_fts (listings_fts, rowid, title, equipements)
+    VALUES ('delete', old.rowid, old.title, old.equipements);
+    INSERT INTO listings_fts (rowid, title, equipements) VALUES (new.rowid, new.title, new.equipements);
+END;
+"""
+
+# Colonnes triables (annonces sans valeur toujours en dernier)
+SORT_COLUMNS = ("price", "mileage", "year", "listing_id", "updated_at")
+
+
+def _first(record, *columns):
+    for column in columns:
+        value = record.get(column)
+        if value not in (None, "", []):
+            return value
+    return None
+
+
+def fts_query(text):
+    """Texte libre -> requête FTS5 : tous les mots, chacun en préfixe ("gps cam" -> "gps"* "cam"*)"""
+    words = re.findall(r"\w+", text)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+class ListingIndex:
+    """Annonces indexées par prix, kilométrage, année, carburant et boîte, plus FTS5 sur titre et équipements.
+
+    `upsert_many` prend des dictionnaires typés indexés par en-tête (writers.typed_record).
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def upsert_many(self, records):
+        """Insère ou met à jour les annonces par vehicle_id ; renvoie le nombre de lignes indexées"""
+        now = time.time()
+        rows = []
+        for record in records:
+            vehicle_id = vehicle_id_from_url(record.get(URL_COLUMN))
+            if vehicle_id is None:
+                continue
+            equipements = record.get("Équipements") or []
+            rows.append((
+                vehicle_id,
+                record.get("ID"),
+                record.get("Titre"),
+                _first(record, "Prix", "Prix Détaillé"),
+                _first(record, "Kilométrage (détail)", "Kilométrage"),
+                record.get("Année"),
+                _first(record, "Carburant (détail)", "Type de carburant"),
+                _first(record, "Transmission (détail)", "Transmission"),
+                record.get("Créateur"),
+                record.get(URL_COLUMN),
+                " ; ".join(equipements) if isinstance(equipements, list) else equipements,
+                json.dumps(record, ensure_ascii=False),
+                now,
+            ))
+        with self._lock:
+            with self._db:
+                self._db.executemany("""
+                    INSERT INTO listings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (vehicle_id) DO UPDATE SET
+                        listing_id = excluded.listing_id, title = excluded.title, price = excluded.price,
+                        mileage = excluded.mileage, year = excluded.year, fuel = excluded.fuel,
+                        transmission = excluded.transmission, seller = excluded.seller, url = excluded.url,
+                        equipements = excluded.equipements, record = excluded.record,
+                        updated_at = excluded.updated_at
+                """, rows)
+        return len(rows)
+
+    def search(self, text=None, fuel=None, transmission=None, min_price=None, max_price=None,
+               max_mileage=None, min_year=None, max_year=None, sort="price", descending=False,
+               limit=50, offset=0):
+        """Annonces (dictionnaires typés) correspondant à tous les filtres fournis"""
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"Tri non supporté : {sort} (choix : {', '.join(SORT_COLUMNS)})")
+        where, params = [], []
+        if text:
+            where.append("rowid IN (SELECT rowid FROM listings_fts WHERE listings_fts MATCH ?)")
+            params.append(fts_query(text))
+        for clause, value in (("fuel = ?", fuel), ("transmission = ?", transmission),
+                              ("price >= ?", min_price), ("price <= ?", max_price),
+                              ("mileage <= ?", max_mileage), ("year >= ?", min_year), ("year <= ?", max_year)):
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+
+        # Tri par l'index de la colonne : les annonces sans valeur viennent ensuite, si la page n'est pas pleine
+        order = f"ORDER BY {sort} {'DESC' if descending else 'ASC'} LIMIT ? OFFSET ?"
+        known = self._select(where + [f"{sort} IS NOT NULL"], params, order, [limit, offset])
+        if len(known) == limit:
+            return known
+        skipped = max(0, offset - self._count(where + [f"{sort} IS NOT NULL"], params)) if offset else 0
+        unknown = self._select(where + [f"{sort} IS NULL"], params, "ORDER BY rowid LIMIT ? OFFSET ?",
+                               [limit - len(known), skipped])
+        return known + unknown
+
+    def _select(self, where, params, order, paging):
+        sql = "SELECT record FROM listings WHERE " + " AND ".join(where) + " " + order
+        with self._lock:
+            rows = self._db.execute(sql, params + paging).fetchall()
+        return [json.loads(record) for (record,) in rows]
+
+    def _count(self, where, params):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM listings WHERE " + " AND ".join(where), params).fetchone()[0]
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM listings").fetchone()[0]
+
+
+def import_csv(index, csv_path, batch_size=1000):
+    """Ajoute (ou met à jour) les lignes d'un fichier de détails CSV existant"""
+    from writers import typed_record
+
+    total = 0
+    with open(csv_path, "r", encoding="utf-8") as file:
+        reader = csv.reader(file, delimiter=';')
+        columns = next(reader)
+        batch = []
+        for row in reader:
+            batch.append(typed_record(columns, row))
+            if len(batch) >= batch_size:
+                total += index.upsert_many(batch)
+                batch = []
+        total += index.upsert_many(batch)
+    return total
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Recherche dans l'index local des annonces Auto24")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH)
+    parser.add_argument("--import", dest="import_csv", help="indexe un fichier de détails CSV existant")
+    parser.add_argument("--text", help="mots recherchés dans le titre et les équipements")
+    parser.add_argument("--fuel")
+    parser.add_argument("--transmission")
+    parser.add_argument("--min-price", type=int)
+    parser.add_argument("--max-price", type=int)
+    parser.add_argument("--max-mileage", type=int)
+    parser.add_argument("--min-year", type=int)
+    parser.add_argument("--max-year", type=int)
+    parser.add_argument("--sort", default="price", choices=SORT_COLUMNS)
+    parser.add_argument("--desc", action="store_true")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="une annonce JSON par ligne")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    index = ListingIndex(args.index)
+    if args.import_csv:
+        print(f"✅ {import_csv(index, args.import_csv)} annonces indexées ({index.count()} au total)")
+    else:
+        started = time.perf_counter()
+        results = index.search(args.text, args.fuel, args.transmission, args.min_price, args.max_price,
+                               args.max_mileage, args.min_year, args.max_year, args.sort, args.desc, args.limit)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        for record in results:
+            if args.json:
+                print(json.dumps(record, ensure_ascii=False))
+            else:
+                mileage = record.get("Kilométrage (détail)") or record.get("Kilométrage") or "?"
+                print(f"{record.get('Prix') or '?':>9} DH | {mileage:>7} km | {record.get('Année') or '?'} | "
+                      f"{record.get('Titre')} | {record.get(URL_COLUMN)}")
+        print(f"🔎 {len(results)} résultats en {elapsed_ms:.1f} ms ({index.count()} annonces indexées)")
+    index.close()
@@ -0,0 +1,364 @@
+# cdp_engine.py
+"""Pages de détail dans K onglets d'un seul Chrome, pilotés en asyncio par le protocole DevTools.
+
+Un navigateur par worker coûte plusieurs centaines de Mo ; ici un seul processus Chrome
+(créé par `driver_factory`, profil léger compris) sert K onglets qui naviguent en même
+temps. Chaque onglet attend le conteneur principal puis lit le même instantané
+JavaScript que scrape_car_details (field_probe.DETAILS_SNAPSHOT_JS) : les lignes
+produites sont identiques. Un onglet bloqué au-delà de `tab_timeout` est fermé et
+remplacé ; chaque onglet est aussi recyclé après `pages_per_tab` pages.
+
+L'appel `snapshot(url)` est bloquant et sûr entre threads : un pool de K threads
+(detail_pool.iter_pool) occupe les K onglets. Si le navigateur ou la connexion
+DevTools tombe, le navigateur est recréé, la connexion rétablie et la page relue une
+fois. Nécessite le paquet websockets.
+"""
+import asyncio
+import json
+import threading
+import time
+import urllib.request
+
+from field_probe import DETAILS_SNAPSHOT_JS
+import rate_limit
+
+READY_SELECTOR = "div.ant-col.content-container"
+READY_POLL_S = 0.1
+SNAPSHOT_ATTEMPTS = 3
+
+# Les onglets en arrière-plan ne doivent pas être ralentis par Chrome
+BACKGROUND_TAB_ARGS = (
+    "--disable-background-timer-throttling",
+    "--disable-renderer-backgrounding",
+    "--disable-backgrounding-occluded-windows",
+)
+
+SNAPSHOT_EXPRESSION = "(() => {" + DETAILS_SNAPSHOT_JS + "})()"
+
+
+class CdpError(Exception):
+    """Erreur renvoyée par le navigateur (commande refusée, exception JavaScript, connexion fermée)"""
+
+
+class _Connection:
+    """Connexion DevTools au navigateur ; les commandes d'un onglet portent son sessionId (mode flatten)"""
+
+    def __init__(self, websocket):
+        self._ws = websocket
+        self._next_id = 0
+        self._pending = {}
+        self.closed = False
+        self._reader = asyncio.ensure_future(self._read())
+
+    async def send(self, method, params=None, session_id=None):
+        if self.closed:
+            raise CdpError("connexion DevTools fermée")
+        self._next_id += 1
+        message = {"id": self._next_id, "method": method, "params": params or {}}
+        if session_id is not None:
+            message["sessionId"] = session_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[self._next_id] = future
+        try:
+            await self._ws.send(json.dumps(message))
+        except Exception as e:
+            # ConnectionClosed de websockets, socket coupée...
+            self._pending.pop(self._next_id, None)
+            self.closed = True
+            raise CdpError(f"connexion DevTools fermée ({str(e)[:60]})")
+        return await future
+
+    async def _read(self):
+        try:
+            async for raw in self._ws:
+                message = json.loads(raw)
+                # Les événements (sans id) ne sont pas utilisés
+                future = self._pending.pop(message.get("id"), None)
+                if future is None or future.done():
+                    continue
+                if "error" in message:
+                    future.set_exception(CdpError(message["error"].get("message", "erreur DevTools")))
+                else:
+                    future.set_result(message.get("result", {}))
+        except Exception:
+            pass  # connexion perdue : les commandes en attente échouent ci-dessous
+        finally:
+            self.closed = True
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(CdpError("connexion DevTools fermée"))
+            self._pending.clear()
+
+    async def close(self):
+        self.closed = True
+        try:
+            await self._ws.close()
+        finally:
+            self._reader.cancel()
+
+
+class _Tab:
+    """Onglet attaché ; il appartient à la connexion qui l'a ouvert"""
+    __slots__ = ("connection", "target_id", "session_id", "pages")
+
+    def __init__(self, connection, target_id, session_id):
+        self.connection = connection
+        self.target_id = target_id
+        self.session_id = session_id
+        self.pages = 0
+
+
+def _browser_websocket_url(debugger_address):
+    with urllib.request.urlopen(f"http://{debugger_address}/json/version", timeout=10) as response:
+        return json.load(response)["webSocketDebuggerUrl"]
+
+
+class CdpEngine:
+    """K onglets d'un navigateur unique, partagés par les threads qui appellent `snapshot`.
+
+    `lean` (LeanProfile) réapplique le blocage des ressources dans chaque onglet.
+    """
+
+    def __init__(self, driver_factory, tabs=4, tab_timeout=30, pages_per_tab=50, ready_timeout=15,
+                 ready_selector=READY_SELECTOR, lean=None, limiter=None, rss_check_every=20):
+        self.driver_factory = driver_factory
+        self.tabs = tabs
+        self.tab_timeout = tab_timeout
+        self.pages_per_tab = pages_per_tab
+        self.ready_timeout = ready_timeout
+        self.ready_selector = ready_selector
+        self.lean = lean
+        self.limiter = limiter or rate_limit.default_limiter
+        self.rss_check_every = rss_check_every
+        self.driver = None
+        self._loop = None
+        self._thread = None
+        self._connection = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self._restart_lock = threading.Lock()
+        self._generation = 0
+        self.pages = 0
+        self.timeouts = 0
+        self.recycled = 0
+        self.restarts = 0
+        self.peak_rss_mb = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        try:
+            import websockets  # noqa: F401
+        except ImportError:
+            raise RuntimeError("websockets est requis pour le moteur multi-onglets (pip install websockets)")
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self._launch()
+        return self
+
+    def _launch(self):
+        """Démarre le navigateur et s'y connecte"""
+        self.driver = self.driver_factory()
+        address = self.driver.capabilities.get("goog:chromeOptions", {}).get("debuggerAddress")
+        if not address:
+            self.driver.quit()
+            raise RuntimeError("Adresse DevTools absente des capacités du driver")
+        self._call(self._connect(address))
+
+    def _restart(self, generation):
+        """Recrée navigateur et connexion, une seule fois pour tous les threads qui ont vu la panne"""
+        with self._restart_lock:
+            if generation != self._generation:
+                return  # déjà redémarré par un autre thread
+            print("🔌 Connexion DevTools perdue : redémarrage du navigateur")
+            self.restarts += 1
+            try:
+                self._call(self._connection.close())
+            except Exception:
+                pass
+            try:
+                self.driver.quit()
+            except Exception:
+                pass
+            try:
+                self._launch()
+            except Exception as e:
+                raise CdpError(f"redémarrage du navigateur impossible : {str(e)[:60]}")
+            self._generation += 1
+
+    def _call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    async def _connect(self, address):
+        import websockets
+
+        url = await asyncio.get_running_loop().run_in_executor(None, _browser_websocket_url, address)
+        self._connection = _Connection(await websockets.connect(url, max_size=None))
+        # Un jeton par onglet ; None = onglet à (re)créer au prochain usage
+        self._slots = asyncio.Queue()
+        for _ in range(self.tabs):
+            self._slots.put_nowait(None)
+
+    def snapshot(self, url):
+        """Instantané des champs de la page, ou None si elle ne se charge pas à temps.
+
+        Lève CdpError si l'instantané échoue encore après SNAPSHOT_ATTEMPTS essais.
+        """
+        self.limiter.acquire(url)
+        started = time.monotonic()
+        try:
+            result = self._snapshot_with_restart(url)
+        except Exception:
+            self.limiter.record(url, error=True)
+            raise
+        if result is None:
+            self.limiter.record(url, error=True)
+        else:
+            self.limiter.record(url, latency=time.monotonic() - started)
+
+        with self._lock:
+            self.pages += 1
+            check_rss = self.pages % self.rss_check_every == 1
+        if check_rss:
+            self._sample_rss()
+        return result
+
+    def _snapshot_with_restart(self, url):
+        for attempt in range(2):
+            generation = self._generation
+            try:
+                return self._call(self._snapshot(url))
+            except CdpError:
+                # Erreur propre à la page : connexion intacte et pas de redémarrage entre-temps
+                if attempt == 1 or (generation == self._generation and not self._connection.closed):
+                    raise
+            self._restart(generation)
+
+    def _sample_rss(self):
+        from driver_factory import browser_rss_mb
+
+        rss = browser_rss_mb(self.driver)
+        if rss is not None:
+            with self._lock:
+                self.peak_rss_mb = max(self.peak_rss_mb or 0, rss)
+
+    async def _snapshot(self, url):
+        # Jetons de la connexion courante : un redémarrage en remplace la file entière
+        slots = self._slots
+        tab = await slots.get()
+        try:
+            if tab is None:
+                tab = await self._open_tab(self._connection)
+            try:
+                result = await asyncio.wait_for(self._load(tab, url), self.tab_timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                print(f"⏱️ Onglet bloqué plus de {self.tab_timeout}s sur {url} : recyclé")
+                tab = await self._recycle(tab)
+                return None
+            except Exception:
+                tab = await self._recycle(tab)
+                raise
+            tab.pages += 1
+            if tab.pages >= self.pages_per_tab:
+                tab = await self._recycle(tab)
+            return result
+        finally:
+            slots.put_nowait(tab)
+
+    async def _open_tab(self, connection):
+        target = await connection.send("Target.createTarget", {"url": "about:blank"})
+        attached = await connection.send("Target.attachToTarget", {"targetId": target["targetId"], "flatten": True})
+        tab = _Tab(connection, target["targetId"], attached["sessionId"])
+        if self.lean is not None:
+            await connection.send("Network.enable", {}, tab.session_id)
+            await connection.send("Network.setBlockedURLs", {"urls": self.lean.blocked_urls()}, tab.session_id)
+        return tab
+
+    async def _recycle(self, tab):
+        """Ferme l'onglet ; un nouveau sera ouvert au prochain usage du jeton"""
+        if tab is not None:
+            self.recycled += 1
+            await self._close_tab(tab)
+        return None
+
+    async def _close_tab(self, tab):
+        try:
+            await asyncio.wait_for(tab.connection.send("Target.closeTarget", {"targetId": tab.target_id}), 5)
+        except Exception:
+            pass
+
+    async def _evaluate(self, tab, expression):
+        result = await tab.connection.send(
+            "Runtime.evaluate", {"expression": expression, "returnByValue": True}, tab.session_id)
+        if "exceptionDetails" in result:
+            raise CdpError(result["exceptionDetails"].get("text", "exception JavaScript"))
+        return result["result"].get("value")
+
+    async def _load(self, tab, url):
+        loop = asyncio.get_running_loop()
+        # Marque l'ancien document : il ne doit pas être pris pour la nouvelle page
+        await self._evaluate(tab, "window.__a24Stale = true")
+        navigation = await tab.connection.send("Page.navigate", {"url": url}, tab.session_id)
+        if navigation.get("errorText"):
+            return None
+
+        ready = f"!window.__a24Stale && document.querySelector({json.dumps(self.ready_selector)}) !== null"
+        deadline = loop.time() + self.ready_timeout
+        while True:
+            try:
+                if await self._evaluate(tab, ready):
+                    break
+            except CdpError:
+                if tab.connection.closed:
+                    raise
+                # contexte détruit pendant la navigation
+            if loop.time() >= deadline:
+                return None
+            await asyncio.sleep(READY_POLL_S)
+
+        for attempt in range(SNAPSHOT_ATTEMPTS):
+            try:
+                return await self._evaluate(tab, SNAPSHOT_EXPRESSION)
+            except CdpError:
+                if attempt == SNAPSHOT_ATTEMPTS - 1 or tab.connection.closed:
+                    raise
+                await asyncio.sleep(0.2 * (attempt + 1))
+
+    async def _shutdown(self):
+        while not self._slots.empty():
+            tab = self._slots.get_nowait()
+            if tab is not None:
+                await self._close_tab(tab)
+        await self._connection.close()
+
+    def close(self):
+        """Ferme les onglets, la connexion et le navigateur, puis affiche le bilan"""
+        if self._loop is None:
+            return
+        self._sample_rss()
+        try:
+            self._call(self._shutdown())
+        except Exception:
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop.close()
+        self._loop = None
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+
+        memory = ""
+        if self.peak_rss_mb:
+            memory = (f", RSS max {self.peak_rss_mb:.0f} Mo "
+                      f"({self.tabs * 1024 / self.peak_rss_mb:.1f} pages simultanées par Go)")
+        print(f"🗂️ Moteur multi-onglets : {self.pages} pages sur {self.tabs} onglets, "
+              f"{self.timeouts} délais dépassés, {self.recycled} onglets recyclés, "
+              f"{self.restarts} redémarrages{memory}")
@@ -0,0 +1,309 @@
+# crawl_state.py
+"""État durable du crawl (SQLite) : statut par véhicule et par étape, pour reprendre un run interrompu."""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_STATE_PATH = os.path.join("data", "crawl_state.sqlite")
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+REMOVED = "removed"
+
+# Résultat de la comparaison d'une carte avec l'instantané précédent (attributs de SnapshotDiff)
+NEW = "new"
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+
+
+class SnapshotDiff:
+    """Comparaison des cartes du run avec l'instantané précédent (listes d'identifiants)"""
+
+    def __init__(self, new, changed, unchanged, removed):
+        self.new = new
+        self.changed = changed
+        self.unchanged = unchanged
+        self.removed = removed
+
+    def summary(self):
+        return (f"🆕 {len(self.new)} nouvelles, ✏️ {len(self.changed)} modifiées, "
+                f"💤 {len(self.unchanged)} inchangées, 🗑️ {len(self.removed)} retirées")
+
+
+class CrawlState:
+    """Statut de chaque véhicule pour chaque étape ("listing", "details").
+
+    Un run démarre avec `start_run` (liste des annonces de l'étape 1) et se termine
+    avec `finish_run` ; tant qu'il n'est pas terminé, `main()` le reprend.
+    Chaque résultat est validé en base dès qu'il est produit. En flux, le run est
+    ouvert par `begin_run`, chaque annonce ajoutée par `add_listing` dès sa lecture
+    et `finish_listing` marque la fin de l'étape 1.
+
+    Entre deux runs, `apply_snapshot` (ou `observe_listing` puis `mark_removed` en
+    flux) compare l'empreinte de chaque carte avec celle du run précédent : seules les
+    annonces nouvelles ou modifiées repassent à l'étape "details", les annonces
+    disparues sont marquées retirées et chaque changement de prix est ajouté à l'historique.
+    """
+
+    def __init__(self, path=DEFAULT_STATE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS vehicles (
+                vehicle_id TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_scraped REAL,
+                run_id INTEGER,
+                position INTEGER,
+                payload TEXT,
+                error TEXT,
+                PRIMARY KEY (vehicle_id, stage)
+            );
+            CREATE INDEX IF NOT EXISTS vehicles_run ON vehicles (stage, run_id, position);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS snapshots (
+                vehicle_id TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                price INTEGER,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                removed_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS price_history (
+                vehicle_id TEXT NOT NULL,
+                observed_at REAL NOT NULL,
+                price INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS price_history_vehicle ON price_history (vehicle_id, observed_at);
+        """)
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            cursor = self._db.execute(sql, params)
+            self._db.commit()
+            return cursor
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def get_meta(self, key, default=None):
+        rows = self._query("SELECT value FROM meta WHERE key = ?", (key,))
+        return rows[0][0] if rows else default
+
+    def set_meta(self, key, value):
+        self._execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value)))
+
+    # --- Runs ---
+
+    @property
+    def run_id(self):
+        value = self.get_meta("run_id")
+        return int(value) if value is not None else None
+
+    def has_unfinished_run(self):
+        return self.run_id is not None and self.get_meta("run_finished_at") is None
+
+    def begin_run(self):
+        """Ouvre un nouveau run, dont les annonces sont ajoutées au fil de l'étape 1 ; renvoie son numéro"""
+        run_id = (self.run_id or 0) + 1
+        with self._lock:
+            with self._db:
+                self._db.execute("INSERT OR REPLACE INTO meta VALUES ('run_id', ?)", (str(run_id),))
+                self._db.execute("INSERT OR REPLACE INTO meta VALUES ('run_started_at', ?)", (str(time.time()),))
+                self._db.execute("DELETE FROM meta WHERE key IN ('run_finished_at', 'listing_finished_at')")
+        return run_id
+
+    def add_listing(self, run_id, position, vehicle_id, row, keep_done=False, max_age=None):
+        """Enregistre une annonce de l'étape 1 et remet ses détails à faire.
+
+        Avec `keep_done` (annonce inchangée), les détails déjà terminés sont conservés,
+        sauf s'ils datent de plus de `max_age` secondes.
+        """
+        with self._lock:
+            with self._db:
+                self._add_listing(run_id, position, vehicle_id, row, keep_done, max_age, time.time())
+
+    def _add_listing(self, run_id, position, vehicle_id, row, keep_done, max_age, now):
+        fresh_after = now - max_age if max_age is not None else 0
+        self._db.execute("""
+            INSERT INTO vehicles (vehicle_id, stage, status, attempts, last_scraped, run_id, position, payload)
+            VALUES (?, 'listing', ?, 1, ?, ?, ?, ?)
+            ON CONFLICT (vehicle_id, stage) DO UPDATE SET
+                status = excluded.status, attempts = attempts + 1, last_scraped = excluded.last_scraped,
+                run_id = excluded.run_id, position = excluded.position, payload = excluded.payload
+        """, (vehicle_id, DONE, now, run_id, position, json.dumps(row, ensure_ascii=False)))
+        self._db.execute("""
+            INSERT INTO vehicles (vehicle_id, stage, status, run_id, position)
+            VALUES (?, 'details', ?, ?, ?)
+            ON CONFLICT (vehicle_id, stage) DO UPDATE SET
+                status = CASE WHEN ? AND status = 'done' AND last_scraped >= ? THEN status ELSE excluded.status END,
+                attempts = CASE WHEN ? AND status = 'done' AND last_scraped >= ? THEN attempts ELSE 0 END,
+                run_id = excluded.run_id, position = excluded.position, error = NULL
+        """, (vehicle_id, PENDING, run_id, position, keep_done, fresh_after, keep_done, fresh_after))
+
+    def finish_listing(self):
+        """L'étape 1 du run est complète : une reprise peut repartir de `listing_rows`"""
+        self.set_meta("listing_finished_at", time.time())
+
+    def listing_finished(self):
+        return self.get_meta("listing_finished_at") is not None
+
+    def start_run(self, listing_rows, vehicle_ids, keep_done=(), max_age=None):
+        """Enregistre d'un bloc les annonces de l'étape 1 et remet leurs détails à faire.
+
+        Les véhicules de `keep_done` (annonces inchangées) gardent leurs détails déjà
+        terminés, sauf si ceux-ci datent de plus de `max_age` secondes.
+        """
+        run_id = self.begin_run()
+        now = time.time()
+        keep_done = set(keep_done)
+        with self._lock:
+            with self._db:
+                for position, (vehicle_id, row) in enumerate(zip(vehicle_ids, listing_rows)):
+                    if vehicle_id is None:
+                        continue
+                    self._add_listing(run_id, position, vehicle_id, row, vehicle_id in keep_done, max_age, now)
+        self.finish_listing()
+        return run_id
+
+    def finish_run(self):
+        self.set_meta("run_finished_at", time.time())
+
+    def listing_rows(self):
+        """Annonces du run courant, dans l'ordre de l'étape 1"""
+        rows = self._query(
+            "SELECT payload FROM vehicles WHERE stage = 'listing' AND run_id = ? ORDER BY position",
+            (self.run_id,))
+        return [json.loads(payload) for (payload,) in rows]
+
+    def known_listings(self, include_removed=False):
+        """[(vehicle_id, ligne d'annonce)] de tous les runs, du plus ancien au plus récent"""
+        rows = self._query(
+            "SELECT vehicle_id, payload, status FROM vehicles WHERE stage = 'listing' AND payload IS NOT NULL "
+            "ORDER BY run_id, position")
+        return [(vehicle_id, json.loads(payload)) for vehicle_id, payload, status in rows
+                if include_removed or status != REMOVED]
+
+    # --- Instantanés entre runs ---
+
+    def apply_snapshot(self, entries):
+        """Compare `entries` [(vehicle_id, empreinte, prix)] à l'instantané précédent et le remplace.
+
+        Une annonce retirée puis republiée compte comme modifiée.
+        """
+        now = time.time()
+        diff = SnapshotDiff([], [], [], [])
+        seen = set()
+        with self._lock:
+            with self._db:
+                for vehicle_id, fingerprint, price in entries:
+                    if vehicle_id is None or vehicle_id in seen:
+                        continue
+                    seen.add(vehicle_id)
+                    getattr(diff, self._observe(vehicle_id, fingerprint, price, now)).append(vehicle_id)
+                diff.removed = self._mark_removed(now)
+        return diff
+
+    def observe_listing(self, vehicle_id, fingerprint, price):
+        """Met à jour l'instantané d'une carte ; renvoie NEW, CHANGED ou UNCHANGED"""
+        with self._lock:
+            with self._db:
+                return self._observe(vehicle_id, fingerprint, price, time.time())
+
+    def mark_removed(self, before=None):
+        """Marque retirées les annonces non revues depuis `before` (début du run par défaut)"""
+        if before is None:
+            before = float(self.get_meta("run_started_at", time.time()))
+        with self._lock:
+            with self._db:
+                return self._mark_removed(before)
+
+    def _observe(self, vehicle_id, fingerprint, price, now):
+        known = self._db.execute(
+            "SELECT fingerprint, price, removed_at FROM snapshots WHERE vehicle_id = ?", (vehicle_id,)).fetchone()
+        if known is None:
+            change = NEW
+        elif known[0] != fingerprint or known[2] is not None:
+            change = CHANGED
+        else:
+            change = UNCHANGED
+        if known is None or known[1] != price:
+            self._db.execute("INSERT INTO price_history VALUES (?, ?, ?)", (vehicle_id, now, price))
+        self._db.execute("""
+            INSERT INTO snapshots VALUES (?, ?, ?, ?, ?, NULL)
+            ON CONFLICT (vehicle_id) DO UPDATE SET
+                fingerprint = excluded.fingerprint, price = excluded.price,
+                last_seen = excluded.last_seen, removed_at = NULL
+        """, (vehicle_id, fingerprint, price, now, now))
+        return change
+
+    def _mark_removed(self, before):
+        now = time.time()
+        removed = [vehicle_id for (vehicle_id,) in self._db.execute(
+            "SELECT vehicle_id FROM snapshots WHERE removed_at IS NULL AND last_seen < ?", (before,))]
+        for vehicle_id in removed:
+            self._db.execute("UPDATE snapshots SET removed_at = ? WHERE vehicle_id = ?", (now, vehicle_id))
+            self._db.execute("UPDATE vehicles SET status = ? WHERE vehicle_id = ? AND stage = 'listing'",
+                             (REMOVED, vehicle_id))
+        return removed
+
+    def price_history(self, vehicle_id):
+        """[(horodatage, prix)] du plus ancien au plus récent"""
+        return self._query(
+            "SELECT observed_at, price FROM price_history WHERE vehicle_id = ? ORDER BY observed_at",
+            (vehicle_id,))
+
+    def removed_vehicles(self):
+        return [vehicle_id for (vehicle_id,) in self._query(
+            "SELECT vehicle_id FROM snapshots WHERE removed_at IS NOT NULL ORDER BY removed_at")]
+
+    # --- Statut par véhicule ---
+
+    def status(self, vehicle_id, stage):
+        rows = self._query("SELECT status FROM vehicles WHERE vehicle_id = ? AND stage = ?", (vehicle_id, stage))
+        return rows[0][0] if rows else None
+
+    def is_done(self, vehicle_id, stage):
+        return self.status(vehicle_id, stage) == DONE
+
+    def payload(self, vehicle_id, stage):
+        rows = self._query("SELECT payload FROM vehicles WHERE vehicle_id = ? AND stage = ?", (vehicle_id, stage))
+        return json.loads(rows[0][0]) if rows and rows[0][0] is not None else None
+
+    def mark_started(self, vehicle_id, stage):
+        self._execute("""
+            INSERT INTO vehicles (vehicle_id, stage, status, attempts) VALUES (?, ?, ?, 1)
+            ON CONFLICT (vehicle_id, stage) DO UPDATE SET attempts = attempts + 1
+        """, (vehicle_id, stage, PENDING))
+
+    def mark_done(self, vehicle_id, stage, payload=None):
+        self._execute("""
+            UPDATE vehicles SET status = ?, last_scraped = ?, payload = ?, error = NULL
+            WHERE vehicle_id = ? AND stage = ?
+        """, (DONE, time.time(), json.dumps(payload, ensure_ascii=False), vehicle_id, stage))
+
+    def mark_failed(self, vehicle_id, stage, error):
+        self._execute("UPDATE vehicles SET status = ?, error = ? WHERE vehicle_id = ? AND stage = ?",
+                      (FAILED, str(error)[:200], vehicle_id, stage))
+
+    def count(self, stage, status):
+        rows = self._query("SELECT COUNT(*) FROM vehicles WHERE stage = ? AND status = ? AND run_id = ?",
+                           (stage, status, self.run_id))
+        return rows[0][0]
@@ -0,0 +1,194 @@
+# detail_pool.py
+import queue
+import threading
+import time
+
+import instrumentation
+
+# Plafond de politesse : au-delà, on charge trop le site
+MAX_WORKERS = 8
+
+
+class WorkerContext:
+    """Ressources propres à un worker : son driver Chrome et sa session HTTP, créés à la demande.
+
+    Avec `driver_pool` (BrowserSessions), le driver est emprunté à un pool de
+    navigateurs chauds et lui est rendu à la fin au lieu d'être fermé.
+    """
+
+    def __init__(self, worker_id, driver_factory, session_factory=None, driver_pool=None):
+        self.worker_id = worker_id
+        self._driver_factory = driver_factory
+        self._session_factory = session_factory
+        self._driver_pool = driver_pool
+        self._driver = None
+        self._session = None
+
+    @property
+    def driver(self):
+        if self._driver is None:
+            if self._driver_pool is not None:
+                self._driver = self._driver_pool.acquire()
+            else:
+                self._driver = self._driver_factory()
+        return self._driver
+
+    def task_done(self):
+        """Signale une page traitée (le pool peut recycler le navigateur)"""
+        if self._driver is not None and self._driver_pool is not None:
+            self._driver = self._driver_pool.checkpoint(self._driver)
+
+    @property
+    def session(self):
+        if self._session is None:
+            if self._session_factory is None:
+                raise RuntimeError("Aucune session HTTP configurée pour ce pool")
+            self._session = self._session_factory()
+        return self._session
+
+    def reset_driver(self):
+        """Ferme le driver courant ; le prochain accès en recrée un neuf."""
+        if self._driver is not None:
+            if self._driver_pool is not None:
+                self._driver_pool.discard(self._driver)
+            else:
+                try:
+                    self._driver.quit()
+                except Exception:
+                    pass
+            self._driver = None
+
+    def close(self):
+        if self._driver is not None and self._driver_pool is not None:
+            self._driver_pool.release(self._driver)
+            self._driver = None
+        self.reset_driver()
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+class _Throttle:
+    """Intervalle minimal partagé entre deux démarrages de tâche."""
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def wait(self):
+        if self.min_interval <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.min_interval
+        if start > now:
+            instrumentation.sleep(start - now)
+
+
+def iter_pool(items, handler, driver_factory, workers=4, on_error=None, min_interval=0.0,
+              session_factory=None, driver_pool=None, max_queued=None):
+    """Traite `items` avec un pool de workers et renvoie les résultats dans l'ordre d'entrée.
+
+    Chaque worker possède son propre driver (via `driver_factory`) et appelle
+    `handler(ctx, item)`. Une exception dans le handler n'arrête pas le run :
+    le driver du worker est recréé et `on_error(item, exc)` fournit le résultat.
+    Génère des couples (index, résultat) dès qu'ils sont disponibles dans l'ordre.
+    `driver_pool` (BrowserSessions) remplace `driver_factory` par des navigateurs réutilisés.
+
+    `items` peut être un générateur : il est consommé au fil de l'eau par un thread
+    d'alimentation, dans une file bornée à `max_queued` éléments (2 par worker par
+    défaut). Le producteur est donc freiné quand les workers ne suivent pas, et une
+    exception du producteur est relevée ici une fois les éléments déjà reçus traités.
+    """
+    if hasattr(items, "__len__"):
+        workers = min(workers, len(items) or 1)
+    workers = max(1, min(workers, MAX_WORKERS))
+    throttle = _Throttle(min_interval)
+    tasks = queue.Queue(maxsize=max_queued or 2 * workers)
+    results = queue.Queue()
+    # Éléments en cours (pour on_error si un worker disparaît) et bilan du producteur
+    in_flight = {}
+    in_flight_lock = threading.Lock()
+    feed = {"count": 0, "error": None}
+
+    def feeder():
+        try:
+            for index, item in enumerate(items):
+                with in_flight_lock:
+                    in_flight[index] = item
+                tasks.put((index, item))
+                feed["count"] = index + 1
+        except BaseException as e:
+            feed["error"] = e
+        finally:
+            for _ in range(workers):
+                tasks.put(None)
+
+    def worker(worker_id):
+        ctx = WorkerContext(worker_id, driver_factory, session_factory, driver_pool)
+        try:
+            while True:
+                task = tasks.get()
+                if task is None:
+                    return
+                index, item = task
+                try:
+                    throttle.wait()
+                    result = handler(ctx, item)
+                except Exception as e:
+                    print(f"⚠️ Worker {worker_id} : {str(e)[:80]}")
+                    ctx.reset_driver()
+                    result = on_error(item, e) if on_error else None
+                results.put((index, result))
+                try:
+                    ctx.task_done()
+                except Exception as e:
+                    print(f"⚠️ Worker {worker_id} : recyclage impossible ({str(e)[:60]})")
+                    ctx.reset_driver()
+        finally:
+            ctx.close()
+            results.put((None, worker_id))
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(workers)]
+    threads.append(threading.Thread(target=feeder, daemon=True))
+    for thread in threads:
+        thread.start()
+
+    # Tampon de réordonnancement : on ne rend un résultat que lorsque
+    # tous ceux qui le précèdent sont arrivés.
+    pending = {}
+    next_index = 0
+    alive = workers
+    while alive:
+        index, result = results.get()
+        if index is None:
+            alive -= 1
+            continue
+        pending[index] = result
+        while next_index in pending:
+            with in_flight_lock:
+                in_flight.pop(next_index, None)
+            yield next_index, pending.pop(next_index)
+            next_index += 1
+
+    # Si un worker a disparu sans rendre sa tâche, on complète avec on_error
+    while next_index < feed["count"]:
+        if next_index in pending:
+            yield next_index, pending.pop(next_index)
+        else:
+            with in_flight_lock:
+                item = in_flight.pop(next_index, None)
+            yield next_index, on_error(item, None) if on_error else None
+        next_index += 1
+
+    if feed["error"] is not None:
+        raise feed["error"]
+
+
+def run_pool(items, handler, driver_factory, workers=4, on_error=None, min_interval=0.0,
+             session_factory=None, driver_pool=None):
+    """Version liste de `iter_pool`."""
+    return [result for _, result in iter_pool(items, handler, driver_factory, workers, on_error,
+                                              min_interval, session_factory, driver_pool)]
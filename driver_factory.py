@@ -0,0 +1,151 @@
+# driver_factory.py
+"""Résolution mise en cache de chromedriver et sessions navigateur réutilisées entre étapes."""
+import json
+import os
+import threading
+
+from selenium.webdriver.chrome.service import Service
+
+from browser_profile import discard_network_log
+
+CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "auto24", "chromedriver.json")
+
+_path_lock = threading.Lock()
+_resolved_path = None
+
+
+def resolve_chromedriver_path(cache_file=CACHE_FILE):
+    """Chemin de chromedriver, résolu une seule fois par processus.
+
+    Ordre : variable CHROMEDRIVER_PATH, cache mémoire, cache disque (fonctionne hors
+    ligne), puis webdriver-manager (réseau). Renvoie None si rien n'est disponible :
+    Selenium Manager prend alors le relais.
+    """
+    global _resolved_path
+    with _path_lock:
+        if _resolved_path and os.path.exists(_resolved_path):
+            return _resolved_path
+
+        path = os.environ.get("CHROMEDRIVER_PATH")
+        if not path:
+            try:
+                with open(cache_file, "r", encoding="utf-8") as f:
+                    path = json.load(f).get("path")
+            except (OSError, ValueError):
+                path = None
+
+        if not path or not os.path.exists(path):
+            try:
+                from webdriver_manager.chrome import ChromeDriverManager
+                path = ChromeDriverManager().install()
+                os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+                with open(cache_file, "w", encoding="utf-8") as f:
+                    json.dump({"path": path}, f)
+            except Exception as e:
+                print(f"⚠️ webdriver-manager indisponible ({str(e)[:50]}), repli sur Selenium Manager")
+                path = None
+
+        _resolved_path = path
+        return path
+
+
+def chrome_service():
+    """Service Chrome pointant vers le chromedriver en cache"""
+    path = resolve_chromedriver_path()
+    return Service(path) if path else Service()
+
+
+def browser_rss_mb(driver):
+    """Mémoire résidente (Mo) de chromedriver et de ses processus Chrome ; None sans psutil"""
+    try:
+        import psutil
+    except ImportError:
+        return None
+    try:
+        process = psutil.Process(driver.service.process.pid)
+        processes = [process] + process.children(recursive=True)
+    except Exception:
+        return None
+    total = 0
+    for proc in processes:
+        try:
+            total += proc.memory_info().rss
+        except psutil.Error:
+            continue
+    return total / (1024 * 1024)
+
+
+class BrowserSessions:
+    """Navigateurs chauds réutilisés d'une étape à l'autre.
+
+    `acquire` rend un driver libre (ou en crée un), `release` le remet à disposition.
+    `checkpoint` est appelé après chaque page : le driver est recyclé après
+    `max_pages` pages ou si sa mémoire dépasse `max_rss_mb`.
+    """
+
+    def __init__(self, factory, max_pages=200, max_rss_mb=1500, rss_check_every=20):
+        self.factory = factory
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.rss_check_every = rss_check_every
+        self._lock = threading.Lock()
+        self._idle = []
+        self._pages = {}
+        self.created = 0
+        self.recycled = 0
+
+    def acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        driver = self.factory()
+        with self._lock:
+            self._pages[id(driver)] = 0
+            self.created += 1
+        return driver
+
+    def release(self, driver):
+        """Remet le driver à disposition, log réseau vidé (voir browser_profile.PageWeightTracker)"""
+        try:
+            discard_network_log(driver)
+        except Exception:
+            pass
+        with self._lock:
+            self._idle.append(driver)
+
+    def discard(self, driver):
+        """Ferme un driver défaillant sans le remettre dans le pool"""
+        with self._lock:
+            self._pages.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def checkpoint(self, driver):
+        """Compte une page ; renvoie le driver à utiliser pour la suite (recyclé si nécessaire)"""
+        with self._lock:
+            pages = self._pages.get(id(driver), 0) + 1
+            self._pages[id(driver)] = pages
+
+        reason = None
+        if self.max_pages and pages >= self.max_pages:
+            reason = f"{pages} pages"
+        elif self.max_rss_mb and pages % self.rss_check_every == 0:
+            rss = browser_rss_mb(driver)
+            if rss is not None and rss > self.max_rss_mb:
+                reason = f"{rss:.0f} Mo"
+
+        if reason is None:
+            return driver
+        print(f"♻️ Recyclage du navigateur ({reason})")
+        self.discard(driver)
+        with self._lock:
+            self.recycled += 1
+        return self.acquire()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for driver in idle:
+            self.discard(driver)
@@ -0,0 +1,131 @@
+# fast_details.py
+"""Moteur HTTP rapide pour les pages de détail : requests + lxml, sans navigateur."""
+import os
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from lxml import html as lxml_html
+
+import instrumentation
+from parsing import empty_details, apply_spec
+from rate_limit import THROTTLE_STATUSES, limited_session_get
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+
+def create_http_session(pool_size=16):
+    """Session HTTP avec pool de connexions keep-alive et retries sur erreurs serveur"""
+    session = requests.Session()
+    # 429/503 ne sont pas rejoués ici : le limiteur de débit doit les voir pour ralentir
+    retries = Retry(total=3, backoff_factor=0.5, status_forcelist=[500, 502, 504])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({
+        'User-Agent': USER_AGENT,
+        'Accept-Language': 'fr-FR,fr;q=0.9',
+    })
+    return instrumentation.instrument_session(session)
+
+
+def _has_class(name):
+    """Fragment XPath équivalent au sélecteur CSS `.name`"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+def _text(node):
+    return " ".join(node.text_content().split())
+
+
+class ParsedDetails:
+    """Résultat du parsing HTML d'une page de détail (`page_html` : HTML source, pour l'archive)"""
+
+    def __init__(self, details, image_urls, complete, page_html=None):
+        self.details = details
+        self.image_urls = image_urls
+        self.complete = complete
+        self.page_html = page_html
+
+
+def parse_car_details(page_html, base_url=None):
+    """Extrait prix, fiche technique, équipements et images du HTML rendu côté serveur.
+
+    `complete` est faux si le conteneur principal, le prix ou la fiche technique
+    manquent (page rendue côté client) : l'appelant doit alors basculer sur Selenium.
+    """
+    details = empty_details()
+    tree = lxml_html.fromstring(page_html)
+    if base_url:
+        tree.make_links_absolute(base_url)
+
+    content = tree.xpath(f"//div[{_has_class('ant-col')} and {_has_class('content-container')}]")
+
+    prices = tree.xpath(f"//span[{_has_class('card-price')}]")
+    for price in prices:
+        text = _text(price)
+        if text:
+            details['prix'] = text
+            break
+
+    specs = tree.xpath(f"//div[{_has_class('specs-container')}]//div[{_has_class('spec-item')}]")
+    for spec in specs:
+        labels = spec.xpath(f".//span[{_has_class('spec-label')}]")
+        values = spec.xpath(f".//span[{_has_class('spec-value')}]")
+        label = _text(labels[0]) if labels else "N/A"
+        value = _text(values[0]) if values else "N/A"
+        try:
+            apply_spec(details, label, value)
+        except ValueError:
+            continue
+
+    features = tree.xpath(f"//div[{_has_class('features-container')}]//div[{_has_class('feature-item')}]")
+    details['equipements'] = [text for text in (_text(f) for f in features) if text]
+
+    image_urls = []
+    for img in tree.xpath(f"//div[{_has_class('carousel-image')}]//img"):
+        src = img.get('src') or img.get('data-src')
+        if src and src not in image_urls:
+            image_urls.append(src)
+
+    complete = bool(content) and bool(specs) and details['prix'] != 'N/A'
+    return ParsedDetails(details, image_urls, complete, page_html)
+
+
+def fetch_car_details(session, url, timeout=15, attempts=3):
+    """Télécharge et parse une page de détail ; renvoie un ParsedDetails
+
+    Un 429/503 est rejoué après le backoff imposé par le limiteur de débit.
+    """
+    with instrumentation.stage("detail_load"):
+        for attempt in range(attempts):
+            response = limited_session_get(session, url, timeout=timeout)
+            if response.status_code not in THROTTLE_STATUSES:
+                break
+        response.raise_for_status()
+    with instrumentation.stage("spec_parse"):
+        return parse_car_details(response.text, base_url=response.url)
+
+
+def download_image_url(session, image_url, folder_path, image_name, referer=None, timeout=15):
+    """Télécharge une image en streaming et renvoie le nom du fichier écrit"""
+    headers = {'Referer': referer} if referer else {}
+    with limited_session_get(session, image_url, headers=headers, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+
+        # Détection de l'extension
+        content_type = response.headers.get('Content-Type', '')
+        extension = '.webp'
+        if 'jpeg' in content_type:
+            extension = '.jpg'
+        elif 'png' in content_type:
+            extension = '.png'
+
+        image_path = os.path.join(folder_path, f"{image_name}{extension}")
+        # Écriture dans un fichier temporaire : pas d'image tronquée en cas d'échec
+        partial_path = image_path + ".part"
+        with open(partial_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=65536):
+                f.write(chunk)
+        os.replace(partial_path, image_path)
+
+    return os.path.basename(image_path)
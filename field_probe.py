@@ -0,0 +1,81 @@
+# field_probe.py
+"""Lecture des champs d'une page de détail sans timeout par champ.
+
+Une seule attente de page prête, puis un instantané JavaScript de tous les champs :
+un champ absent coûte zéro seconde au lieu d'un WebDriverWait de 5 s.
+"""
+import threading
+from collections import Counter
+
+from selenium.common.exceptions import JavascriptException, StaleElementReferenceException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+
+# Types d'échec par champ
+MISSING = "champ_absent"
+STALE = "element_perime"
+NOT_LOADED = "page_non_chargee"
+INVALID = "valeur_invalide"
+
+# Erreurs passagères (DOM en cours de re-rendu) : rejouées
+TRANSIENT_ERRORS = (StaleElementReferenceException, JavascriptException)
+
+DETAILS_SNAPSHOT_JS = """
+const text = el => el ? el.innerText.trim() || null : null;
+return {
+    price: text(document.querySelector('span.card-price')),
+    specs: Array.from(document.querySelectorAll('div.specs-container div.spec-item')).map(spec => ({
+        label: text(spec.querySelector('span.spec-label')),
+        value: text(spec.querySelector('span.spec-value'))
+    })),
+    features: Array.from(document.querySelectorAll('div.features-container div.feature-item'))
+        .map(text).filter(Boolean),
+    images: Array.from(document.querySelectorAll('div.carousel-image img'))
+        .map(img => img.src || img.dataset.src).filter(Boolean)
+};
+"""
+
+
+def wait_page_ready(driver, selector, timeout=15):
+    """L'unique attente de la page : le conteneur principal est présent"""
+    WebDriverWait(driver, timeout).until(EC.presence_of_element_located((By.CSS_SELECTOR, selector)))
+
+
+@retry(retry=retry_if_exception_type(TRANSIENT_ERRORS), stop=stop_after_attempt(3),
+       wait=wait_random_exponential(multiplier=0.2, max=2), reraise=True)
+def snapshot_details(driver):
+    """Tous les champs de la page en un aller-retour ; les champs absents valent None"""
+    return driver.execute_script(DETAILS_SNAPSHOT_JS)
+
+
+class FieldReport:
+    """Échecs par champ pour une page, agrégés pour tout le run"""
+
+    _totals_lock = threading.Lock()
+    totals = Counter()
+
+    def __init__(self, url):
+        self.url = url
+        self.failures = {}
+
+    def fail(self, field, kind):
+        self.failures[field] = kind
+        with FieldReport._totals_lock:
+            FieldReport.totals[(field, kind)] += 1
+
+    @classmethod
+    def reset(cls):
+        """Remet les totaux à zéro au début d'un run (plusieurs runs dans un même processus)"""
+        with cls._totals_lock:
+            cls.totals = Counter()
+
+    @classmethod
+    def summary(cls, limit=10):
+        with cls._totals_lock:
+            most_common = cls.totals.most_common(limit)
+        if most_common:
+            print("🧩 Champs en échec : " + ", ".join(
+                f"{field} ({kind}) x{count}" for (field, kind), count in most_common))
+        return most_common
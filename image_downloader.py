@@ -0,0 +1,162 @@
+# image_downloader.py
+"""Téléchargement concurrent des images, découplé de la navigation."""
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from tenacity import Retrying, stop_after_attempt, wait_exponential
+
+import instrumentation
+from fast_details import create_http_session, download_image_url
+
+
+class ImageDownloader:
+    """Pool borné de téléchargements d'images en arrière-plan.
+
+    - une session keep-alive partagée par tous les threads
+    - au plus `per_host` téléchargements simultanés par hôte
+    - au plus `max_pending` images en attente : `submit` bloque au-delà
+    - retries avec backoff exponentiel, écriture en streaming
+    - avec un `store`, `submit_listing` déduplique par contenu et écrit le manifeste de l'annonce
+    - avec un `processor` (image_processing.ImageProcessor), les nouvelles images de l'annonce
+      sont ensuite post-traitées dans un pool de processus
+    """
+
+    def __init__(self, max_workers=8, per_host=4, max_pending=200, retries=3, session=None, store=None,
+                 processor=None):
+        self.session = session or create_http_session(pool_size=max_workers)
+        self.store = store
+        self.processor = processor
+        self.retries = retries
+        self.per_host = per_host
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="img")
+        self._pending = threading.BoundedSemaphore(max_pending)
+        self._hosts_lock = threading.Lock()
+        self._host_slots = defaultdict(lambda: threading.BoundedSemaphore(self.per_host))
+        self._stats_lock = threading.Lock()
+        self.downloaded = 0
+        self.failed = 0
+        self.bytes = 0
+        self.failures = []
+        self.not_modified = 0
+        self.fresh = 0
+        self._started = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, image_url, folder_path, image_name, referer=None):
+        """Met une image en file ; rend la main immédiatement sauf si la file est pleine"""
+        def job():
+            filename = download_image_url(self.session, image_url, folder_path,
+                                          image_name, referer=referer)
+            size = os.path.getsize(os.path.join(folder_path, filename))
+            return filename, "downloaded", size
+
+        return self._submit(image_url, image_name, job)
+
+    def submit_all(self, image_urls, folder_path, referer=None, limit=10):
+        """Met en file les `limit` premières images d'une annonce (image_1, image_2, ...)"""
+        os.makedirs(folder_path, exist_ok=True)
+        return [
+            self.submit(image_url, folder_path, f"image_{idx}", referer)
+            for idx, image_url in enumerate(image_urls[:limit], 1)
+        ]
+
+    def submit_listing(self, vehicle_id, listing_url, image_urls, limit=10):
+        """Range les images d'une annonce dans le store ; le manifeste est écrit une fois toutes terminées"""
+        image_urls = image_urls[:limit]
+        entries = [None] * len(image_urls)
+        remaining = [len(image_urls)]
+        lock = threading.Lock()
+
+        if not image_urls:
+            self.store.write_manifest(vehicle_id, listing_url, entries)
+            return []
+
+        def on_done(position, future):
+            entries[position] = future.result()
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                self.store.write_manifest(vehicle_id, listing_url, entries)
+                if self.processor is not None:
+                    self.processor.submit_listing(vehicle_id)
+
+        futures = []
+        for position, image_url in enumerate(image_urls):
+            def job(image_url=image_url):
+                entry = self.store.fetch(self.session, image_url, referer=listing_url)
+                return entry, entry["status"], entry["transferred"]
+
+            future = self._submit(image_url, f"{vehicle_id}#{position + 1}", job)
+            future.add_done_callback(lambda f, position=position: on_done(position, f))
+            futures.append(future)
+        return futures
+
+    def _submit(self, image_url, label, job):
+        self._pending.acquire()
+        try:
+            return self._executor.submit(self._run, image_url, label, job)
+        except Exception:
+            self._pending.release()
+            raise
+
+    def _host_slot(self, image_url):
+        with self._hosts_lock:
+            return self._host_slots[urlparse(image_url).netloc]
+
+    def _run(self, image_url, label, job):
+        try:
+            with self._host_slot(image_url), instrumentation.stage("image_fetch"):
+                for attempt in Retrying(stop=stop_after_attempt(self.retries),
+                                        wait=wait_exponential(multiplier=0.5, max=8),
+                                        reraise=True):
+                    with attempt:
+                        result, status, size = job()
+            with self._stats_lock:
+                if status == "not_modified":
+                    self.not_modified += 1
+                elif status == "fresh":
+                    self.fresh += 1
+                else:
+                    self.downloaded += 1
+                self.bytes += size
+            return result
+        except Exception as e:
+            with self._stats_lock:
+                self.failed += 1
+                self.failures.append((image_url, str(e)[:80]))
+            print(f"❌ Erreur image {label} : {str(e)[:80]}")
+            return None
+        finally:
+            self._pending.release()
+
+    def summary(self):
+        """Statistiques du run : volume, débit et échecs"""
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        return {
+            "images": self.downloaded,
+            "non_modifiees": self.not_modified,
+            "deja_a_jour": self.fresh,
+            "echecs": self.failed,
+            "octets": self.bytes,
+            "octets_par_seconde": self.bytes / elapsed,
+            "duree_s": elapsed,
+        }
+
+    def close(self):
+        """Attend la fin des téléchargements en cours et affiche le bilan"""
+        self._executor.shutdown(wait=True)
+        stats = self.summary()
+        print(f"🖼️ Images : {stats['images']} téléchargées, {stats['non_modifiees']} non modifiées (304), "
+              f"{stats['deja_a_jour']} sans requête, {stats['echecs']} échecs, "
+              f"{stats['octets'] / 1e6:.1f} Mo en {stats['duree_s']:.0f}s "
+              f"({stats['octets_par_seconde'] / 1e3:.0f} Ko/s)")
@@ -0,0 +1,222 @@
+# image_processing.py
+"""Post-traitement des images du store dans un pool de processus (nécessite Pillow).
+
+Pour chaque objet nouveau : dimensions, hash perceptuel (dHash 64 bits), miniature de
+taille fixe et copie au format normalisé. Les résultats sont indexés par sha256 dans
+le store (un objet n'est traité qu'une fois) et recopiés dans les manifestes.
+
+    python image_processing.py                  # traite les objets du store restés sans dérivés
+    python image_processing.py --duplicates     # liste les quasi-doublons entre annonces
+"""
+import argparse
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+THUMBNAIL_SIZE = (320, 240)
+NORMALIZED_FORMAT = ("JPEG", ".jpg")
+JPEG_QUALITY = 85
+
+# Distance de Hamming maximale entre deux dHash pour parler de quasi-doublon
+NEAR_DUPLICATE_DISTANCE = 3
+
+
+def dhash(image, size=8):
+    """Hash de différence : compare chaque pixel à son voisin de droite sur une vignette 9x8"""
+    from PIL import Image
+
+    pixels = list(image.convert("L").resize((size + 1, size), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return f"{value:016x}"
+
+
+def hamming(hash_a, hash_b):
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count("1")
+
+
+def process_object(root, sha256, source_path, thumbnail_size=THUMBNAIL_SIZE):
+    """Travail d'un processus du pool : renvoie les dérivés d'un objet (chemins relatifs à `root`)"""
+    from PIL import Image, ImageOps
+
+    image_format, extension = NORMALIZED_FORMAT
+    derived_dir = os.path.join(root, "derived", sha256[:2])
+    os.makedirs(derived_dir, exist_ok=True)
+
+    with Image.open(source_path) as image:
+        image.load()
+        width, height = image.size
+        info = {"width": width, "height": height, "phash": dhash(image)}
+        rgb = image.convert("RGB")
+
+    thumbnail_path = os.path.join(derived_dir, f"{sha256}_thumb{extension}")
+    ImageOps.fit(rgb, thumbnail_size, Image.LANCZOS).save(thumbnail_path, image_format, quality=JPEG_QUALITY)
+    info["thumbnail"] = os.path.relpath(thumbnail_path, root)
+
+    if source_path.lower().endswith(extension):
+        info["normalized"] = os.path.relpath(source_path, root)
+    else:
+        normalized_path = os.path.join(derived_dir, f"{sha256}{extension}")
+        rgb.save(normalized_path, image_format, quality=JPEG_QUALITY)
+        info["normalized"] = os.path.relpath(normalized_path, root)
+    return info
+
+
+class ImageProcessor:
+    """Pool de processus (un par cœur) alimenté par l'ImageDownloader, sans jamais le bloquer.
+
+    `submit_listing` met en file les objets encore sans dérivés d'une annonce ; au-delà
+    de `max_pending` objets en cours, les suivants sont reportés et traités par `close`
+    (via `backfill`). Le manifeste de l'annonce est annoté dès que tous ses objets sont traités.
+    """
+
+    def __init__(self, store, workers=None, max_pending=500, thumbnail_size=THUMBNAIL_SIZE):
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            raise RuntimeError("Pillow est requis pour le post-traitement des images (pip install Pillow)")
+        self.store = store
+        self.thumbnail_size = thumbnail_size
+        self.max_pending = max_pending
+        # spawn : les processus ne dupliquent ni les threads ni les connexions du scraper
+        self._executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                                             mp_context=multiprocessing.get_context("spawn"))
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.processed = 0
+        self.failed = 0
+        self.deferred = 0
+        # Annonces dont des objets ont été reportés : manifestes annotés à la fermeture
+        self._deferred_listings = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit_listing(self, vehicle_id):
+        """Traite en arrière-plan les nouvelles images d'une annonce ; rend la main immédiatement"""
+        manifest = self.store.load_manifest(vehicle_id)
+        if manifest is None:
+            return
+        missing = [image for image in manifest["images"] if self.store.derived(image["sha256"]) is None]
+        if not missing:
+            if any("phash" not in image for image in manifest["images"]):
+                self.store.annotate_manifest(vehicle_id)
+            return
+
+        remaining = [len(missing)]
+        remaining_lock = threading.Lock()
+
+        def on_done(future):
+            with remaining_lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                self.store.annotate_manifest(vehicle_id)
+
+        for image in missing:
+            future = self._submit(image["sha256"], os.path.join(self.store.root, image["path"]))
+            if future is None:
+                with self._lock:
+                    self._deferred_listings.add(vehicle_id)
+                on_done(None)
+            else:
+                future.add_done_callback(on_done)
+
+    def backfill(self):
+        """Met en file tous les objets du store restés sans dérivés ; renvoie leur nombre"""
+        futures = [self._submit(sha256, path, block=True) for sha256, path in self.store.unprocessed()]
+        return sum(1 for future in futures if future is not None)
+
+    def _submit(self, sha256, path, block=False):
+        with self._lock:
+            if sha256 in self._in_flight:
+                return self._in_flight[sha256]
+            if not block and len(self._in_flight) >= self.max_pending:
+                self.deferred += 1
+                return None
+            future = self._executor.submit(process_object, self.store.root, sha256, path, self.thumbnail_size)
+            self._in_flight[sha256] = future
+        future.add_done_callback(lambda f: self._record(sha256, f))
+        return future
+
+    def _record(self, sha256, future):
+        try:
+            info = future.result()
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            print(f"❌ Post-traitement {sha256[:12]} : {str(e)[:80]}")
+            info = None
+        if info is not None:
+            self.store.record_derived(sha256, info)
+            with self._lock:
+                self.processed += 1
+        with self._lock:
+            self._in_flight.pop(sha256, None)
+
+    def close(self):
+        """Traite les objets reportés, attend la fin des traitements et affiche le bilan"""
+        if self.deferred:
+            self.backfill()
+        self._executor.shutdown(wait=True)
+        for vehicle_id in self._deferred_listings:
+            self.store.annotate_manifest(vehicle_id)
+        print(f"🧪 Post-traitement : {self.processed} images traitées, {self.failed} échecs, "
+              f"{self.deferred} reportées en fin de run")
+
+
+def near_duplicates(store, max_distance=NEAR_DUPLICATE_DISTANCE):
+    """Paires (sha_a, sha_b, distance) d'images quasi identiques.
+
+    Le dHash est découpé en 4 bandes de 16 bits : deux hash à distance <= 3 partagent
+    au moins une bande, seules les paires d'une même bande sont comparées.
+    """
+    buckets = {}
+    for sha256, phash in store.phashes():
+        for band in range(4):
+            buckets.setdefault((band, phash[band * 4:band * 4 + 4]), []).append((sha256, phash))
+
+    pairs = {}
+    for candidates in buckets.values():
+        for i, (sha_a, hash_a) in enumerate(candidates):
+            for sha_b, hash_b in candidates[i + 1:]:
+                key = tuple(sorted((sha_a, sha_b)))
+                if key not in pairs:
+                    distance = hamming(hash_a, hash_b)
+                    if distance <= max_distance:
+                        pairs[key] = distance
+    return [(sha_a, sha_b, distance) for (sha_a, sha_b), distance in sorted(pairs.items(), key=lambda item: item[1])]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Post-traitement des images du store")
+    parser.add_argument("--root", default=os.path.join("data", "images"))
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--duplicates", action="store_true", help="affiche les quasi-doublons au lieu de traiter")
+    parser.add_argument("--max-distance", type=int, default=NEAR_DUPLICATE_DISTANCE)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    from image_store import ImageStore
+
+    args = parse_args()
+    store = ImageStore(args.root)
+    if args.duplicates:
+        for sha_a, sha_b, distance in near_duplicates(store, args.max_distance):
+            print(f"{sha_a[:12]} ~ {sha_b[:12]} (distance {distance})")
+    else:
+        with ImageProcessor(store, workers=args.workers) as processor:
+            print(f"🧪 {processor.backfill()} images à traiter")
+        for manifest_name in os.listdir(store.manifests_dir):
+            if manifest_name.endswith(".json"):
+                store.annotate_manifest(manifest_name[:-len(".json")])
+    store.close()
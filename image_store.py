@@ -0,0 +1,235 @@
+# image_store.py
+"""Stockage d'images adressé par contenu, avec manifestes par annonce et requêtes conditionnelles."""
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from rate_limit import limited_session_get
+
+# Une image déjà vérifiée depuis moins longtemps n'est pas redemandée au serveur
+DEFAULT_MAX_AGE = 24 * 3600
+
+
+def _extension(content_type):
+    if 'jpeg' in content_type:
+        return '.jpg'
+    if 'png' in content_type:
+        return '.png'
+    return '.webp'
+
+
+class ImageStore:
+    """Images rangées sous `objects/<sha[:2]>/<sha><ext>` : une photo identique n'est stockée qu'une fois.
+
+    Chaque annonce a un manifeste `manifests/<vehicle_id>.json` qui pointe vers ses
+    objets ; l'index SQLite garde pour chaque URL le hash, l'ETag et le Last-Modified,
+    et pour chaque objet les dérivés calculés par image_processing (dimensions, hash
+    perceptuel, miniature, format normalisé), recopiés dans les manifestes.
+    """
+
+    def __init__(self, root=os.path.join("data", "images"), max_age=DEFAULT_MAX_AGE):
+        self.root = root
+        self.max_age = max_age
+        self.objects_dir = os.path.join(root, "objects")
+        self.manifests_dir = os.path.join(root, "manifests")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.manifests_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # Manifestes écrits par le downloader et annotés par le post-traitement
+        self._manifest_lock = threading.RLock()
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                extension TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                checked_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS derived (
+                sha256 TEXT PRIMARY KEY,
+                width INTEGER,
+                height INTEGER,
+                phash TEXT,
+                thumbnail TEXT,
+                normalized TEXT,
+                processed_at REAL NOT NULL
+            );
+        """)
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def object_path(self, sha256, extension):
+        return os.path.join(self.objects_dir, sha256[:2], sha256 + extension)
+
+    def _lookup(self, url):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT sha256, extension, size, etag, last_modified, checked_at FROM urls WHERE url = ?",
+                (url,)).fetchone()
+        if row is None:
+            return None
+        keys = ("sha256", "extension", "size", "etag", "last_modified", "checked_at")
+        return dict(zip(keys, row))
+
+    def _remember(self, url, sha256, extension, size, etag, last_modified):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO urls VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, sha256, extension, size, etag, last_modified, time.time()))
+            self._db.commit()
+
+    def _touch(self, url):
+        with self._lock:
+            self._db.execute("UPDATE urls SET checked_at = ? WHERE url = ?", (time.time(), url))
+            self._db.commit()
+
+    def fetch(self, session, url, referer=None, timeout=15):
+        """Garantit que l'image `url` est dans le store et renvoie son entrée de manifeste.
+
+        `status` vaut "fresh" (aucune requête), "not_modified" (304) ou "downloaded".
+        """
+        known = self._lookup(url)
+        if known and not os.path.exists(self.object_path(known["sha256"], known["extension"])):
+            known = None
+
+        if known and time.time() - known["checked_at"] < self.max_age:
+            return self._entry(url, known, "fresh", 0)
+
+        headers = {'Referer': referer} if referer else {}
+        if known and known["etag"]:
+            headers['If-None-Match'] = known["etag"]
+        if known and known["last_modified"]:
+            headers['If-Modified-Since'] = known["last_modified"]
+
+        with limited_session_get(session, url, headers=headers, stream=True, timeout=timeout) as response:
+            if known and response.status_code == 304:
+                self._touch(url)
+                return self._entry(url, known, "not_modified", 0)
+            response.raise_for_status()
+
+            extension = _extension(response.headers.get('Content-Type', ''))
+            digest = hashlib.sha256()
+            size = 0
+            fd, partial_path = tempfile.mkstemp(dir=self.objects_dir, suffix=".part")
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=65536):
+                        digest.update(chunk)
+                        size += len(chunk)
+                        f.write(chunk)
+
+                sha256 = digest.hexdigest()
+                final_path = self.object_path(sha256, extension)
+                if os.path.exists(final_path):
+                    # Doublon : l'objet existe déjà
+                    os.remove(partial_path)
+                else:
+                    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                    os.replace(partial_path, final_path)
+            except BaseException:
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+                raise
+
+            self._remember(url, sha256, extension, size,
+                           response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+        record = {"sha256": sha256, "extension": extension, "size": size}
+        return self._entry(url, record, "downloaded", size)
+
+    def _entry(self, url, record, status, transferred):
+        path = self.object_path(record["sha256"], record["extension"])
+        return {
+            "url": url,
+            "sha256": record["sha256"],
+            "path": os.path.relpath(path, self.root),
+            "size": record["size"],
+            "status": status,
+            "transferred": transferred,
+        }
+
+    # --- Dérivés (image_processing) ---
+
+    DERIVED_KEYS = ("width", "height", "phash", "thumbnail", "normalized")
+
+    def derived(self, sha256):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT width, height, phash, thumbnail, normalized FROM derived WHERE sha256 = ?",
+                (sha256,)).fetchone()
+        return dict(zip(self.DERIVED_KEYS, row)) if row else None
+
+    def record_derived(self, sha256, info):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO derived VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             (sha256, *(info.get(key) for key in self.DERIVED_KEYS), time.time()))
+            self._db.commit()
+
+    def unprocessed(self):
+        """[(sha256, chemin de l'objet)] des objets sans dérivés"""
+        with self._lock:
+            rows = self._db.execute("""
+                SELECT DISTINCT urls.sha256, urls.extension FROM urls
+                LEFT JOIN derived ON derived.sha256 = urls.sha256
+                WHERE derived.sha256 IS NULL
+            """).fetchall()
+        return [(sha256, self.object_path(sha256, extension)) for sha256, extension in rows]
+
+    def phashes(self):
+        with self._lock:
+            return self._db.execute("SELECT sha256, phash FROM derived WHERE phash IS NOT NULL").fetchall()
+
+    def manifest_path(self, vehicle_id):
+        return os.path.join(self.manifests_dir, f"{vehicle_id}.json")
+
+    def load_manifest(self, vehicle_id):
+        try:
+            with open(self.manifest_path(vehicle_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def write_manifest(self, vehicle_id, listing_url, entries):
+        """Écrit (atomiquement) le manifeste d'une annonce, avec les dérivés déjà connus"""
+        images = []
+        for position, entry in enumerate(entries, 1):
+            if entry is None:
+                continue
+            image = {key: entry[key] for key in ("url", "sha256", "path", "size")} | {"position": position}
+            images.append(image | (self.derived(entry["sha256"]) or {}))
+        manifest = {
+            "vehicle_id": vehicle_id,
+            "url": listing_url,
+            "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "images": images,
+        }
+        return self._save_manifest(vehicle_id, manifest)
+
+    def annotate_manifest(self, vehicle_id):
+        """Recopie dans le manifeste les dérivés calculés depuis son écriture"""
+        with self._manifest_lock:
+            manifest = self.load_manifest(vehicle_id)
+            if manifest is None:
+                return None
+            for image in manifest["images"]:
+                image.update(self.derived(image["sha256"]) or {})
+            return self._save_manifest(vehicle_id, manifest)
+
+    def _save_manifest(self, vehicle_id, manifest):
+        path = self.manifest_path(vehicle_id)
+        with self._manifest_lock:
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            os.replace(path + ".tmp", path)
+        return path
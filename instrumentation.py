@@ -0,0 +1,278 @@
+# instrumentation.py
+"""Compteurs et histogrammes de latence par point d'appel et par étape (WebDriver, attentes, sleeps, HTTP).
+
+Désactivé par défaut : chaque point de mesure se réduit alors à un test de booléen.
+    instrumentation.enable()
+    ...
+    instrumentation.metrics.write_json("data/metrics.json")
+    instrumentation.metrics.write_prometheus("data/metrics.prom")
+"""
+import contextlib
+import json
+import sys
+import threading
+import time
+
+# Bornes supérieures des buckets d'histogramme (secondes)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_local = threading.local()
+_null = contextlib.nullcontext()
+
+
+class Histogram:
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[index] += 1
+                return
+        self.buckets[-1] += 1
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total_s": self.total,
+            "mean_s": self.total / self.count if self.count else 0.0,
+            "max_s": self.max,
+            "buckets": dict(zip([str(b) for b in BUCKETS] + ["+Inf"], self.buckets)),
+        }
+
+
+class Metrics:
+    """Histogrammes indexés par (type, point d'appel, étape)"""
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self.started = time.monotonic()
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+            self.started = time.monotonic()
+
+    def observe(self, kind, site, seconds, stage_name=None):
+        key = (kind, site, stage_name or current_stage())
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return [
+                {"kind": kind, "site": site, "stage": stage_name, **histogram.to_dict()}
+                for (kind, site, stage_name), histogram in sorted(self._histograms.items(), key=lambda item: str(item[0]))
+            ]
+
+    def by_stage(self):
+        """Durée totale et nombre de passages par étape (le détail des appels reste dans `snapshot`)"""
+        totals = {}
+        for entry in self.snapshot():
+            # Les appels mesurés pendant une étape sont déjà inclus dans sa durée
+            if entry["kind"] != "stage":
+                continue
+            stage_totals = totals.setdefault(entry["stage"], {"count": 0, "total_s": 0.0})
+            stage_totals["count"] += entry["count"]
+            stage_totals["total_s"] += entry["total_s"]
+        return totals
+
+    def write_json(self, path):
+        report = {
+            "elapsed_s": time.monotonic() - self.started,
+            "stages": self.by_stage(),
+            "calls": self.snapshot(),
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return path
+
+    def write_prometheus(self, path):
+        """Format texte Prometheus (collecteur textfile de node_exporter)"""
+        lines = [
+            "# HELP auto24_call_seconds Durée des appels instrumentés",
+            "# TYPE auto24_call_seconds histogram",
+        ]
+        for entry in self.snapshot():
+            labels = 'kind="{kind}",site="{site}",stage="{stage}"'.format(
+                kind=entry["kind"], site=_escape(entry["site"]), stage=entry["stage"] or "")
+            cumulative = 0
+            for bound, count in entry["buckets"].items():
+                cumulative += count
+                lines.append(f'auto24_call_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"auto24_call_seconds_sum{{{labels}}} {entry['total_s']}")
+            lines.append(f"auto24_call_seconds_count{{{labels}}} {entry['count']}")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return path
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+metrics = Metrics()
+
+
+def enable():
+    metrics.enabled = True
+    metrics.reset()
+    _instrument_waits()
+
+
+def current_stage():
+    return getattr(_local, "stage", None)
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Étape courante du thread (listing_scan, detail_load, spec_parse, image_fetch...)"""
+    previous = current_stage()
+    _local.stage = name
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _local.stage = previous
+        if metrics.enabled:
+            metrics.observe("stage", name, time.perf_counter() - started, name)
+
+
+@contextlib.contextmanager
+def _timer(kind, site):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe(kind, site, time.perf_counter() - started)
+
+
+def timed(kind, site):
+    """Mesure un bloc ; contexte vide si l'instrumentation est désactivée"""
+    if not metrics.enabled:
+        return _null
+    return _timer(kind, site)
+
+
+def _caller_site(depth=2):
+    frame = sys._getframe(depth)
+    return f"{frame.f_code.co_name}:{frame.f_lineno}"
+
+
+def sleep(seconds):
+    """time.sleep mesuré par point d'appel"""
+    if not metrics.enabled:
+        time.sleep(seconds)
+        return
+    site = _caller_site()
+    started = time.perf_counter()
+    time.sleep(seconds)
+    metrics.observe("sleep", site, time.perf_counter() - started)
+
+
+def instrument_driver(driver):
+    """Mesure chaque commande WebDriver (get, findElements, executeScript...)"""
+    if not metrics.enabled or getattr(driver, "_instrumented", False):
+        return driver
+    original_execute = driver.execute
+
+    def execute(driver_command, params=None):
+        started = time.perf_counter()
+        try:
+            return original_execute(driver_command, params)
+        finally:
+            metrics.observe("webdriver", driver_command, time.perf_counter() - started)
+
+    driver.execute = execute
+    driver._instrumented = True
+    return driver
+
+
+def instrument_session(session):
+    """Mesure chaque requête HTTP d'une session requests, par hôte et méthode"""
+    if not metrics.enabled or getattr(session, "_instrumented", False):
+        return session
+    original_request = session.request
+
+    def request(method, url, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return original_request(method, url, *args, **kwargs)
+        finally:
+            host = url.split("/")[2] if "://" in url else url
+            metrics.observe("http", f"{method} {host}", time.perf_counter() - started)
+
+    session.request = request
+    session._instrumented = True
+    return session
+
+
+_waits_patched = False
+
+
+def _instrument_waits():
+    """Mesure WebDriverWait.until par point d'appel (temps passé à attendre, timeouts compris)"""
+    global _waits_patched
+    if _waits_patched:
+        return
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    original_until = WebDriverWait.until
+
+    def until(self, method, message=""):
+        if not metrics.enabled:
+            return original_until(self, method, message)
+        site = _caller_site()
+        started = time.perf_counter()
+        try:
+            return original_until(self, method, message)
+        finally:
+            metrics.observe("wait", site, time.perf_counter() - started)
+
+    WebDriverWait.until = until
+    _waits_patched = True
+
+
+class Progress:
+    """Ligne de progression : éléments traités, débit et temps restant estimé
+
+    `total=None` (étape 1 encore en cours) : seuls le compte et le débit sont affichés.
+    """
+
+    def __init__(self, total, label="annonces", live=True):
+        self.total = total
+        self.label = label
+        self.live = live
+        self.done = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def advance(self, count=1):
+        with self._lock:
+            self.done += count
+            done = self.done
+        if not self.live:
+            return
+        elapsed = time.monotonic() - self.started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - done) / rate if rate > 0 and self.total else 0
+        if self.total:
+            sys.stdout.write(f"\r⏱️ {done}/{self.total} {self.label} - {rate:.2f}/s - reste ~{eta:.0f}s ")
+        else:
+            sys.stdout.write(f"\r⏱️ {done} {self.label} - {rate:.2f}/s ")
+        sys.stdout.flush()
+        if self.total and done >= self.total:
+            sys.stdout.write("\n")
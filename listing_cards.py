@@ -0,0 +1,178 @@
+# listing_cards.py
+"""Extraction groupée des cartes d'annonces en un seul aller-retour navigateur."""
+import json
+
+import instrumentation
+
+# Le loader du scroll infini porte aussi la classe card-holder
+CARD_SELECTOR = "div.card-holder:not(.lds-roller)"
+
+# Sérialisation d'une carte, partagée par les scripts d'extraction
+_SERIALIZE_CARD_JS = """
+const text = (root, sel) => {
+    const el = root.querySelector(sel);
+    return el ? el.innerText.trim() : null;
+};
+const serialize = card => {
+    const link = card.querySelector('a.card-link');
+    return {
+        title: text(card, 'span.card-model'),
+        price: text(card, 'span.card-price'),
+        features: Array.from(
+            card.querySelectorAll('div.card-features > span.features-container')
+        ).map(f => f.innerText.trim()),
+        pro_seller: card.querySelector('div.card-brand-logo') !== null,
+        link: link ? link.href : null
+    };
+};
+"""
+
+# Sérialise toutes les cartes côté navigateur : un seul execute_script pour la page entière
+EXTRACT_CARDS_JS = """
+const selector = arguments[0];
+""" + _SERIALIZE_CARD_JS + """
+return JSON.stringify(Array.from(document.querySelectorAll(selector)).map(serialize));
+"""
+
+# Extraction incrémentale : seules les cartes ajoutées depuis l'appel précédent sont
+# sérialisées puis marquées. Le premier appel lit les cartes présentes et installe un
+# MutationObserver qui collecte les suivantes : chaque étape ne parcourt que les nœuds
+# nouveaux, jamais les cartes déjà lues. Avec `prune`, leur contenu est retiré (coquille
+# de même hauteur : le scroll et le compte des cartes restent valides).
+SCAN_CARDS_JS = """
+const [selector, prune] = arguments;
+""" + _SERIALIZE_CARD_JS + """
+let scan = window.__a24Scan;
+const collect = records => {
+    for (const record of records) {
+        for (const node of record.addedNodes) {
+            if (node.nodeType !== Node.ELEMENT_NODE) continue;
+            if (node.matches(selector)) scan.pending.push(node);
+            else scan.pending.push(...node.querySelectorAll(selector));
+        }
+    }
+};
+if (!scan || scan.selector !== selector) {
+    if (scan) scan.observer.disconnect();
+    scan = window.__a24Scan = {selector: selector, pending: Array.from(document.querySelectorAll(selector))};
+    scan.observer = new MutationObserver(collect);
+    scan.observer.observe(document.body, {childList: true, subtree: true});
+}
+collect(scan.observer.takeRecords());
+const fresh = Array.from(new Set(scan.pending)).filter(card => card.isConnected && !card.hasAttribute('data-a24-seen'));
+scan.pending = [];
+const cards = fresh.map(serialize);
+const heights = prune ? fresh.map(card => card.offsetHeight) : [];
+fresh.forEach((card, i) => {
+    card.setAttribute('data-a24-seen', '1');
+    if (prune) {
+        card.style.height = heights[i] + 'px';
+        card.replaceChildren();
+    }
+});
+return JSON.stringify(cards);
+"""
+
+# État de la page, relevé seulement aux échantillons (compter les nœuds parcourt tout le DOM)
+PAGE_STATS_JS = """
+return {
+    heap: performance.memory ? performance.memory.usedJSHeapSize : null,
+    nodes: document.getElementsByTagName('*').length
+};
+"""
+
+
+def extract_cards(driver, selector=CARD_SELECTOR):
+    """Renvoie la liste des cartes (dictionnaires) présentes dans le DOM"""
+    return json.loads(driver.execute_script(EXTRACT_CARDS_JS, selector) or "[]")
+
+
+def scan_new_cards(driver, selector=CARD_SELECTOR, prune=True):
+    """Cartes apparues depuis l'appel précédent
+
+    Le coût d'un appel ne dépend que du nombre de cartes nouvelles ; avec `prune`, les
+    cartes lues sont vidées dans le navigateur et la mémoire reste stable sur de très
+    longues sessions de scroll.
+    """
+    return json.loads(driver.execute_script(SCAN_CARDS_JS, selector, prune) or "[]")
+
+
+class ScanMonitor:
+    """Suivi d'un scan incrémental : temps d'extraction par carte, tas JS, nœuds DOM et RSS du navigateur.
+
+    Un échantillon est relevé (et affiché) toutes les `sample_every` cartes ; `summary`
+    compare le premier et le dernier pour vérifier que la mémoire reste plate.
+    """
+
+    def __init__(self, driver, sample_every=500):
+        self.driver = driver
+        self.sample_every = sample_every
+        self.cards = 0
+        self.extract_s = 0.0
+        self.samples = []
+        self._window_cards = 0
+        self._window_s = 0.0
+
+    def record(self, cards, seconds):
+        """Une extraction de `cards` cartes en `seconds` secondes"""
+        self.cards += cards
+        self.extract_s += seconds
+        self._window_cards += cards
+        self._window_s += seconds
+        if cards and instrumentation.metrics.enabled:
+            instrumentation.metrics.observe("extract", "card", seconds / cards)
+        if self._window_cards and (not self.samples or self._window_cards >= self.sample_every):
+            self._sample()
+
+    def _sample(self):
+        from driver_factory import browser_rss_mb
+
+        page = self.driver.execute_script(PAGE_STATS_JS) or {}
+        heap = page.get("heap")
+        sample = {
+            "cards": self.cards,
+            "ms_per_card": 1000 * self._window_s / self._window_cards,
+            "heap_mb": heap / (1024 * 1024) if heap else None,
+            "dom_nodes": page.get("nodes"),
+            "rss_mb": browser_rss_mb(self.driver),
+        }
+        self.samples.append(sample)
+        self._window_cards = 0
+        self._window_s = 0.0
+        print(f"🧠 {sample['cards']} cartes : {sample['ms_per_card']:.2f} ms/carte, "
+              f"tas JS {_mb(sample['heap_mb'])}, {sample['dom_nodes']} nœuds DOM, RSS {_mb(sample['rss_mb'])}")
+
+    def summary(self):
+        if not self.samples:
+            return
+        first, last = self.samples[0], self.samples[-1]
+        print(f"🧠 Scan : {self.cards} cartes en {self.extract_s:.1f}s d'extraction ; "
+              f"ms/carte {first['ms_per_card']:.2f} -> {last['ms_per_card']:.2f}, "
+              f"nœuds DOM {first['dom_nodes']} -> {last['dom_nodes']}, "
+              f"tas JS {_mb(first['heap_mb'])} -> {_mb(last['heap_mb'])}, "
+              f"RSS {_mb(first['rss_mb'])} -> {_mb(last['rss_mb'])}")
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"cards": self.cards, "extract_s": self.extract_s, "samples": self.samples}, f, indent=2)
+        return path
+
+
+def _mb(value):
+    return f"{value:.0f} Mo" if value is not None else "?"
+
+
+def feature_text(features, index, is_mileage=False):
+    """Dernière ligne d'une caractéristique de carte (sans l'unité pour le kilométrage)"""
+    if len(features) <= index or not features[index]:
+        return "N/A"
+    text = features[index].split('\n')[-1]
+    return text.replace('RW', '').strip() if is_mileage else text.strip()
+
+
+
+def vehicle_id_from_url(url):
+    """Identifiant du véhicule = dernier segment de l'URL de l'annonce"""
+    if not url or url == "N/A":
+        return None
+    return url.rstrip("/").split("/")[-1] or None
@@ -0,0 +1,129 @@
+# listing_shards.py
+"""Crawl des pages de résultats adressées par URL, réparties sur plusieurs workers."""
+from urllib.parse import urlencode
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+from browser_profile import discard_network_log
+from detail_pool import iter_pool
+from driver_factory import BrowserSessions
+from listing_cards import CARD_SELECTOR, extract_cards, vehicle_id_from_url
+from rate_limit import limited_driver_get
+
+LISTING_URL = "https://auto24.ma/buy-cars"
+PAGE_PARAM = "page"
+
+
+def page_url(page, filters=None, base_url=LISTING_URL, page_param=PAGE_PARAM):
+    """URL d'une page de résultats, éventuellement restreinte à une tranche (marque, carburant...)"""
+    params = dict(filters or {})
+    params[page_param] = page
+    return f"{base_url}?{urlencode(params)}"
+
+
+def fetch_listing_page(driver, url, timeout=15):
+    """Charge une page de résultats et renvoie ses cartes ([] si la page est vide)"""
+    limited_driver_get(driver, url)
+    try:
+        WebDriverWait(driver, timeout).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, CARD_SELECTOR)))
+    except TimeoutException:
+        return []
+    finally:
+        discard_network_log(driver)
+    return extract_cards(driver, CARD_SELECTOR)
+
+
+def iter_listing_pages(driver_factory, slices=None, workers=4, max_pages=None,
+                       base_url=LISTING_URL, page_param=PAGE_PARAM, min_interval=0.0, driver_pool=None):
+    """Parcourt les pages de chaque tranche en parallèle et rend les cartes, dédoublonnées par véhicule.
+
+    Générateur : chaque carte nouvelle est rendue dès que sa page est lue, dans l'ordre des pages.
+    Sa valeur de retour indique si le crawl est complet : chaque tranche s'est terminée
+    sur une page vide, sans page en échec ni coupure par `max_pages`.
+
+    Les pages sont distribuées par vagues d'environ `4 * workers` ; une tranche s'arrête à la
+    première page sans carte nouvelle (ou à `max_pages`). Les navigateurs sont conservés
+    d'une vague à l'autre : ceux de `driver_pool` (BrowserSessions) s'il est fourni, sinon
+    ceux d'un pool privé fermé à la fin du crawl.
+    """
+    slices = list(slices) if slices else [{}]
+    next_page = {index: 1 for index in range(len(slices))}
+    active = set(next_page)
+    seen = set()
+    failed = set()
+    # Une tranche dont la dernière page avait des cartes, toutes déjà vues (site qui ignore
+    # le paramètre de page, recouvrement entre tranches), n'est pas lue jusqu'au bout
+    complete = True
+    total = 0
+
+    def handle(ctx, task):
+        slice_index, page = task
+        url = page_url(page, slices[slice_index], base_url, page_param)
+        return fetch_listing_page(ctx.driver, url)
+
+    def on_error(task, exc):
+        print(f"⚠️ Page {task[1]} (tranche {task[0]}) en échec : {str(exc)[:50]}")
+        failed.add(task)
+        return []
+
+    owned_pool = driver_pool is None
+    if owned_pool:
+        driver_pool = BrowserSessions(driver_factory)
+
+    try:
+        while active:
+            # Une vague : quelques pages d'avance pour chaque tranche encore ouverte
+            wave = []
+            per_slice = max(1, (4 * workers) // len(active))
+            for slice_index in sorted(active):
+                for _ in range(per_slice):
+                    page = next_page[slice_index]
+                    if max_pages and page > max_pages:
+                        break
+                    wave.append((slice_index, page))
+                    next_page[slice_index] = page + 1
+            if not wave:
+                break
+
+            exhausted = set()
+            for position, page_cards in iter_pool(wave, handle, driver_factory, workers=workers,
+                                                  on_error=on_error, min_interval=min_interval,
+                                                  driver_pool=driver_pool):
+                slice_index, page = wave[position]
+                new_cards = 0
+                for card in page_cards:
+                    vehicle_id = vehicle_id_from_url(card.get("link"))
+                    key = vehicle_id or (card.get("title"), card.get("price"))
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    new_cards += 1
+                    yield card
+                if new_cards == 0:
+                    if slice_index not in exhausted and (page_cards or (slice_index, page) in failed):
+                        complete = False
+                    exhausted.add(slice_index)
+                total += new_cards
+                print(f"📄 Tranche {slice_index} page {page} : {len(page_cards)} cartes, {new_cards} nouvelles")
+
+            active -= exhausted
+            if any(max_pages and next_page[index] > max_pages for index in active):
+                complete = False
+            active = {index for index in active if not (max_pages and next_page[index] > max_pages)}
+    finally:
+        if owned_pool:
+            driver_pool.close_all()
+
+    print(f"✅ {total} annonces uniques sur {len(slices)} tranche(s)" + ("" if complete else " (crawl incomplet)"))
+    return complete
+
+
+def crawl_listing_pages(driver_factory, slices=None, workers=4, max_pages=None,
+                        base_url=LISTING_URL, page_param=PAGE_PARAM, min_interval=0.0, driver_pool=None):
+    """Version liste de `iter_listing_pages`"""
+    return list(iter_listing_pages(driver_factory, slices, workers, max_pages, base_url, page_param,
+                                   min_interval, driver_pool))
@@ -1,50 +1,155 @@
 # main.py
 import os
 import re
+import argparse
 import csv
 import time
-import requests
+import functools
+import threading
 from datetime import datetime
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-from tenacity import retry, stop_after_attempt, wait_fixed
-
-def main():
-    """Fonction principale pour exécuter le scraper complet."""
+from tenacity import retry, stop_after_attempt, wait_random_exponential
+from detail_pool import iter_pool, WorkerContext
+from parsing import empty_details, apply_spec, details_to_row
+from fast_details import create_http_session, fetch_car_details, parse_car_details, download_image_url
+from listing_cards import CARD_SELECTOR, ScanMonitor, scan_new_cards, feature_text, vehicle_id_from_url
+from scroll import iter_scroll
+from listing_shards import LISTING_URL, iter_listing_pages
+from image_downloader import ImageDownloader
+from image_store import ImageStore
+from image_processing import ImageProcessor
+from crawl_state import CrawlState, SnapshotDiff, DONE, UNCHANGED
+from writers import open_writers, CsvRowWriter
+from catalog_index import DEFAULT_INDEX_PATH
+from work_queue import DEFAULT_QUEUE_PATH, open_queue, run_worker
+from records import ListingRecord, CarRecord, LISTING_HEADERS, DETAILED_HEADERS, normalize_batch
+import instrumentation
+import response_cache
+import page_archive
+from rate_limit import limited_driver_get
+from field_probe import (FieldReport, wait_page_ready, snapshot_details, TRANSIENT_ERRORS,
+                         MISSING, STALE, NOT_LOADED, INVALID)
+from instrumentation import Progress
+from driver_factory import BrowserSessions, chrome_service
+from browser_profile import (LeanProfile, PageWeightTracker, apply_lean_options, activate_lean_profile,
+                             discard_network_log)
+from cdp_engine import CdpEngine, CdpError, BACKGROUND_TAB_ARGS
+
+# Lignes normalisées ensemble avant écriture (voir records.normalize_batch)
+NORMALIZE_BATCH = 32
+
+# Détails d'une annonce inchangée revisités au-delà de cet âge (secondes)
+DETAILS_MAX_AGE = 7 * 24 * 3600
+
+def main(resume=True, extra_outputs=(), listing_mode="scroll", listing_workers=4, instrument=False, delta=True,
+         index=True, save_listings=True, cache=False, cache_only=False, archive=True):
+    """Fonction principale pour exécuter le scraper complet.
+
+    Les deux étapes tournent en même temps : chaque annonce de l'étape 1 est confiée
+    aux workers de l'étape 2 dès son extraction, via une file bornée qui freine le scan
+    si les pages de détail prennent du retard.
+    Avec `resume`, un run interrompu reprend là où il s'est arrêté : si son étape 1
+    était complète, elle est sautée et seules les annonces dont les détails ne sont pas
+    terminés sont visitées ; sinon le scan est relancé.
+    `extra_outputs` : sorties supplémentaires du fichier de détails (.ndjson, .parquet, .arrow).
+    `listing_mode="pages"` remplace le scroll par le crawl parallèle des pages de résultats.
+    `instrument` mesure les appels WebDriver, attentes, sleeps et requêtes HTTP et écrit
+    data/metrics.json et data/metrics.prom en fin de run.
+    `delta` ne revisite que les annonces nouvelles ou modifiées depuis le run précédent
+    (empreinte de la carte) ; `delta=False` force la visite de toutes les pages de détail.
+    `index` met à jour au fil de l'eau l'index de recherche data/auto24_index.sqlite
+    (voir catalog_index).
+    `save_listings` écrit en plus les annonces de l'étape 1 dans data/auto24_listings.csv.
+    `cache` sert les pages et images depuis le cache disque data/http_cache tant qu'elles
+    sont valides (voir response_cache ; pour le développement, un run de production doit
+    voir les pages à jour). `cache_only` rejoue hors ligne les annonces du dernier run :
+    aucune requête réseau ni navigateur, l'état du crawl n'est pas modifié.
+    `archive` ajoute le HTML de chaque page de détail à data/page_archive, d'où
+    `python page_archive.py --reparse` reconstruit les détails sans recrawler.
+    """
     print("🚗 Démarrage du scraper Auto24.ma...")
-    
-    # Étape 1 : Scraping des annonces de base
-    print("\n📋 ÉTAPE 1 : Scraping des annonces principales...")
+    if instrument:
+        instrumentation.enable()
+    state = CrawlState()
+    # Navigateurs chauds partagés par les deux étapes : un seul démarrage à froid par processus
+    sessions = BrowserSessions(functools.partial(init_auto24_driver, lean=LeanProfile()))
+    basic_csv = os.path.join("data", "auto24_listings.csv") if save_listings else None
+    http_cache = response_cache.enable(offline=cache_only) if cache or cache_only else None
+    pages = page_archive.enable() if archive else None
+
+    if cache_only:
+        listings_csv = os.path.join("data", "auto24_listings.csv")
+        if os.path.exists(listings_csv):
+            listings = read_listings(listings_csv)
+        else:
+            listings = [ListingRecord.from_row(row) for row in state.listing_rows()]
+        total = len(listings)
+        basic_csv = None
+        print(f"\n📴 Mode hors ligne : {total} annonces du dernier run rejouées depuis le cache")
+    elif resume and state.has_unfinished_run() and state.listing_finished():
+        listings = [ListingRecord.from_row(row) for row in state.listing_rows()]
+        total = len(listings)
+        print(f"\n♻️ Reprise du run {state.run_id} : {state.count('details', DONE)}/{total} annonces déjà détaillées")
+    else:
+        if resume and state.has_unfinished_run():
+            print(f"\n♻️ Run {state.run_id} interrompu pendant l'étape 1 : scan relancé")
+        # Étape 1 : annonces de base, transmises à l'étape 2 au fil de l'eau
+        print("\n📋 ÉTAPE 1 : Scraping des annonces principales (en flux vers l'étape 2)...")
+        if listing_mode == "pages":
+            source = iter_auto24_pages(workers=listing_workers, sessions=sessions)
+        else:
+            source = iter_auto24(sessions=sessions,
+                                 metrics_path=os.path.join("data", "scan_metrics.json") if instrument else None)
+        listings = record_listings(source, state, delta=delta, listings_csv=basic_csv)
+        total = None
+
+    # Étape 2 : Scraping détaillé avec images
+    print("\n🔍 ÉTAPE 2 : Scraping détaillé et téléchargement des images...")
+    detailed_csv = os.path.join("data", "auto24_details.csv")
+    if index:
+        extra_outputs = tuple(extra_outputs) + (DEFAULT_INDEX_PATH,)
     try:
-        basic_data = scrape_auto24(max_scrolls=5)
-    except Exception as e:
-        print(f"❌ Erreur critique lors du scraping : {str(e)[:100]}")
-        return
-
-    if not basic_data or len(basic_data) == 0:
+        processed = process_listings(listings, detailed_csv, state=None if cache_only else state,
+                                     extra_outputs=extra_outputs, sessions=sessions, progress=instrument,
+                                     total=total)
+    finally:
+        sessions.close_all()
+        if http_cache is not None:
+            http_cache.summary()
+            response_cache.disable()
+        if pages is not None:
+            pages.summary()
+            page_archive.disable()
+
+    if not processed:
         print("❌ Aucune donnée trouvée. Arrêt du programme.")
+        state.close()
         return
-    
-    # Étape 2 : Sauvegarde des annonces de base
-    basic_csv = save_to_csv(basic_data, "auto24_listings.csv")
-    
-    # Étape 3 : Scraping détaillé avec images
-    print("\n🔍 ÉTAPE 2 : Scraping détaillé et téléchargement des images...")
-    detailed_csv = os.path.join("data", "auto24_details.csv")
-    process_csv(basic_csv, detailed_csv)
+    if not cache_only:
+        state.finish_run()
+    state.close()
+
+    if instrument:
+        instrumentation.metrics.write_json(os.path.join("data", "metrics.json"))
+        instrumentation.metrics.write_prometheus(os.path.join("data", "metrics.prom"))
+        print("📊 Mesures : data/metrics.json, data/metrics.prom")
     
     print("\n✅ SCRAPING TERMINÉ AVEC SUCCÈS !")
-    print(f"Annonces de base : {basic_csv}")
+    if basic_csv:
+        print(f"Annonces de base : {basic_csv}")
     print(f"Détails complets : {detailed_csv}")
-    print(f"Images téléchargées : data/images/[dossiers_annonces]")
+    print(f"Images : data/images/objects (manifestes dans data/images/manifests)")
+
+def init_auto24_driver(headless=True, lean=None, extra_args=()):
+    """Initialise le driver Chrome avec les options personnalisées
 
-def init_auto24_driver(headless=True):
-    """Initialise le driver Chrome avec les options personnalisées"""
+    `lean` (LeanProfile) active le profil léger : chargement eager et blocage des
+    images, polices, médias et traceurs tiers. `extra_args` : options Chrome en plus.
+    """
     options = Options()
     options.add_argument("--start-maximized")
     options.add_argument("--window-size=1920,1080")
@@ -54,9 +159,17 @@ def init_auto24_driver(headless=True):
     options.add_experimental_option("excludeSwitches", ["enable-automation"])
     options.add_experimental_option("useAutomationExtension", False)
     options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
+    for argument in extra_args:
+        options.add_argument(argument)
+
+    if lean is not None:
+        apply_lean_options(options, lean)
 
-    service = Service(ChromeDriverManager().install())
-    return webdriver.Chrome(service=service, options=options)
+    service = chrome_service()
+    driver = webdriver.Chrome(service=service, options=options)
+    if lean is not None:
+        activate_lean_profile(driver, lean)
+    return instrumentation.instrument_driver(driver)
 
 def create_folder_name(title, idx):
     """Crée un nom de dossier valide pour stocker les images d'une annonce."""
@@ -64,307 +177,592 @@ def create_folder_name(title, idx):
     folder_name = re.sub(r'\s+', '_', folder_name)[:50]
     return f"{idx}_{folder_name}"
 
-def extract_feature(features, index, is_mileage=False):
-    """Extrait une caractéristique spécifique"""
-    try:
-        if len(features) > index:
-            text = features[index].text.strip()
-            return text.split('\n')[-1].replace('RW', '').strip() if is_mileage else text.split('\n')[-1].strip()
-        return "N/A"
-    except:
-        return "N/A"
-
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
-def extract_text_safe(parent, selector):
-    """Extrait le texte d'un élément en toute sécurité"""
-    try:
-        element = WebDriverWait(parent, 5).until(
-            EC.visibility_of_element_located((By.CSS_SELECTOR, selector)))
-        return element.text.strip()
-    except:
-        return "N/A"
-
-def scrape_auto24(max_scrolls=5):
-    """Scrape les annonces de voitures sur Auto24.ma avec chargement infini"""
-    driver = init_auto24_driver()
-    data = []
+def iter_auto24(target_count=None, time_budget=300, sessions=None, listing_url=LISTING_URL, prune=True,
+                metrics_path=None):
+    """Générateur : annonces (ListingRecord normalisés) rendues au fil du chargement infini
+
+    Après chaque étape de scroll, seules les cartes apparues depuis l'étape précédente
+    sont extraites puis rendues aussitôt ; les doublons (même véhicule) sont ignorés.
+    Avec `prune`, les cartes lues sont vidées dans la page pour que la mémoire du
+    navigateur et le coût de l'extraction restent constants sur des dizaines de milliers
+    d'annonces (voir listing_cards.ScanMonitor ; échantillons écrits dans `metrics_path`).
+    Le scroll s'arrête à `target_count` annonces, à la fin du catalogue ou après
+    `time_budget` secondes. Avec `sessions` (BrowserSessions), le navigateur est
+    emprunté puis rendu au pool. La valeur de retour du générateur indique si le scan
+    est complet (fin du catalogue atteinte, sans erreur).
+    """
+    driver = sessions.acquire() if sessions is not None else init_auto24_driver()
+    monitor = ScanMonitor(driver)
+    seen = set()
+    duplicates = 0
     listing_id_counter = 1
+    scroll_stats = None
+    complete = False
 
     try:
-        driver.get("https://auto24.ma/buy-cars")
-        
-        # Logique de scroll améliorée
-        last_height = driver.execute_script("return document.body.scrollHeight")
-        scroll_attempts = 0
-        
-        while scroll_attempts < max_scrolls:
-            driver.execute_script("window.scrollBy(0, window.innerHeight * 0.8)")
-            time.sleep(2)
-            new_height = driver.execute_script("return document.body.scrollHeight")
-            if new_height == last_height:
-                break
-            last_height = new_height
-            scroll_attempts += 1
+        with instrumentation.stage("listing_scan"):
+            limited_driver_get(driver, listing_url)
 
-        listings = WebDriverWait(driver, 30).until(
-            EC.presence_of_all_elements_located((By.CSS_SELECTOR, "div.card-holder"))
-        )
-        
-        print(f"✅ {len(listings)} annonces trouvées au total")
+            WebDriverWait(driver, 30).until(
+                EC.presence_of_all_elements_located((By.CSS_SELECTOR, CARD_SELECTOR))
+            )
 
-        for listing in listings:
-            try:
-                driver.execute_script("arguments[0].scrollIntoView({block: 'center', behavior: 'auto'});", listing)
-                time.sleep(0.5)
-
-                title = extract_text_safe(listing, "span.card-model")
-                price = extract_text_safe(listing, "span.card-price")
-                
-                features = listing.find_elements(By.CSS_SELECTOR, "div.card-features > span.features-container")
-                transmission = extract_feature(features, 0)
-                fuel_type = extract_feature(features, 1)
-                mileage = extract_feature(features, 2, True)
-                
-                seller_type = "Professionnel" if listing.find_elements(By.CSS_SELECTOR, "div.card-brand-logo") else "Particulier"
-                
+            # Scroll piloté par les événements (nouvelles cartes, réseau au repos, loader)
+            steps = iter_scroll(driver, CARD_SELECTOR, target_count=target_count, time_budget=time_budget)
+
+        finished = False
+        while not finished:
+            with instrumentation.stage("listing_scan"):
+                try:
+                    next(steps)
+                except StopIteration as stop:
+                    scroll_stats = stop.value
+                    finished = True
+                # Extraction groupée des nouvelles cartes : un seul appel JavaScript par étape
+                started = time.perf_counter()
+                cards = scan_new_cards(driver, CARD_SELECTOR, prune=prune)
+                monitor.record(len(cards), time.perf_counter() - started)
+                # Profil léger suivi : le log réseau du scroll ne doit pas s'accumuler
+                discard_network_log(driver)
+
+            batch = []
+            for card in cards:
+                if target_count and listing_id_counter > target_count:
+                    finished = True
+                    break
+                key = vehicle_id_from_url(card.get("link")) or (card.get("title"), card.get("price"))
+                if key in seen:
+                    duplicates += 1
+                    continue
+                seen.add(key)
                 try:
-                    link_element = listing.find_element(By.CSS_SELECTOR, "a.card-link")
-                    link = link_element.get_attribute("href")
-                    vehicle_id = link.split("/")[-1]
+                    batch.append(_card_to_listing(card, listing_id_counter))
+                    listing_id_counter += 1
                 except Exception as e:
-                    link = "N/A"
-
-                folder_name = create_folder_name(title, listing_id_counter)
-                
-                data.append([
-                    listing_id_counter,
-                    title,
-                    _clean_price(price),
-                    transmission,
-                    fuel_type,
-                    mileage,
-                    seller_type,
-                    link,
-                    folder_name
-                ])
-                
-                listing_id_counter += 1
-                print(f"✔ Annonce {listing_id_counter - 1} traitée")
+                    print(f"⚠️ Erreur annonce {listing_id_counter}: {str(e)[:50]}...")
+            yield from normalize_batch(batch)
 
-            except Exception as e:
-                print(f"⚠️ Erreur annonce {listing_id_counter}: {str(e)[:50]}...")
-                continue
+        print(f"✅ {monitor.cards} cartes lues, {duplicates} doublons ignorés")
+        print(f"✔ {listing_id_counter - 1} annonces traitées")
+        monitor.summary()
+        if metrics_path:
+            print(f"📊 Mesures du scan : {monitor.write_json(metrics_path)}")
+        complete = scroll_stats is not None and scroll_stats.stop_reason == "end"
 
     except Exception as e:
         print(f"❌ Erreur critique : {str(e)[:50]}...")
     finally:
-        driver.quit()
-    
-    return data
-
-def _clean_price(price_str):
-    """Nettoyage du prix"""
-    try:
-        return int(price_str.replace('DH', '').replace(' ', '').replace('\u202f', '').strip())
-    except:
-        return 0
+        if sessions is not None:
+            sessions.release(driver)
+        else:
+            driver.quit()
+    return complete
+
+def scrape_auto24(target_count=None, time_budget=300, sessions=None, listing_url=LISTING_URL, prune=True):
+    """Scrape les annonces de voitures sur Auto24.ma avec chargement infini (version liste de `iter_auto24`)"""
+    return list(iter_auto24(target_count, time_budget, sessions, listing_url, prune))
+
+def iter_auto24_pages(slices=None, workers=4, max_pages=None, sessions=None):
+    """Variante de `iter_auto24` qui lit les pages de résultats par URL, en parallèle
+
+    `slices` : liste de filtres (ex. [{"brand": "renault"}, {"fuel": "diesel"}]) crawlés
+    comme des tranches indépendantes ; les cartes sont dédoublonnées par véhicule.
+    Renvoie, comme `iter_auto24`, True si toutes les tranches ont été lues jusqu'au bout.
+    """
+    cards = iter_listing_pages(init_auto24_driver, slices=slices, workers=workers, max_pages=max_pages,
+                               driver_pool=sessions)
+    listing_id = 1
+    while True:
+        try:
+            card = next(cards)
+        except StopIteration as stop:
+            return stop.value
+        yield normalize_batch([_card_to_listing(card, listing_id)])[0]
+        listing_id += 1
+
+def scrape_auto24_pages(slices=None, workers=4, max_pages=None, sessions=None):
+    """Version liste de `iter_auto24_pages`"""
+    return list(iter_auto24_pages(slices, workers, max_pages, sessions))
+
+def _card_to_listing(card, listing_id):
+    """Construit l'annonce (valeurs brutes, à normaliser par lot) d'une carte extraite par `extract_cards`"""
+    title = card.get("title")
+    features = card.get("features") or []
+
+    return ListingRecord(
+        listing_id=listing_id,
+        title=title,
+        price=card.get("price"),
+        gearbox=feature_text(features, 0),
+        fuel=feature_text(features, 1),
+        mileage=feature_text(features, 2, True),
+        seller="Professionnel" if card.get("pro_seller") else "Particulier",
+        url=card.get("link"),
+        folder=create_folder_name(title or "N/A", listing_id)
+    )
 
 def save_to_csv(data, filename):
-    """Sauvegarde les données dans un fichier CSV."""
-    output_folder = "data"
-    os.makedirs(output_folder, exist_ok=True)
-    output_file = os.path.join(output_folder, filename)
-
-    with open(output_file, "w", newline="", encoding="utf-8") as file:
-        writer = csv.writer(file, delimiter=';')
-        writer.writerow([
-            "ID", "Titre", "Prix", "Transmission", "Type de carburant", 
-            "Kilométrage", "Créateur", "URL de l'annonce", "Dossier d'images"
-        ])
-        writer.writerows(data)
+    """Sauvegarde les annonces (ListingRecord) dans un fichier CSV."""
+    output_file = os.path.join("data", filename)
+
+    with CsvRowWriter(output_file, LISTING_HEADERS) as writer:
+        writer.write_many(data)
 
     print(f"✅ Données sauvegardées dans {output_file}")
     return output_file
 
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
+def record_listings(listings, state, delta=True, listings_csv=None):
+    """Enregistre chaque annonce de l'étape 1 dès sa lecture, puis la rend à l'étape 2
+
+    L'empreinte de la carte est comparée à l'instantané précédent (historique des prix,
+    détails conservés si inchangée avec `delta`) et l'annonce est ajoutée au run courant ;
+    `listings_csv` reçoit en plus une copie des annonces. Une fois `listings` épuisé,
+    l'étape 1 est close ; les annonces non revues ne sont marquées retirées que si le
+    générateur `listings` renvoie True (scan complet, voir `iter_auto24`).
+    """
+    run_id = state.begin_run()
+    changes = SnapshotDiff([], [], [], [])
+    seen = set()
+    complete = False
+    writer = CsvRowWriter(listings_csv, LISTING_HEADERS) if listings_csv else None
+    listings = iter(listings)
+    try:
+        position = 0
+        while True:
+            try:
+                listing = next(listings)
+            except StopIteration as stop:
+                complete = bool(stop.value)
+                break
+            vehicle_id = listing.vehicle_id
+            if vehicle_id is not None and vehicle_id not in seen:
+                seen.add(vehicle_id)
+                change = state.observe_listing(vehicle_id, listing.fingerprint(), listing.price)
+                getattr(changes, change).append(vehicle_id)
+                state.add_listing(run_id, position, vehicle_id, listing.to_row(),
+                                  keep_done=delta and change == UNCHANGED, max_age=DETAILS_MAX_AGE)
+            if writer is not None:
+                writer.write(listing)
+            position += 1
+            yield listing
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if seen:
+        state.finish_listing()
+    # Un scan tronqué (budget, cible, erreur) ne doit pas retirer le reste du catalogue
+    if seen and complete:
+        changes.removed = state.mark_removed()
+    elif seen:
+        print("\n⚠️ Scan incomplet : aucune annonce marquée retirée")
+    print(f"\n{changes.summary()}")
+    if writer is not None:
+        print(f"✅ Données sauvegardées dans {listings_csv}")
+
+# Session partagée pour les téléchargements d'images hors ImageDownloader
+_image_session = create_http_session()
+
+@retry(stop=stop_after_attempt(3), wait=wait_random_exponential(multiplier=0.5, max=10))
 def download_image(driver, image_element, folder_path, image_name):
     """Télécharge une image depuis Auto24.ma avec la nouvelle structure"""
     try:
         # Faire défiler jusqu'à l'image pour activer le chargement
         driver.execute_script("arguments[0].scrollIntoView({behavior: 'auto', block: 'center'});", image_element)
-        time.sleep(0.5)
+        instrumentation.sleep(0.5)
         
         WebDriverWait(driver, 10).until(EC.visibility_of(image_element))
         image_url = image_element.get_attribute('src')
         
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Referer': driver.current_url
-        }
-
-        response = requests.get(image_url, headers=headers, stream=True, timeout=15)
-        response.raise_for_status()
-        
-        # Détection de l'extension
-        content_type = response.headers.get('Content-Type', '')
-        extension = '.webp'
-        if 'jpeg' in content_type:
-            extension = '.jpg'
-        elif 'png' in content_type:
-            extension = '.png'
-        
-        image_path = os.path.join(folder_path, f"{image_name}{extension}")
-        
-        with open(image_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-                
-        return os.path.basename(image_path)
+        return download_image_url(_image_session, image_url, folder_path, image_name,
+                                  referer=driver.current_url)
         
     except Exception as e:
         print(f"❌ Erreur image {image_name} : {str(e)[:80]}")
         return None
 
-def scrape_car_details(driver, url, folder_name):
-    """Scrape les détails complets avec la nouvelle structure d'images"""
+def queue_images(downloader, image_urls, listing_url, store=None):
+    """Range les images d'une annonce dans le store (en arrière-plan via `downloader` si fourni)"""
+    vehicle_id = vehicle_id_from_url(listing_url)
+    if downloader is not None:
+        downloader.submit_listing(vehicle_id, listing_url, image_urls)
+        return
+
+    # Store temporaire (appel direct sans downloader) : fermé avant de rendre la main
+    owned = store is None
+    store = store or ImageStore()
+    try:
+        entries = []
+        for idx, image_url in enumerate(image_urls[:10], 1):
+            try:
+                entries.append(store.fetch(_image_session, image_url, referer=listing_url))
+            except Exception as e:
+                print(f"❌ Erreur image image_{idx} : {str(e)[:80]}")
+        store.write_manifest(vehicle_id, listing_url, entries)
+    finally:
+        if owned:
+            store.close()
+
+def scrape_car_details(driver, url, downloader=None, cached=True):
+    """Scrape les détails complets ; les images sont confiées à `downloader` en arrière-plan
+
+    Avec le cache de réponses activé, une page déjà rendue est relue depuis le cache
+    (sauf `cached=False`) et chaque page chargée y est enregistrée ; avec l'archive
+    activée, son code source y est ajouté.
+    """
     if not url or url == "N/A":
         return ["N/A"] * 13
-    
+
+    if cached:
+        row = scrape_cached_page(url, downloader)
+        if row is not None:
+            return row
+
+    report = FieldReport(url)
     try:
-        driver.get(url)
-        WebDriverWait(driver, 15).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "div.ant-col.content-container")))
+        with instrumentation.stage("detail_load"):
+            limited_driver_get(driver, url)
+            wait_page_ready(driver, "div.ant-col.content-container")
 
-    except:
+    except Exception:
+        report.fail("page", NOT_LOADED)
         print(f"⚠️ Impossible de charger la page {url}")
         return ["N/A"] * 13
 
-    details = {
-        'date_mise_circulation': 'N/A',
-        'kilometrage': 0,
-        'carburant': 'N/A',
-        'transmission': 'N/A',
-        'places': 'N/A',
-        'carrosserie': 'N/A',
-        'nb_cles': 'N/A',
-        'couleur_ext': 'N/A',
-        'couleur_int': 'N/A',
-        'nb_proprietaires': 'N/A',
-        'condition': 'N/A',
-        'equipements': [],
-        'prix': 'N/A'
-    }
+    # Code source rendu : cache de réponses et archive des pages (voir page_archive)
+    if response_cache.default_cache is not None or page_archive.default_archive is not None:
+        page_html = driver.page_source
+        if response_cache.default_cache is not None:
+            response_cache.default_cache.put_page(url, page_html)
+        page_archive.archive_page(url, page_html, page_archive.RENDERED)
 
+    # Un seul instantané de tous les champs : un champ absent ne coûte plus de timeout
     try:
-        # Téléchargement des images
-        images_base_folder = os.path.join("data", "images")
-        listing_folder = os.path.join(images_base_folder, folder_name)
-        os.makedirs(listing_folder, exist_ok=True)
-        
-        try:
-            # Nouveau sélecteur d'images
-            images = WebDriverWait(driver, 10).until(
-                EC.presence_of_all_elements_located((By.CSS_SELECTOR, "div.carousel-image img")))
+        with instrumentation.stage("spec_parse"):
+            snapshot = snapshot_details(driver)
+    except TRANSIENT_ERRORS:
+        report.fail("page", STALE)
+        print(f"⚠️ Page instable, champs illisibles : {url}")
+        return ["N/A"] * 13
 
-            for idx, img in enumerate(images[:10], 1):
-                if img.get_attribute('src'):
-                    download_image(driver, img, listing_folder, f"image_{idx}")
-        except Exception as e:
-            print(f"⚠️ Erreur téléchargement images: {str(e)[:50]}")
+    row = details_from_snapshot(snapshot, url, report, downloader)
 
-        # Extraction des détails
-        try:
-            details['prix'] = extract_text_safe(driver, "span.card-price")
-        except:
-            pass
+    # Poids de la page (profil léger avec suivi réseau)
+    tracker = getattr(driver, "page_weight", None)
+    if tracker is not None:
+        tracker.record(url)
 
-        specs = driver.find_elements(By.CSS_SELECTOR, "div.specs-container div.spec-item")
-        for spec in specs:
-            try:
-                label = extract_text_safe(spec, "span.spec-label")
-                value = extract_text_safe(spec, "span.spec-value")
-                
-                if "Année" in label:
-                    details['date_mise_circulation'] = value
-                elif "Kilométrage" in label:
-                    details['kilometrage'] = int(value.replace('KM', '').replace(' ', '').strip())
-                elif "Carburant" in label:
-                    details['carburant'] = value
-                elif "Boîte de vitesses" in label:
-                    details['transmission'] = value
-                elif "Places" in label:
-                    details['places'] = value
-                elif "Carrosserie" in label:
-                    details['carrosserie'] = value
-            except:
-                continue
+    return row
 
+def details_from_snapshot(snapshot, url, report, downloader=None):
+    """Ligne de détails (13 colonnes) d'un instantané field_probe ; les images sont confiées à `downloader`"""
+    details = empty_details()
+
+    # Collecte des URLs d'images : le téléchargement se fait hors navigateur
+    if snapshot["images"]:
+        queue_images(downloader, snapshot["images"], url)
+    else:
+        report.fail("images", MISSING)
+
+    if snapshot["price"]:
+        details['prix'] = snapshot["price"]
+    else:
+        report.fail("prix", MISSING)
+
+    for spec in snapshot["specs"]:
+        label = spec["label"]
+        if not label:
+            report.fail("spec", MISSING)
+            continue
+        if not spec["value"]:
+            report.fail(label, MISSING)
+            continue
         try:
-            features = driver.find_elements(By.CSS_SELECTOR, "div.features-container div.feature-item")
-            details['equipements'] = [f.text.strip() for f in features if f.text.strip()]
-        except:
-            pass
+            apply_spec(details, label, spec["value"])
+        except ValueError:
+            report.fail(label, INVALID)
 
-    except Exception as e:
-        print(f"Erreur lors du scraping de {url} : {str(e)[:50]}...")
-
-    return [
-        details['date_mise_circulation'],
-        details['kilometrage'],
-        details['carburant'],
-        details['transmission'],
-        details['places'],
-        details['carrosserie'],
-        details['nb_cles'],
-        details['couleur_ext'],
-        details['couleur_int'],
-        details['nb_proprietaires'],
-        details['condition'],
-        ", ".join(details['equipements']),
-        details['prix']
-    ]
-
-def process_csv(input_csv, output_csv):
-    """Lit le CSV principal et scrape les détails supplémentaires pour chaque annonce"""
-    driver = init_auto24_driver()
-    
-    with open(input_csv, "r", encoding="utf-8") as file:
-        reader = csv.reader(file, delimiter=';')
-        headers = next(reader)
-        listings = [row for row in reader]
+    details['equipements'] = snapshot["features"]
+
+    return details_to_row(details)
 
-    new_headers = [
-        "ID", "Titre", "Prix", "Transmission", "Type de carburant", "Créateur", "URL de l'annonce",
-        "Date mise circulation", "Kilométrage", "Places", "Carrosserie", "Nombre de clés",
-        "Couleur extérieure", "Couleur intérieure", "Nombre propriétaires", "Condition", 
-        "Équipements", "Prix Détaillé"
-    ]
+def scrape_cached_page(url, downloader=None):
+    """Ligne de détails depuis le HTML rendu mis en cache par `scrape_car_details`, ou None"""
+    http_cache = response_cache.default_cache
+    page_html = http_cache.get_page(url) if http_cache is not None else None
+    if page_html is None:
+        return None
+    with instrumentation.stage("spec_parse"):
+        parsed = parse_car_details(page_html, base_url=url)
+    queue_images(downloader, parsed.image_urls, url)
+    return details_to_row(parsed.details)
 
-    detailed_data = [new_headers]
+def scrape_car_details_cdp(engine, url, downloader=None):
+    """Comme `scrape_car_details`, dans un onglet du navigateur partagé (voir cdp_engine.CdpEngine)"""
+    if not url or url == "N/A":
+        return ["N/A"] * 13
 
-    for idx, row in enumerate(listings, start=1):
-        try:
-            url = row[7]
-            folder_name = row[8]
-            
-            print(f"🔎 Traitement annonce {idx}/{len(listings)} : {url}")
-            details = scrape_car_details(driver, url, folder_name)
-            
-            combined_data = row[:7] + details
-            detailed_data.append(combined_data)
-            
-        except Exception as e:
-            print(f"❌ Erreur avec l'annonce {idx} : {str(e)[:50]}...")
-            continue
+    report = FieldReport(url)
+    try:
+        with instrumentation.stage("detail_load"):
+            snapshot = engine.snapshot(url)
+    except CdpError:
+        report.fail("page", STALE)
+        print(f"⚠️ Page instable, champs illisibles : {url}")
+        return ["N/A"] * 13
 
-    driver.quit()
+    if snapshot is None:
+        report.fail("page", NOT_LOADED)
+        print(f"⚠️ Impossible de charger la page {url}")
+        return ["N/A"] * 13
 
-    os.makedirs(os.path.dirname(output_csv), exist_ok=True)
-    with open(output_csv, "w", newline="", encoding="utf-8") as file:
-        writer = csv.writer(file, delimiter=';')
-        writer.writerows(detailed_data)
+    return details_from_snapshot(snapshot, url, report, downloader)
 
-    print(f"✅ Données enrichies sauvegardées dans {output_csv}")
+def scrape_car_details_fast(ctx, url, downloader=None):
+    """Scrape une page de détail via HTTP + lxml, avec repli Selenium si le parsing est incomplet"""
+    if not url or url == "N/A":
+        return ["N/A"] * 13
+
+    try:
+        parsed = fetch_car_details(ctx.session, url)
+    except Exception as e:
+        print(f"⚠️ Échec HTTP pour {url} : {str(e)[:50]}")
+        parsed = None
+
+    if parsed is None or not parsed.complete:
+        row = scrape_cached_page(url, downloader)
+        if row is not None:
+            return row
+        if response_cache.default_cache is not None and response_cache.default_cache.offline:
+            FieldReport(url).fail("page", NOT_LOADED)
+            print(f"📴 Page absente du cache : {url}")
+            return ["N/A"] * 13
+        print(f"↩️ Repli Selenium pour {url}")
+        return scrape_car_details(ctx.driver, url, downloader, cached=False)
+
+    page_archive.archive_page(url, parsed.page_html)
+    queue_images(downloader, parsed.image_urls, url)
+
+    return details_to_row(parsed.details)
+
+def read_listings(input_csv):
+    """Annonces (ListingRecord normalisés) du CSV de l'étape 1"""
+    with open(input_csv, "r", encoding="utf-8") as file:
+        reader = csv.reader(file, delimiter=';')
+        next(reader)
+        return normalize_batch([ListingRecord.from_row(row) for row in reader])
+
+def process_csv(input_csv, output_csv, workers=4, min_interval=0.0, engine="http", image_workers=8,
+                state=None, extra_outputs=(), lean=True, sessions=None, progress=False, postprocess_images=False):
+    """Lit le CSV principal et scrape les détails supplémentaires pour chaque annonce (voir `process_listings`)"""
+    listings = read_listings(input_csv)
+    return process_listings(listings, output_csv, workers, min_interval, engine, image_workers, state,
+                            extra_outputs, lean, sessions, progress, postprocess_images, total=len(listings))
+
+def process_listings(listings, output_csv, workers=4, min_interval=0.0, engine="http", image_workers=8,
+                     state=None, extra_outputs=(), lean=True, sessions=None, progress=False,
+                     postprocess_images=False, total=None):
+    """Scrape les détails de chaque annonce de `listings` (ListingRecord) ; renvoie le nombre d'annonces lues
+
+    `listings` peut être un générateur (étape 1 en cours) : les annonces sont confiées
+    aux `workers` workers au fil de l'eau, via une file bornée, et les lignes sont
+    écrites dans l'ordre des annonces. Avec engine="http", les pages sont lues via HTTP
+    et Chrome n'est démarré qu'en cas de repli ("selenium" force le navigateur pour
+    toutes les pages ; "cdp" les ouvre dans `workers` onglets d'un seul Chrome, voir
+    cdp_engine). Avec un `state` (CrawlState), chaque ligne est enregistrée dès
+    qu'elle est produite et les annonces déjà terminées sont reprises depuis l'état.
+    `extra_outputs` ajoute des sorties en flux (.ndjson, .parquet, .arrow) à côté du CSV.
+    `lean` démarre les drivers avec le profil léger (voir browser_profile.LeanProfile).
+    `sessions` (BrowserSessions) fournit des navigateurs déjà démarrés, rendus au pool à la fin.
+    `progress` affiche une ligne de progression (débit et temps restant si `total` est connu).
+    `postprocess_images` calcule miniatures, hash perceptuels et formats normalisés des
+    nouvelles images dans un pool de processus (voir image_processing, nécessite Pillow).
+    """
+    PageWeightTracker.reset()
+    FieldReport.reset()
+    skipped = [0]
+    skipped_lock = threading.Lock()
+
+    def handle(ctx, item):
+        idx, listing = item
+        url = listing.url
+        vehicle_id = listing.vehicle_id
+        # Annonce déjà détaillée lors d'un run précédent (ou inchangée) : reprise depuis l'état
+        if state is not None and vehicle_id and state.is_done(vehicle_id, "details"):
+            with skipped_lock:
+                skipped[0] += 1
+            return CarRecord.from_row(state.payload(vehicle_id, "details")).refresh_listing(listing)
+        if state is not None and vehicle_id:
+            state.mark_started(vehicle_id, "details")
+
+        print(f"🔎 [W{ctx.worker_id}] Traitement annonce {idx}/{total or '?'} : {url}")
+        if engine == "http":
+            details = scrape_car_details_fast(ctx, url, downloader)
+        elif engine == "cdp":
+            details = scrape_car_details_cdp(tabs, url, downloader)
+        else:
+            details = scrape_car_details(ctx.driver, url, downloader)
+        record = CarRecord.from_listing(listing, details)
+
+        if state is not None and vehicle_id:
+            if details == ["N/A"] * 13:
+                state.mark_failed(vehicle_id, "details", "page non chargée")
+            else:
+                state.mark_done(vehicle_id, "details", record.to_row())
+        return record
+
+    def on_error(item, exc):
+        print(f"❌ Erreur avec l'annonce {item[0]} : {str(exc)[:50]}...")
+        return None
+
+    lean_profile = LeanProfile() if lean is True else (lean or None)
+    driver_factory = functools.partial(init_auto24_driver, lean=lean_profile)
+    tabs = None
+    if engine == "cdp":
+        tabs = CdpEngine(functools.partial(init_auto24_driver, lean=lean_profile, extra_args=BACKGROUND_TAB_ARGS),
+                         tabs=workers, lean=lean_profile).start()
+
+    # Store adressé par contenu : une photo déjà connue n'est ni retéléchargée ni dupliquée.
+    # Les images sont téléchargées en arrière-plan pendant la navigation.
+    store = ImageStore()
+    tracker = Progress(total, live=progress)
+    processor = ImageProcessor(store) if postprocess_images else None
+    read = 0
+    with ImageDownloader(max_workers=image_workers, store=store, processor=processor) as downloader:
+        results = iter_pool(enumerate(listings, start=1), handle, driver_factory,
+                            workers=workers, on_error=on_error, min_interval=min_interval,
+                            session_factory=create_http_session, driver_pool=sessions)
+        # Les lignes sont normalisées par lots de NORMALIZE_BATCH puis écrites (et vidées sur disque)
+        with open_writers([output_csv] + list(extra_outputs), DETAILED_HEADERS) as writer:
+            batch = []
+            for position, record in results:
+                read = position + 1
+                tracker.advance()
+                if record is not None:
+                    batch.append(record)
+                if len(batch) >= NORMALIZE_BATCH:
+                    writer.write_many(normalize_batch(batch))
+                    batch = []
+            writer.write_many(normalize_batch(batch))
+
+    if tabs is not None:
+        tabs.close()
+    if processor is not None:
+        processor.close()
+    store.close()
+    if skipped[0]:
+        print(f"⏭️ {skipped[0]} annonces déjà traitées ou inchangées, reprises depuis l'état")
+    FieldReport.summary()
+    if lean_profile is not None or sessions is not None:
+        PageWeightTracker.summary()
+    print(f"✅ {writer.rows_written} lignes enrichies sauvegardées dans {writer.path}")
+    return read
+
+def enqueue_listings(input_csv, queue):
+    """Enfile une tâche par annonce du CSV de l'étape 1 dans la file partagée (voir work_queue)"""
+    listings = read_listings(input_csv)
+    added = queue.enqueue((listing.vehicle_id, listing.url, listing.to_row())
+                          for listing in listings if listing.vehicle_id)
+    print(f"📥 {added} annonces ajoutées à la file ({len(listings) - added} déjà présentes ou sans URL)")
+    return added
+
+def queue_worker(queue, workers=4, engine="http", image_workers=8, lean=True, worker_id=None):
+    """Worker de la file partagée : autant d'instances que voulu, sur une ou plusieurs machines.
+
+    Chaque page de détail est réclamée sous bail puis publiée par vehicle_id ;
+    renvoie le nombre d'annonces traitées par ce worker.
+    """
+    FieldReport.reset()
+    lean_profile = LeanProfile() if lean is True else (lean or None)
+    driver_factory = functools.partial(init_auto24_driver, lean=lean_profile)
+    contexts = [WorkerContext(index, driver_factory, session_factory=create_http_session)
+                for index in range(workers)]
+
+    store = ImageStore()
+    with ImageDownloader(max_workers=image_workers, store=store) as downloader:
+        def handle(index, task):
+            ctx = contexts[index]
+            listing = ListingRecord.from_row(task.payload)
+            print(f"🔎 [W{ctx.worker_id}] Traitement annonce {listing.listing_id} : {task.url}")
+            try:
+                if engine == "http":
+                    details = scrape_car_details_fast(ctx, task.url, downloader)
+                else:
+                    details = scrape_car_details(ctx.driver, task.url, downloader)
+                if details == ["N/A"] * 13:
+                    raise RuntimeError("page non chargée")
+            except Exception:
+                # Comme detail_pool.iter_pool : un Chrome planté ne doit pas faire échouer les tâches suivantes
+                ctx.reset_driver()
+                raise
+            ctx.task_done()
+            return CarRecord.from_listing(listing, details).to_row()
+
+        try:
+            done = run_worker(queue, handle, worker_id=worker_id, threads=workers)
+        finally:
+            for ctx in contexts:
+                ctx.close()
+    store.close()
+    FieldReport.summary()
+    print(f"✅ {done} annonces traitées par ce worker ; file : {queue.counts()}")
+    return done
+
+def export_queue_results(queue, input_csv, output_csv, extra_outputs=()):
+    """Écrit le fichier de détails à partir des résultats publiés dans la file, dans l'ordre du CSV"""
+    with open_writers([output_csv] + list(extra_outputs), DETAILED_HEADERS) as writer:
+        batch = []
+        for listing in read_listings(input_csv):
+            result = queue.result(listing.vehicle_id) if listing.vehicle_id else None
+            if result is not None:
+                batch.append(CarRecord.from_row(result).refresh_listing(listing))
+            if len(batch) >= NORMALIZE_BATCH:
+                writer.write_many(normalize_batch(batch))
+                batch = []
+        writer.write_many(normalize_batch(batch))
+    print(f"✅ {writer.rows_written} lignes enrichies sauvegardées dans {writer.path}")
+    return writer.rows_written
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Scraper Auto24.ma : annonces, détails et images")
+    parser.add_argument("--no-resume", action="store_true", help="ignore un run interrompu")
+    parser.add_argument("--listing-mode", choices=("scroll", "pages"), default="scroll")
+    parser.add_argument("--full", action="store_true", help="revisite toutes les pages de détail (pas de delta)")
+    parser.add_argument("--instrument", action="store_true", help="écrit data/metrics.json et data/metrics.prom")
+    parser.add_argument("--cache", action="store_true", help="relit pages et images depuis le cache disque")
+    parser.add_argument("--cache-only", action="store_true",
+                        help="rejoue le dernier run hors ligne, uniquement depuis le cache disque")
+    parser.add_argument("--no-archive", action="store_true", help="n'archive pas le HTML des pages de détail")
+
+    # Étape 2 répartie sur plusieurs processus ou machines (voir work_queue)
+    commands = parser.add_subparsers(dest="command")
+    enqueue = commands.add_parser("enqueue", help="ajoute les annonces du CSV de l'étape 1 à la file partagée")
+    enqueue.add_argument("--input", default=os.path.join("data", "auto24_listings.csv"))
+    worker = commands.add_parser("worker", help="traite les pages de détail de la file partagée")
+    worker.add_argument("--workers", type=int, default=4)
+    worker.add_argument("--engine", choices=("http", "selenium"), default="http")
+    worker.add_argument("--image-workers", type=int, default=8)
+    worker.add_argument("--worker-id", default=None)
+    export = commands.add_parser("export", help="écrit le fichier de détails depuis les résultats de la file")
+    export.add_argument("--input", default=os.path.join("data", "auto24_listings.csv"))
+    export.add_argument("--output", default=os.path.join("data", "auto24_details.csv"))
+    export.add_argument("--extra", nargs="*", default=(), help="sorties supplémentaires (.ndjson, .parquet, .arrow)")
+    for command in (enqueue, worker, export):
+        command.add_argument("--queue", default=DEFAULT_QUEUE_PATH, help="chemin SQLite ou URL redis://")
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.command is None:
+        main(resume=not args.no_resume, listing_mode=args.listing_mode, instrument=args.instrument,
+             delta=not args.full, cache=args.cache, cache_only=args.cache_only, archive=not args.no_archive)
+    else:
+        queue = open_queue(args.queue)
+        if args.command == "enqueue":
+            enqueue_listings(args.input, queue)
+        elif args.command == "worker":
+            queue_worker(queue, workers=args.workers, engine=args.engine, image_workers=args.image_workers,
+                         worker_id=args.worker_id)
+        else:
+            export_queue_results(queue, args.input, args.output, extra_outputs=args.extra)
+        queue.close()
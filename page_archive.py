@@ -0,0 +1,332 @@
+# page_archive.py
+"""Archive des pages de détail brutes : segments compressés en ajout seul, index SQLite par véhicule.
+
+Chaque page lue (HTML HTTP ou code source rendu par Selenium) est ajoutée à la fin du
+segment courant (data/page_archive/pages-NNNNN.seg) sous forme d'un enregistrement
+autonome : en-tête JSON (identifiant, URL, date, empreinte) puis HTML compressé (zlib).
+Une page identique à la dernière version archivée du véhicule n'est pas réécrite.
+L'index ne sert qu'à retrouver (segment, position) ; il se reconstruit en relisant les
+segments.
+
+Le re-parse reconstruit le fichier de détails complet depuis l'archive, sans navigateur
+ni réseau, en répartissant les pages sur tous les cœurs : après un changement de
+sélecteur ou l'ajout d'un champ, plus besoin de tout recrawler.
+
+    python page_archive.py --reparse data/auto24_details_reparsed.csv
+    python page_archive.py --reparse data/auto24_details.parquet --include-removed
+    python page_archive.py --rebuild-index
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULT_ARCHIVE_DIR = os.path.join("data", "page_archive")
+SEGMENT_BYTES = 256 * 1024 ** 2
+
+# Pages confiées à chaque tâche du pool de re-parse
+REPARSE_CHUNK = 200
+
+# Origine de la page archivée
+HTTP = "http"
+RENDERED = "rendered"
+
+# Enregistrement : magique, longueur de l'en-tête JSON, longueur du corps compressé
+_RECORD = struct.Struct(">4sII")
+_MAGIC = b"A24P"
+
+
+def _segment_name(number):
+    return f"pages-{number:05d}.seg"
+
+
+def read_record(path, offset, length):
+    """(en-tête, HTML) de l'enregistrement de `length` octets à `offset` dans le segment `path`"""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(length)
+    return _decode(data)
+
+
+def _decode(data):
+    magic, header_len, body_len = _RECORD.unpack_from(data)
+    if magic != _MAGIC or len(data) < _RECORD.size + header_len + body_len:
+        raise ValueError("enregistrement d'archive invalide")
+    header = json.loads(data[_RECORD.size:_RECORD.size + header_len])
+    body = data[_RECORD.size + header_len:_RECORD.size + header_len + body_len]
+    return header, zlib.decompress(body).decode("utf-8")
+
+
+class PageArchive:
+    """Segments en ajout seul sous `root`, index SQLite véhicule -> versions archivées (sûr entre threads)"""
+
+    def __init__(self, root=DEFAULT_ARCHIVE_DIR, segment_bytes=SEGMENT_BYTES):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                vehicle_id TEXT NOT NULL,
+                url TEXT NOT NULL,
+                source TEXT NOT NULL,
+                sha1 TEXT NOT NULL,
+                archived_at REAL NOT NULL,
+                segment TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS pages_vehicle ON pages (vehicle_id, id);
+        """)
+        self._db.commit()
+        self._segment = None
+        self._file = None
+        self.appended = 0
+        self.unchanged = 0
+        self.bytes_written = 0
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._db.close()
+
+    # --- Écriture ---
+
+    def _open_segment(self):
+        """Reprend le dernier segment (tronqué à la fin indexée : une écriture interrompue est oubliée)"""
+        segments = self.segments()
+        number = int(segments[-1][len("pages-"):-len(".seg")]) if segments else 1
+        name = _segment_name(number)
+        end = self._db.execute("SELECT MAX(offset + length) FROM pages WHERE segment = ?", (name,)).fetchone()[0]
+        path = os.path.join(self.root, name)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if end is None and size:
+            # Segment absent de l'index (index à reconstruire) : on n'y touche pas
+            end = self.segment_bytes
+        elif end is not None and size > end:
+            os.truncate(path, end)
+        if (end or 0) >= self.segment_bytes:
+            name = _segment_name(number + 1)
+        self._segment = name
+        self._file = open(os.path.join(self.root, name), "ab")
+
+    def append(self, vehicle_id, url, page_html, source=HTTP):
+        """Archive `page_html` ; renvoie False si la dernière version du véhicule est identique"""
+        if not vehicle_id or not page_html:
+            return False
+        raw = page_html.encode("utf-8")
+        sha1 = hashlib.sha1(raw).hexdigest()
+        with self._lock:
+            latest = self._db.execute("SELECT sha1 FROM pages WHERE vehicle_id = ? ORDER BY id DESC LIMIT 1",
+                                      (vehicle_id,)).fetchone()
+            if latest is not None and latest[0] == sha1:
+                self.unchanged += 1
+                return False
+
+        # Compression hors verrou : les workers compressent en parallèle
+        now = time.time()
+        header = json.dumps({"vehicle_id": vehicle_id, "url": url, "source": source, "sha1": sha1,
+                             "archived_at": now}, ensure_ascii=False).encode("utf-8")
+        body = zlib.compress(raw, 6)
+        record = _RECORD.pack(_MAGIC, len(header), len(body)) + header + body
+
+        with self._lock:
+            if self._file is None:
+                self._open_segment()
+            elif self._file.tell() >= self.segment_bytes:
+                self._file.close()
+                self._segment = _segment_name(int(self._segment[len("pages-"):-len(".seg")]) + 1)
+                self._file = open(os.path.join(self.root, self._segment), "ab")
+            offset = self._file.tell()
+            self._file.write(record)
+            self._file.flush()
+            with self._db:
+                self._db.execute(
+                    "INSERT INTO pages (vehicle_id, url, source, sha1, archived_at, segment, offset, length) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (vehicle_id, url, source, sha1, now, self._segment, offset, len(record)))
+            self.appended += 1
+            self.bytes_written += len(record)
+        return True
+
+    # --- Lecture ---
+
+    def segments(self):
+        return sorted(name for name in os.listdir(self.root) if name.startswith("pages-") and name.endswith(".seg"))
+
+    def get(self, vehicle_id):
+        """HTML de la dernière version archivée du véhicule, ou None"""
+        location = self.latest_locations([vehicle_id]).get(vehicle_id)
+        if location is None:
+            return None
+        return read_record(*location)[1]
+
+    def latest_locations(self, vehicle_ids=None):
+        """{vehicle_id: (chemin du segment, position, longueur)} de la dernière version de chaque véhicule"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT vehicle_id, segment, offset, length, MAX(id) FROM pages GROUP BY vehicle_id").fetchall()
+        wanted = set(vehicle_ids) if vehicle_ids is not None else None
+        return {
+            vehicle_id: (os.path.join(self.root, segment), offset, length)
+            for vehicle_id, segment, offset, length, _ in rows
+            if wanted is None or vehicle_id in wanted
+        }
+
+    def rebuild_index(self):
+        """Reconstruit l'index en relisant tous les segments ; renvoie le nombre de pages indexées"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            with self._db:
+                self._db.execute("DELETE FROM pages")
+                for name in self.segments():
+                    with open(os.path.join(self.root, name), "rb") as f:
+                        data = f.read()
+                    offset = 0
+                    while offset + _RECORD.size <= len(data):
+                        magic, header_len, body_len = _RECORD.unpack_from(data, offset)
+                        length = _RECORD.size + header_len + body_len
+                        if magic != _MAGIC or offset + length > len(data):
+                            break  # fin tronquée par une écriture interrompue
+                        header = json.loads(data[offset + _RECORD.size:offset + _RECORD.size + header_len])
+                        self._db.execute(
+                            "INSERT INTO pages (vehicle_id, url, source, sha1, archived_at, segment, offset, length) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (header["vehicle_id"], header["url"], header["source"], header["sha1"],
+                             header["archived_at"], name, offset, length))
+                        offset += length
+            return self._db.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    # --- Bilan ---
+
+    def stats(self):
+        with self._lock:
+            pages, vehicles = self._db.execute("SELECT COUNT(*), COUNT(DISTINCT vehicle_id) FROM pages").fetchone()
+        size = sum(os.path.getsize(os.path.join(self.root, name)) for name in self.segments())
+        return {"pages": pages, "vehicles": vehicles, "size_bytes": size, "appended": self.appended,
+                "unchanged": self.unchanged, "bytes_written": self.bytes_written}
+
+    def summary(self):
+        stats = self.stats()
+        print(f"📦 Archive : {stats['appended']} pages ajoutées ({stats['bytes_written'] / 1024 ** 2:.1f} Mo), "
+              f"{stats['unchanged']} inchangées ; {stats['vehicles']} véhicules, {stats['pages']} versions, "
+              f"{stats['size_bytes'] / 1024 ** 2:.0f} Mo sur disque")
+        return stats
+
+
+# Archive partagée par les scrapers du processus (désactivée par défaut)
+default_archive = None
+
+
+def enable(root=DEFAULT_ARCHIVE_DIR, **options):
+    """Active l'archive partagée ; renvoie l'instance"""
+    global default_archive
+    default_archive = PageArchive(root, **options)
+    return default_archive
+
+
+def disable():
+    global default_archive
+    if default_archive is not None:
+        default_archive.close()
+    default_archive = None
+
+
+def archive_page(url, page_html, source=HTTP):
+    """Archive une page de détail si l'archive partagée est active"""
+    if default_archive is None:
+        return
+    from listing_cards import vehicle_id_from_url
+
+    default_archive.append(vehicle_id_from_url(url), url, page_html, source)
+
+
+# --- Re-parse hors ligne ---
+
+def reparse_chunk(chunk):
+    """Travail d'un processus du pool : lignes de détails normalisées de [(ligne d'annonce, emplacement)]"""
+    from fast_details import parse_car_details
+    from parsing import details_to_row
+    from records import ListingRecord, CarRecord, normalize_batch
+
+    records = []
+    for listing_row, location in chunk:
+        header, page_html = read_record(*location)
+        parsed = parse_car_details(page_html, base_url=header["url"])
+        records.append(CarRecord.from_listing(ListingRecord.from_row(listing_row), details_to_row(parsed.details)))
+    return [record.to_row() for record in normalize_batch(records)]
+
+
+def reparse(archive, listings, output_paths, workers=None, chunk_size=REPARSE_CHUNK):
+    """Réécrit le fichier de détails depuis l'archive pour `listings` [(vehicle_id, ligne d'annonce)].
+
+    Les pages sont parsées par lots dans un pool de `workers` processus (tous les cœurs
+    par défaut) ; les lignes sont écrites dans l'ordre de `listings`. Renvoie le nombre
+    de lignes écrites ; les annonces sans page archivée sont comptées et ignorées.
+    """
+    from records import DETAILED_HEADERS
+    from writers import open_writers
+
+    locations = archive.latest_locations()
+    items = [(row, locations[vehicle_id]) for vehicle_id, row in listings if vehicle_id in locations]
+    missing = len(listings) - len(items)
+    chunks = [items[start:start + chunk_size] for start in range(0, len(items), chunk_size)]
+    workers = workers or os.cpu_count()
+
+    started = time.monotonic()
+    # spawn : comme image_processing, pas de duplication de l'état du processus parent
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        with open_writers(list(output_paths), DETAILED_HEADERS) as writer:
+            for rows in executor.map(reparse_chunk, chunks):
+                writer.write_many(rows)
+    elapsed = time.monotonic() - started
+
+    rate = writer.rows_written / elapsed if elapsed > 0 else 0.0
+    print(f"♻️ Re-parse : {writer.rows_written} pages en {elapsed:.1f}s sur {workers} processus "
+          f"({rate:.0f} pages/s) -> {writer.path}")
+    if missing:
+        print(f"⚠️ {missing} annonces sans page archivée, absentes de la sortie")
+    return writer.rows_written
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Archive des pages de détail et re-parse hors ligne")
+    parser.add_argument("--root", default=DEFAULT_ARCHIVE_DIR)
+    parser.add_argument("--reparse", nargs="+", metavar="SORTIE",
+                        help="reconstruit le fichier de détails (.csv, .ndjson, .parquet, .arrow) depuis l'archive")
+    parser.add_argument("--state", default=None, help="état du crawl qui fournit les annonces (par défaut data/)")
+    parser.add_argument("--include-removed", action="store_true", help="garde les annonces retirées du site")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--rebuild-index", action="store_true", help="réindexe les segments existants")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    from crawl_state import CrawlState, DEFAULT_STATE_PATH
+
+    args = parse_args()
+    archive = PageArchive(args.root)
+    if args.rebuild_index:
+        print(f"🗂️ {archive.rebuild_index()} pages indexées")
+    if args.reparse:
+        state = CrawlState(args.state or DEFAULT_STATE_PATH)
+        reparse(archive, state.known_listings(include_removed=args.include_removed), args.reparse,
+                workers=args.workers)
+        state.close()
+    if not args.rebuild_index and not args.reparse:
+        archive.summary()
+    archive.close()
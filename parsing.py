@@ -0,0 +1,69 @@
+# parsing.py
+"""Schéma commun des détails d'annonce, partagé par les moteurs Selenium et HTTP."""
+
+DETAIL_FIELDS = [
+    'date_mise_circulation',
+    'kilometrage',
+    'carburant',
+    'transmission',
+    'places',
+    'carrosserie',
+    'nb_cles',
+    'couleur_ext',
+    'couleur_int',
+    'nb_proprietaires',
+    'condition',
+    'equipements',
+    'prix'
+]
+
+# En-têtes CSV des 13 colonnes de détails, dans l'ordre de DETAIL_FIELDS
+DETAIL_HEADERS = [
+    "Date mise circulation", "Kilométrage (détail)", "Carburant (détail)", "Transmission (détail)",
+    "Places", "Carrosserie", "Nombre de clés", "Couleur extérieure", "Couleur intérieure",
+    "Nombre propriétaires", "Condition", "Équipements", "Prix Détaillé"
+]
+
+# Libellé de la fiche technique -> champ du dictionnaire de détails
+SPEC_LABELS = [
+    ("Année", 'date_mise_circulation'),
+    ("Kilométrage", 'kilometrage'),
+    ("Carburant", 'carburant'),
+    ("Boîte de vitesses", 'transmission'),
+    ("Places", 'places'),
+    ("Carrosserie", 'carrosserie'),
+    ("Nombre de clés", 'nb_cles'),
+    ("Couleur extérieure", 'couleur_ext'),
+    ("Couleur intérieure", 'couleur_int'),
+    ("Nombre de propriétaires", 'nb_proprietaires'),
+    ("État", 'condition'),
+]
+
+
+def empty_details():
+    """Dictionnaire de détails avec les valeurs par défaut"""
+    details = {field: 'N/A' for field in DETAIL_FIELDS}
+    details['equipements'] = []
+    return details
+
+
+def apply_spec(details, label, value):
+    """Range une paire libellé/valeur de la fiche technique dans `details`.
+
+    Lève ValueError si le kilométrage n'est pas numérique (unité KM ou RW).
+    """
+    for needle, field in SPEC_LABELS:
+        if needle in label:
+            if field == 'kilometrage':
+                value = int(value.replace('KM', '').replace('RW', '').replace(' ', '').replace('\u202f', '').strip())
+            details[field] = value
+            return True
+    return False
+
+
+def details_to_row(details, separator=", "):
+    """Convertit le dictionnaire de détails en ligne de 13 colonnes"""
+    return [
+        separator.join(details[field]) if field == 'equipements' else details[field]
+        for field in DETAIL_FIELDS
+    ]
@@ -0,0 +1,147 @@
+# rate_limit.py
+"""Limiteur de débit adaptatif par hôte : token bucket réglé en AIMD selon latence, erreurs et 429/503."""
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import instrumentation
+import response_cache
+
+# Réponses qui signalent que le serveur nous freine
+THROTTLE_STATUSES = (429, 503)
+
+
+class HostBucket:
+    """Seau de jetons d'un hôte ; `rate` requêtes/s ajusté en continu"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.failures = 0
+
+
+class RateLimiter:
+    """Un seau par hôte (pages Auto24 et CDN d'images sont réglés séparément).
+
+    - augmentation additive de `increase` req/s après chaque succès rapide
+    - diminution multiplicative (`decrease`) sur erreur, 429/503 ou latence > `latency_target`
+    - sur 429/503 ou erreur, pause avec backoff exponentiel et jitter (Retry-After respecté)
+    """
+
+    def __init__(self, initial_rate=1.0, min_rate=0.1, max_rate=10.0, burst=2,
+                 increase=0.1, decrease=0.5, latency_target=3.0, max_backoff=120):
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def _bucket(self, host):
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = HostBucket(self.initial_rate, self.burst)
+        return bucket
+
+    def acquire(self, url):
+        """Bloque jusqu'à ce qu'un jeton soit disponible pour l'hôte de `url`"""
+        host = urlparse(url).netloc
+        while True:
+            with self._lock:
+                bucket = self._bucket(host)
+                now = time.monotonic()
+                bucket.tokens = min(bucket.burst, bucket.tokens + (now - bucket.updated) * bucket.rate)
+                bucket.updated = now
+                if now >= bucket.blocked_until and bucket.tokens >= 1:
+                    bucket.tokens -= 1
+                    return
+                wait = max(bucket.blocked_until - now, (1 - bucket.tokens) / bucket.rate)
+            instrumentation.sleep(wait)
+
+    def record(self, url, latency=None, status=None, error=False, retry_after=None):
+        """Ajuste le débit de l'hôte d'après le résultat d'une requête"""
+        host = urlparse(url).netloc
+        with self._lock:
+            bucket = self._bucket(host)
+            throttled = error or status in THROTTLE_STATUSES
+            if throttled:
+                bucket.failures += 1
+                bucket.rate = max(self.min_rate, bucket.rate * self.decrease)
+                backoff = min(self.max_backoff, 2 ** bucket.failures)
+                if retry_after:
+                    backoff = max(backoff, retry_after)
+                # Jitter : évite que tous les workers repartent en même temps
+                bucket.blocked_until = time.monotonic() + backoff * random.uniform(0.5, 1.0)
+                bucket.tokens = 0
+            elif latency is not None and latency > self.latency_target:
+                bucket.rate = max(self.min_rate, bucket.rate * (1 + self.decrease) / 2)
+            else:
+                bucket.failures = 0
+                bucket.rate = min(self.max_rate, bucket.rate + self.increase)
+
+    def rates(self):
+        with self._lock:
+            return {host: bucket.rate for host, bucket in self._buckets.items()}
+
+
+def retry_after_seconds(response):
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+# Limiteur partagé par tous les chemins de téléchargement du processus
+default_limiter = RateLimiter()
+
+
+def limited_session_get(session, url, limiter=None, cache=None, **kwargs):
+    """session.get soumis au limiteur ; le statut et la latence réglent le débit de l'hôte
+
+    Avec le cache de réponses (`cache`, ou response_cache.default_cache s'il est activé),
+    une réponse encore valide est servie sans requête ni attente du limiteur, et chaque
+    réponse 200 est mise en cache ; hors ligne, une URL absente lève CacheMiss.
+    """
+    cache = cache or response_cache.default_cache
+    if cache is not None:
+        cached = cache.get(url)
+        if cached is not None:
+            return cached
+        if cache.offline:
+            raise response_cache.CacheMiss(url)
+
+    limiter = limiter or default_limiter
+    limiter.acquire(url)
+    started = time.monotonic()
+    try:
+        response = session.get(url, **kwargs)
+    except Exception:
+        limiter.record(url, error=True)
+        raise
+    limiter.record(url, latency=time.monotonic() - started, status=response.status_code,
+                   retry_after=retry_after_seconds(response))
+    if cache is not None:
+        cache.store_response(url, response)
+    return response
+
+
+def limited_driver_get(driver, url, limiter=None):
+    """driver.get soumis au limiteur (Selenium ne donne pas le statut : seules latence et erreurs comptent)"""
+    limiter = limiter or default_limiter
+    limiter.acquire(url)
+    started = time.monotonic()
+    try:
+        driver.get(url)
+    except Exception:
+        limiter.record(url, error=True)
+        raise
+    limiter.record(url, latency=time.monotonic() - started)
@@ -0,0 +1,203 @@
+# records.py
+"""Enregistrements compacts (`__slots__`) des annonces et de leurs détails, et leur schéma unique.
+
+Les en-têtes CSV, les types des sorties structurées et l'ordre des champs dérivent
+tous de LISTING_COLUMNS et DETAILED_COLUMNS. Après `normalize_batch`, une valeur
+manquante vaut None (jamais 0 ni "N/A").
+"""
+import hashlib
+import re
+
+from parsing import DETAIL_FIELDS, DETAIL_HEADERS
+from listing_cards import vehicle_id_from_url
+
+EQUIPMENT_SEPARATOR = ", "
+
+# Valeurs qui signifient « inconnu » dans les pages et les anciens CSV
+NULL_TEXTS = frozenset(("", "N/A", "n/a", "-", "—"))
+
+# Espaces de milliers (normal, insécable, fine insécable) et unités de prix/kilométrage
+_SPACES = str.maketrans("", "", " \u00a0\u202f")
+_UNITS = re.compile(r"\s*(DH|MAD|KM|RW)\s*$", re.IGNORECASE)
+_NUMBER = re.compile(r"\d+")
+_YEAR = re.compile(r"\b(19|20)\d{2}\b")
+
+
+class Column:
+    """Une colonne du schéma : en-tête, attribut de l'enregistrement, type.
+
+    `source` : attribut dont la colonne est dérivée (ex. l'année depuis la date).
+    """
+    __slots__ = ("name", "attr", "type", "source")
+
+    def __init__(self, name, attr, type="str", source=None):
+        self.name = name
+        self.attr = attr
+        self.type = type
+        self.source = source
+
+
+LISTING_COLUMNS = (
+    Column("ID", "listing_id", "int"),
+    Column("Titre", "title"),
+    Column("Prix", "price", "price"),
+    Column("Transmission", "gearbox"),
+    Column("Type de carburant", "fuel"),
+    Column("Kilométrage", "mileage", "int"),
+    Column("Créateur", "seller"),
+    Column("URL de l'annonce", "url"),
+    Column("Dossier d'images", "folder"),
+)
+
+_DETAIL_TYPES = {
+    "kilometrage": "int",
+    "places": "int",
+    "nb_cles": "int",
+    "nb_proprietaires": "int",
+    "equipements": "list",
+    "prix": "price",
+}
+
+
+def _detail_columns():
+    columns = []
+    for field, header in zip(DETAIL_FIELDS, DETAIL_HEADERS):
+        columns.append(Column(header, field, _DETAIL_TYPES.get(field, "str")))
+        if field == "date_mise_circulation":
+            columns.append(Column("Année", "annee", "year", source=field))
+    return tuple(columns)
+
+
+# Fichier de détails : annonce (sans le dossier d'images) + détails (+ année dérivée)
+DETAIL_COLUMNS = _detail_columns()
+DETAILED_COLUMNS = LISTING_COLUMNS[:8] + DETAIL_COLUMNS
+
+LISTING_HEADERS = [column.name for column in LISTING_COLUMNS]
+DETAILED_HEADERS = [column.name for column in DETAILED_COLUMNS]
+
+# Typage des colonnes pour les sorties structurées
+COLUMN_TYPES = {column.name: column.type for column in LISTING_COLUMNS + DETAIL_COLUMNS}
+
+
+# --- Conversions (idempotentes : une valeur déjà normalisée est rendue telle quelle) ---
+
+def to_str(value):
+    if value is None:
+        return None
+    text = str(value).strip()
+    return None if text in NULL_TEXTS else text
+
+
+def to_int(value):
+    """'12 000 KM', '85 000 RW', '1er', 150000 -> int ; 'N/A', '' -> None"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    text = _UNITS.sub("", str(value).strip().translate(_SPACES))
+    match = _NUMBER.search(text)
+    return int(match.group()) if match else None
+
+
+def to_price(value):
+    """Comme `to_int`, mais un prix de 0 signifie « prix non affiché »"""
+    price = to_int(value)
+    return price or None
+
+
+def to_year(value):
+    """'03/2018', '2018', 2018 -> 2018"""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value if 1900 <= value <= 2100 else None
+    match = _YEAR.search(str(value)) if value is not None else None
+    return int(match.group()) if match else None
+
+
+def to_list(value):
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    if value is None or str(value).strip() in NULL_TEXTS:
+        return []
+    return [item.strip() for item in str(value).split(EQUIPMENT_SEPARATOR) if item.strip()]
+
+
+CONVERTERS = {"str": to_str, "int": to_int, "price": to_price, "year": to_year, "list": to_list}
+
+
+# --- Enregistrements ---
+
+class ListingRecord:
+    """Une annonce de l'étape 1 ; un attribut par colonne de LISTING_COLUMNS"""
+    __slots__ = tuple(column.attr for column in LISTING_COLUMNS)
+    columns = LISTING_COLUMNS
+
+    fields = __slots__
+
+    def __init__(self, **values):
+        for attr in self.fields:
+            setattr(self, attr, values.get(attr))
+
+    @classmethod
+    def from_row(cls, row):
+        """Ligne positionnelle dans l'ordre de `columns` (colonnes absentes -> None)"""
+        return cls(**{column.attr: value for column, value in zip(cls.columns, row)})
+
+    def to_row(self):
+        return [getattr(self, column.attr) for column in self.columns]
+
+    def to_dict(self):
+        """Dictionnaire typé indexé par en-tête de colonne"""
+        return {column.name: getattr(self, column.attr) for column in self.columns}
+
+    @property
+    def vehicle_id(self):
+        return vehicle_id_from_url(self.url)
+
+    def fingerprint(self):
+        """Empreinte de la carte (titre, prix, kilométrage, vendeur) pour détecter un changement"""
+        key = "\x1f".join(str(value) for value in (self.title, self.price, self.mileage, self.seller))
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, attr) == getattr(other, attr) for attr in self.fields)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.listing_id!r}, {self.url!r})"
+
+
+class CarRecord(ListingRecord):
+    """Annonce enrichie de sa page de détail ; colonnes de DETAILED_COLUMNS"""
+    __slots__ = tuple(column.attr for column in DETAIL_COLUMNS)
+    columns = DETAILED_COLUMNS
+    fields = ListingRecord.fields + __slots__
+
+    @classmethod
+    def from_listing(cls, listing, details):
+        """Annonce + ligne de 13 colonnes de détails (ordre de DETAIL_FIELDS)"""
+        record = cls(**{attr: getattr(listing, attr) for attr in ListingRecord.fields})
+        for field, value in zip(DETAIL_FIELDS, details):
+            setattr(record, field, value)
+        return record
+
+    def refresh_listing(self, listing):
+        """Reprend les colonnes d'annonce du run courant (ID, dossier...) sur des détails conservés"""
+        for attr in ListingRecord.fields:
+            setattr(self, attr, getattr(listing, attr))
+        return self
+
+
+def normalize_batch(records):
+    """Convertit sur place, colonne par colonne, tout un lot d'enregistrements du même type.
+
+    Prix, kilométrages, années, nombres de places, de clés et de propriétaires
+    deviennent des entiers ; les valeurs absentes ou illisibles deviennent None.
+    """
+    if not records:
+        return records
+    for column in records[0].columns:
+        convert = CONVERTERS[column.type]
+        attr, source = column.attr, column.source or column.attr
+        for record in records:
+            setattr(record, attr, convert(getattr(record, source)))
+    return records
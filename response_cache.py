@@ -0,0 +1,302 @@
+# response_cache.py
+"""Cache disque des réponses HTTP et des pages rendues par Selenium, indexé par URL.
+
+Corps compressés (zlib, sauf images déjà compressées), durée de vie par type de
+contenu, taille totale plafonnée avec éviction des entrées les moins récemment lues,
+et statistiques hits/misses. Une fois activé (`enable`), il est consulté par
+rate_limit.limited_session_get (pages de détail HTTP, images) avant toute requête,
+et par le scraper Selenium pour le code source des pages rendues.
+
+En mode hors ligne (`offline=True`), les entrées expirées restent servies et une URL
+absente lève CacheMiss au lieu de partir sur le réseau.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+
+DEFAULT_CACHE_DIR = os.path.join("data", "http_cache")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# Durée de vie (secondes) par préfixe de Content-Type, la première qui correspond
+DEFAULT_TTLS = (
+    ("text/html", 6 * 3600),
+    ("application/json", 3600),
+    ("image/", 30 * 24 * 3600),
+)
+DEFAULT_TTL = 24 * 3600
+
+# Variante des pages lues par Selenium (HTML rendu), distincte de la réponse HTTP brute
+RENDERED = "rendered"
+
+# Après éviction, la taille totale redescend à cette fraction du plafond
+EVICT_TO = 0.9
+
+# En-têtes conservés avec le corps
+KEPT_HEADERS = ("content-type", "etag", "last-modified")
+
+
+class CacheMiss(Exception):
+    """URL absente du cache en mode hors ligne"""
+
+
+class _Headers(dict):
+    """En-têtes insensibles à la casse (clés stockées en minuscules)"""
+
+    def get(self, key, default=None):
+        return super().get(key.lower(), default)
+
+    def __getitem__(self, key):
+        return super().__getitem__(key.lower())
+
+    def __contains__(self, key):
+        return super().__contains__(key.lower())
+
+
+class CachedResponse:
+    """Réponse servie depuis le cache : la partie de requests.Response utilisée par le scraper"""
+
+    from_cache = True
+    status_code = 200
+
+    def __init__(self, url, headers, content):
+        self.url = url
+        self.headers = _Headers(headers)
+        self.content = content
+
+    @property
+    def text(self):
+        content_type = self.headers.get("content-type", "")
+        charset = content_type.split("charset=")[-1].split(";")[0].strip() if "charset=" in content_type else "utf-8"
+        return self.content.decode(charset or "utf-8", errors="replace")
+
+    def iter_content(self, chunk_size=65536):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ResponseCache:
+    """Corps de réponse sous `root/objects`, index SQLite (URL, variante) -> fichier, expiration, dernier accès"""
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, ttls=DEFAULT_TTLS,
+                 default_ttl=DEFAULT_TTL, offline=False):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttls = tuple(ttls)
+        self.default_ttl = default_ttl
+        self.offline = offline
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT NOT NULL,
+                variant TEXT NOT NULL,
+                path TEXT NOT NULL,
+                final_url TEXT,
+                headers TEXT NOT NULL,
+                compressed INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (url, variant)
+            );
+            CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access);
+        """)
+        self._db.commit()
+        self._total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.stored = 0
+        self.evicted = 0
+        self.bytes_served = 0
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def ttl_for(self, content_type):
+        content_type = (content_type or "").lower()
+        for prefix, ttl in self.ttls:
+            if content_type.startswith(prefix):
+                return ttl
+        return self.default_ttl
+
+    def _object_path(self, url, variant):
+        key = hashlib.sha1(f"{variant}\n{url}".encode("utf-8")).hexdigest()
+        return os.path.join(key[:2], key + ".z")
+
+    # --- Lecture ---
+
+    def get(self, url, variant=""):
+        """CachedResponse de `url`, ou None si absente ou expirée (les expirées sont servies hors ligne)"""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT path, final_url, headers, compressed, expires_at FROM entries WHERE url = ? AND variant = ?",
+                (url, variant)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            path, final_url, headers, compressed, expires_at = row
+            if expires_at < now and not self.offline:
+                self.expired += 1
+                self.misses += 1
+                return None
+        try:
+            with open(os.path.join(self.objects_dir, path), "rb") as f:
+                content = f.read()
+            if compressed:
+                content = zlib.decompress(content)
+        except (OSError, zlib.error):
+            self._delete(url, variant)
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            with self._db:
+                self._db.execute("UPDATE entries SET last_access = ? WHERE url = ? AND variant = ?", (now, url, variant))
+            self.hits += 1
+            self.bytes_served += len(content)
+        return CachedResponse(final_url or url, json.loads(headers), content)
+
+    def get_page(self, url):
+        """HTML rendu d'une page lue par Selenium, ou None"""
+        response = self.get(url, RENDERED)
+        return response.text if response is not None else None
+
+    # --- Écriture ---
+
+    def put(self, url, content, headers=None, final_url=None, variant=""):
+        """Enregistre un corps de réponse ; la durée de vie dépend de son Content-Type"""
+        headers = {key.lower(): value for key, value in (headers or {}).items() if key.lower() in KEPT_HEADERS}
+        content_type = headers.get("content-type", "")
+        compressed = not content_type.startswith("image/")
+        data = zlib.compress(content, 6) if compressed else content
+        path = self._object_path(url, variant)
+        full_path = os.path.join(self.objects_dir, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        fd, partial_path = tempfile.mkstemp(dir=os.path.dirname(full_path), suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(partial_path, full_path)
+
+        now = time.time()
+        with self._lock:
+            with self._db:
+                previous = self._db.execute("SELECT size FROM entries WHERE url = ? AND variant = ?",
+                                            (url, variant)).fetchone()
+                self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+                    url, variant, path, final_url, json.dumps(headers), int(compressed), len(data),
+                    now, now + self.ttl_for(content_type), now))
+            self._total += len(data) - (previous[0] if previous else 0)
+            self.stored += 1
+            over = self._total > self.max_bytes
+        if over:
+            self._evict()
+
+    def store_response(self, url, response):
+        """Met en cache une réponse requests 200 (le corps est lu entièrement) et la renvoie"""
+        if response.status_code == 200:
+            self.put(url, response.content, response.headers, final_url=response.url)
+        return response
+
+    def put_page(self, url, page_html):
+        self.put(url, page_html.encode("utf-8"), {"Content-Type": "text/html; charset=utf-8"}, variant=RENDERED)
+
+    # --- Éviction ---
+
+    def _delete(self, url, variant):
+        with self._lock:
+            with self._db:
+                row = self._db.execute("SELECT path, size FROM entries WHERE url = ? AND variant = ?",
+                                       (url, variant)).fetchone()
+                if row is None:
+                    return
+                self._db.execute("DELETE FROM entries WHERE url = ? AND variant = ?", (url, variant))
+            self._total -= row[1]
+        try:
+            os.remove(os.path.join(self.objects_dir, row[0]))
+        except OSError:
+            pass
+
+    def _evict(self):
+        """Supprime les entrées les moins récemment lues jusqu'à EVICT_TO du plafond"""
+        target = self.max_bytes * EVICT_TO
+        while True:
+            with self._lock:
+                if self._total <= target:
+                    return
+                victims = self._db.execute(
+                    "SELECT url, variant FROM entries ORDER BY last_access LIMIT 100").fetchall()
+            if not victims:
+                return
+            for url, variant in victims:
+                self._delete(url, variant)
+                with self._lock:
+                    self.evicted += 1
+                    if self._total <= target:
+                        return
+
+    # --- Bilan ---
+
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "stored": self.stored,
+                "evicted": self.evicted,
+                "bytes_served": self.bytes_served,
+                "entries": entries,
+                "size_bytes": self._total,
+            }
+
+    def summary(self):
+        stats = self.stats()
+        print(f"🗄️ Cache : {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%}), "
+              f"{stats['bytes_served'] / 1024 ** 2:.1f} Mo servis depuis le disque, {stats['evicted']} évictions, "
+              f"{stats['entries']} entrées ({stats['size_bytes'] / 1024 ** 2:.0f}/{self.max_bytes / 1024 ** 2:.0f} Mo)")
+        return stats
+
+
+# Cache partagé par tous les chemins de téléchargement du processus (désactivé par défaut)
+default_cache = None
+
+
+def enable(root=DEFAULT_CACHE_DIR, offline=False, **options):
+    """Active le cache partagé ; renvoie l'instance"""
+    global default_cache
+    default_cache = ResponseCache(root, offline=offline, **options)
+    return default_cache
+
+
+def disable():
+    global default_cache
+    if default_cache is not None:
+        default_cache.close()
+    default_cache = None
@@ -0,0 +1,141 @@
+# scroll.py
+"""Scroll infini piloté par événements : on attend de vrais signaux plutôt que des sleeps fixes."""
+import time
+
+LOADER_SELECTOR = ".lds-roller"
+
+# Compte les requêtes fetch/XHR en cours pour détecter le réseau au repos
+INSTALL_NETWORK_HOOK_JS = """
+if (!window.__auto24Net) {
+    const net = window.__auto24Net = {inflight: 0};
+    const originalFetch = window.fetch;
+    window.fetch = function (...args) {
+        net.inflight++;
+        return originalFetch.apply(this, args).finally(() => { net.inflight--; });
+    };
+    const originalSend = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function (...args) {
+        net.inflight++;
+        this.addEventListener('loadend', () => { net.inflight--; }, {once: true});
+        return originalSend.apply(this, args);
+    };
+}
+"""
+
+# Scrolle en bas puis attend : plus de cartes (MutationObserver), ou réseau au repos
+# et loader masqué pendant `idleMs` (fin du catalogue), ou le délai de l'étape.
+SCROLL_STEP_JS = """
+const [selector, previous, timeoutMs, idleMs, loaderSelector] = arguments;
+const done = arguments[arguments.length - 1];
+const count = () => document.querySelectorAll(selector).length;
+const loaderVisible = () => {
+    const loader = document.querySelector(loaderSelector);
+    return !!(loader && loader.offsetParent !== null);
+};
+const busy = () => loaderVisible() || (window.__auto24Net && window.__auto24Net.inflight > 0);
+
+let finished = false;
+let idleSince = null;
+const finish = (reason) => {
+    if (finished) return;
+    finished = true;
+    observer.disconnect();
+    clearTimeout(timer);
+    clearInterval(poll);
+    done({count: count(), reason: reason});
+};
+const check = () => {
+    if (count() > previous && !loaderVisible()) return finish('grown');
+    if (busy()) { idleSince = null; return; }
+    idleSince = idleSince || performance.now();
+    if (performance.now() - idleSince >= idleMs) finish('idle');
+};
+const observer = new MutationObserver(check);
+observer.observe(document.body, {childList: true, subtree: true});
+const poll = setInterval(check, 100);
+const timer = setTimeout(() => finish('timeout'), timeoutMs);
+window.scrollTo(0, document.body.scrollHeight);
+check();
+"""
+
+
+class ScrollStats:
+    """Bilan d'un scroll : cartes chargées, durée, nombre d'étapes et raison de l'arrêt
+
+    `elapsed` : durée totale ; `active` : temps passé à scroller, hors suspensions du générateur.
+    """
+
+    def __init__(self, cards, elapsed, steps, stop_reason, active=None):
+        self.cards = cards
+        self.elapsed = elapsed
+        self.steps = steps
+        self.stop_reason = stop_reason
+        self.active = elapsed if active is None else active
+
+    @property
+    def cards_per_second(self):
+        return self.cards / self.active if self.active > 0 else 0.0
+
+
+def iter_scroll(driver, selector, target_count=None, time_budget=300,
+                step_timeout=15, idle_ms=1500, loader_selector=LOADER_SELECTOR):
+    """Générateur : rend le nombre de cartes chargées au départ puis après chaque étape de scroll.
+
+    Permet de traiter les nouvelles cartes pendant que le scroll continue ; le bilan
+    (ScrollStats) est la valeur de retour du générateur. `time_budget` ne compte que le
+    temps passé à scroller : l'appelant peut rester suspendu (étape 2 en retard, file
+    pleine) sans écourter le scan.
+    """
+    started = time.monotonic()
+    paused = 0.0
+    driver.set_script_timeout(step_timeout + 5)
+    driver.execute_script(INSTALL_NETWORK_HOOK_JS)
+
+    count = driver.execute_script("return document.querySelectorAll(arguments[0]).length", selector)
+    suspended = time.monotonic()
+    yield count
+    paused += time.monotonic() - suspended
+    steps = 0
+    stop_reason = "budget"
+
+    while True:
+        if target_count and count >= target_count:
+            stop_reason = "target"
+            break
+        remaining = time_budget - (time.monotonic() - started - paused)
+        if remaining <= 0:
+            break
+
+        timeout_ms = int(min(step_timeout, remaining) * 1000)
+        result = driver.execute_async_script(SCROLL_STEP_JS, selector, count, timeout_ms, idle_ms, loader_selector)
+        steps += 1
+
+        if result["count"] <= count and result["reason"] in ("idle", "timeout"):
+            stop_reason = "end" if result["reason"] == "idle" else "timeout"
+            count = result["count"]
+            break
+        count = result["count"]
+        suspended = time.monotonic()
+        yield count
+        paused += time.monotonic() - suspended
+
+    elapsed = time.monotonic() - started
+    stats = ScrollStats(count, elapsed, steps, stop_reason, active=elapsed - paused)
+    print(f"📜 {stats.cards} cartes chargées en {stats.active:.1f}s de scroll ({stats.elapsed:.1f}s au total) "
+          f"({stats.cards_per_second:.1f} cartes/s, {stats.steps} étapes, arrêt : {stats.stop_reason})")
+    return stats
+
+
+def scroll_until_loaded(driver, selector, target_count=None, time_budget=300,
+                        step_timeout=15, idle_ms=1500, loader_selector=LOADER_SELECTOR):
+    """Déclenche le chargement infini jusqu'à `target_count` cartes, la fin du catalogue ou `time_budget` secondes.
+
+    Chaque étape rend la main dès que de nouvelles cartes apparaissent ; la fin du
+    catalogue est détectée quand le réseau reste au repos sans nouvelle carte.
+    """
+    steps = iter_scroll(driver, selector, target_count, time_budget, step_timeout, idle_ms, loader_selector)
+    while True:
+        try:
+            next(steps)
+        except StopIteration as stop:
+            return stop.value
@@ -0,0 +1,432 @@
+# work_queue.py
+"""File de travail partagée : des workers (processus, machines) réclament les pages de détail sous bail.
+
+Chaque tâche est identifiée par son vehicle_id. Un worker la réclame pour `lease_seconds`,
+prolonge son bail par heartbeat tant qu'il travaille et publie le résultat, indexé par
+vehicle_id (une seconde publication remplace la première sans doublon). Un bail expiré
+(worker arrêté, machine perdue) remet la tâche en file, ou la passe en échec après
+`max_attempts` tentatives, comme une erreur signalée par le worker.
+
+Une tâche déjà connue n'est jamais ré-enfilée : un nouveau run utilise une nouvelle
+base ou un nouveau préfixe Redis.
+
+Deux implémentations, même interface :
+    SqliteWorkQueue("data/work_queue.sqlite")   # processus d'une même machine / disque partagé
+    RedisWorkQueue("redis://host:6379/0")       # plusieurs machines (nécessite `redis`)
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+import instrumentation
+
+DEFAULT_QUEUE_PATH = os.path.join("data", "work_queue.sqlite")
+DEFAULT_LEASE = 120
+MAX_ATTEMPTS = 3
+
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+def default_worker_id():
+    """Identifiant unique d'un worker : machine, processus et suffixe aléatoire"""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class Task:
+    """Une tâche réclamée : `payload` est la donnée enfilée (ligne d'annonce)"""
+
+    def __init__(self, vehicle_id, url, payload, attempts):
+        self.vehicle_id = vehicle_id
+        self.url = url
+        self.payload = payload
+        self.attempts = attempts
+
+
+class SqliteWorkQueue:
+    """File dans une base SQLite (WAL) ; les réclamations sont sérialisées par `BEGIN IMMEDIATE`"""
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH, lease_seconds=DEFAULT_LEASE, max_attempts=MAX_ATTEMPTS):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                vehicle_id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                payload TEXT,
+                status TEXT NOT NULL,
+                owner TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                seq INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, seq);
+            CREATE TABLE IF NOT EXISTS results (
+                vehicle_id TEXT PRIMARY KEY,
+                payload TEXT,
+                worker TEXT,
+                finished_at REAL NOT NULL
+            );
+        """)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _transaction(self, fn):
+        """Exécute `fn(db)` dans une transaction d'écriture exclusive entre processus"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    def enqueue(self, tasks):
+        """Ajoute [(vehicle_id, url, payload)] ; une tâche déjà connue n'est pas dupliquée"""
+        def insert(db):
+            seq = db.execute("SELECT COALESCE(MAX(seq), 0) FROM tasks").fetchone()[0]
+            added = 0
+            for vehicle_id, url, payload in tasks:
+                seq += 1
+                added += db.execute(
+                    "INSERT OR IGNORE INTO tasks (vehicle_id, url, payload, status, seq) VALUES (?, ?, ?, ?, ?)",
+                    (vehicle_id, url, json.dumps(payload, ensure_ascii=False), QUEUED, seq)).rowcount
+            return added
+        return self._transaction(insert)
+
+    def _requeue_expired(self, db, now):
+        """Rend à la file les tâches au bail expiré ; après `max_attempts` tentatives elles passent
+        en échec (une page qui tue son worker ne doit pas être réclamée indéfiniment)"""
+        return db.execute("""
+            UPDATE tasks SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END,
+                owner = NULL, lease_until = NULL,
+                error = CASE WHEN attempts >= ? THEN 'bail expiré' ELSE error END
+            WHERE status = ? AND lease_until < ?
+        """, (self.max_attempts, FAILED, QUEUED, self.max_attempts, LEASED, now)).rowcount
+
+    def requeue_expired(self):
+        return self._transaction(lambda db: self._requeue_expired(db, time.time()))
+
+    def claim(self, worker_id, limit=1):
+        """Réclame jusqu'à `limit` tâches pour `worker_id` ; liste vide si la file est vide"""
+        def take(db):
+            now = time.time()
+            self._requeue_expired(db, now)
+            rows = db.execute(
+                "SELECT vehicle_id, url, payload, attempts FROM tasks WHERE status = ? ORDER BY seq LIMIT ?",
+                (QUEUED, limit)).fetchall()
+            for vehicle_id, *_ in rows:
+                db.execute(
+                    "UPDATE tasks SET status = ?, owner = ?, lease_until = ?, attempts = attempts + 1 WHERE vehicle_id = ?",
+                    (LEASED, worker_id, now + self.lease_seconds, vehicle_id))
+            return [Task(vehicle_id, url, json.loads(payload), attempts + 1)
+                    for vehicle_id, url, payload, attempts in rows]
+        return self._transaction(take)
+
+    def heartbeat(self, worker_id, vehicle_ids):
+        """Prolonge les baux encore détenus ; renvoie le nombre de baux prolongés"""
+        def extend(db):
+            until = time.time() + self.lease_seconds
+            return sum(db.execute(
+                "UPDATE tasks SET lease_until = ? WHERE vehicle_id = ? AND owner = ? AND status = ?",
+                (until, vehicle_id, worker_id, LEASED)).rowcount for vehicle_id in vehicle_ids)
+        return self._transaction(extend)
+
+    def complete(self, worker_id, vehicle_id, result):
+        """Publie le résultat d'une tâche (idempotent par vehicle_id)"""
+        def finish(db):
+            db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                       (vehicle_id, json.dumps(result, ensure_ascii=False), worker_id, time.time()))
+            db.execute("UPDATE tasks SET status = ?, owner = NULL, lease_until = NULL, error = NULL WHERE vehicle_id = ?",
+                       (DONE, vehicle_id))
+        self._transaction(finish)
+
+    def fail(self, worker_id, vehicle_id, error):
+        """Rend la tâche à la file, ou la marque en échec après `max_attempts` tentatives"""
+        def release(db):
+            db.execute("""
+                UPDATE tasks SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END,
+                    owner = NULL, lease_until = NULL, error = ?
+                WHERE vehicle_id = ? AND owner = ?
+            """, (self.max_attempts, FAILED, QUEUED, str(error)[:200], vehicle_id, worker_id))
+        self._transaction(release)
+
+    def counts(self):
+        with self._lock:
+            return dict(self._db.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall())
+
+    def pending(self):
+        """Tâches en file ou sous bail"""
+        counts = self.counts()
+        return counts.get(QUEUED, 0) + counts.get(LEASED, 0)
+
+    def result(self, vehicle_id):
+        with self._lock:
+            row = self._db.execute("SELECT payload FROM results WHERE vehicle_id = ?", (vehicle_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def results(self):
+        """{vehicle_id: résultat} de toutes les tâches terminées"""
+        with self._lock:
+            rows = self._db.execute("SELECT vehicle_id, payload FROM results").fetchall()
+        return {vehicle_id: json.loads(payload) for vehicle_id, payload in rows}
+
+
+# Scripts Lua : chaque transition d'état est atomique côté Redis, un worker qui meurt
+# entre deux commandes ne peut pas laisser une tâche hors de la file et hors bail.
+_ENQUEUE_LUA = """
+if redis.call('HSETNX', KEYS[1], ARGV[1], ARGV[2]) == 1 then
+    redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+    redis.call('RPUSH', KEYS[3], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+# KEYS : queue, status, leases, owners, attempts, tasks
+# ARGV : worker, échéance du bail, limite, QUEUED, LEASED
+_CLAIM_LUA = """
+local claimed = {}
+while #claimed < tonumber(ARGV[3]) do
+    local id = redis.call('LPOP', KEYS[1])
+    if not id then break end
+    if redis.call('HGET', KEYS[2], id) == ARGV[4] then
+        redis.call('ZADD', KEYS[3], ARGV[2], id)
+        redis.call('HSET', KEYS[4], id, ARGV[1])
+        redis.call('HSET', KEYS[2], id, ARGV[5])
+        local attempts = redis.call('HINCRBY', KEYS[5], id, 1)
+        table.insert(claimed, {id, attempts, redis.call('HGET', KEYS[6], id)})
+    end
+end
+return claimed
+"""
+
+# Remet en file (ou en échec après max_attempts) une tâche qui quitte son bail.
+# KEYS : leases, owners, status, queue, attempts ; ARGV : QUEUED, FAILED, max_attempts, identifiants...
+_RELEASE_FN_LUA = """
+local function release(id)
+    redis.call('ZREM', KEYS[1], id)
+    redis.call('HDEL', KEYS[2], id)
+    if tonumber(redis.call('HGET', KEYS[5], id) or '0') >= tonumber(ARGV[3]) then
+        redis.call('HSET', KEYS[3], id, ARGV[2])
+        return 0
+    end
+    redis.call('HSET', KEYS[3], id, ARGV[1])
+    redis.call('RPUSH', KEYS[4], id)
+    return 1
+end
+"""
+
+# ARGV[4] : échéance ; renvoie le nombre de tâches remises en file
+_REQUEUE_EXPIRED_LUA = _RELEASE_FN_LUA + """
+local requeued = 0
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[1], 0, ARGV[4])) do
+    requeued = requeued + release(id)
+end
+return requeued
+"""
+
+# ARGV[4] : identifiant, ARGV[5] : worker ; sans effet si le bail appartient à un autre worker
+_FAIL_LUA = _RELEASE_FN_LUA + """
+if redis.call('HGET', KEYS[2], ARGV[4]) ~= ARGV[5] then
+    return -1
+end
+return release(ARGV[4])
+"""
+
+
+class RedisWorkQueue:
+    """Même file sur Redis, pour des workers répartis sur plusieurs machines.
+
+    Clés (préfixe `prefix`) : `queue` (liste FIFO), `tasks` (hash des tâches), `leases`
+    (zset échéance de bail), `owners`, `attempts`, `status` et `results` (hashes).
+    Enfilage, réclamation, expiration et échec sont des scripts Lua atomiques.
+    """
+
+    def __init__(self, url="redis://localhost:6379/0", lease_seconds=DEFAULT_LEASE,
+                 max_attempts=MAX_ATTEMPTS, prefix="auto24"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("redis est requis pour la file Redis (pip install redis)")
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.prefix = prefix
+        self._enqueue = self.redis.register_script(_ENQUEUE_LUA)
+        self._claim = self.redis.register_script(_CLAIM_LUA)
+        self._requeue_expired = self.redis.register_script(_REQUEUE_EXPIRED_LUA)
+        self._fail = self.redis.register_script(_FAIL_LUA)
+
+    def _key(self, name):
+        return f"{self.prefix}:{name}"
+
+    def _release_keys(self):
+        return [self._key(name) for name in ("leases", "owners", "status", "queue", "attempts")]
+
+    def close(self):
+        self.redis.close()
+
+    def enqueue(self, tasks):
+        keys = [self._key("tasks"), self._key("status"), self._key("queue")]
+        added = 0
+        for vehicle_id, url, payload in tasks:
+            task = json.dumps({"url": url, "payload": payload}, ensure_ascii=False)
+            added += self._enqueue(keys=keys, args=[vehicle_id, task, QUEUED])
+        return added
+
+    def requeue_expired(self):
+        return self._requeue_expired(keys=self._release_keys(),
+                                     args=[QUEUED, FAILED, self.max_attempts, time.time()])
+
+    def claim(self, worker_id, limit=1):
+        self.requeue_expired()
+        keys = [self._key(name) for name in ("queue", "status", "leases", "owners", "attempts", "tasks")]
+        rows = self._claim(keys=keys, args=[worker_id, time.time() + self.lease_seconds, limit, QUEUED, LEASED])
+        claimed = []
+        for vehicle_id, attempts, task in rows:
+            task = json.loads(task)
+            claimed.append(Task(vehicle_id, task["url"], task["payload"], int(attempts)))
+        return claimed
+
+    def heartbeat(self, worker_id, vehicle_ids):
+        extended = 0
+        until = time.time() + self.lease_seconds
+        for vehicle_id in vehicle_ids:
+            if self.redis.hget(self._key("owners"), vehicle_id) == worker_id:
+                self.redis.zadd(self._key("leases"), {vehicle_id: until}, xx=True)
+                extended += 1
+        return extended
+
+    def complete(self, worker_id, vehicle_id, result):
+        pipe = self.redis.pipeline()
+        pipe.hset(self._key("results"), vehicle_id, json.dumps(result, ensure_ascii=False))
+        pipe.hset(self._key("status"), vehicle_id, DONE)
+        pipe.zrem(self._key("leases"), vehicle_id)
+        pipe.hdel(self._key("owners"), vehicle_id)
+        pipe.execute()
+
+    def fail(self, worker_id, vehicle_id, error):
+        self._fail(keys=self._release_keys(), args=[QUEUED, FAILED, self.max_attempts, vehicle_id, worker_id])
+
+    def counts(self):
+        counts = {}
+        for status in self.redis.hvals(self._key("status")):
+            counts[status] = counts.get(status, 0) + 1
+        return counts
+
+    def pending(self):
+        counts = self.counts()
+        return counts.get(QUEUED, 0) + counts.get(LEASED, 0)
+
+    def result(self, vehicle_id):
+        value = self.redis.hget(self._key("results"), vehicle_id)
+        return json.loads(value) if value is not None else None
+
+    def results(self):
+        return {vehicle_id: json.loads(value) for vehicle_id, value in self.redis.hgetall(self._key("results")).items()}
+
+
+def open_queue(location=DEFAULT_QUEUE_PATH, **kwargs):
+    """`redis://...` -> RedisWorkQueue, sinon chemin de base SQLite"""
+    if location.startswith(("redis://", "rediss://")):
+        return RedisWorkQueue(location, **kwargs)
+    return SqliteWorkQueue(location, **kwargs)
+
+
+class _Heartbeat:
+    """Thread qui prolonge les baux des tâches en cours d'un worker"""
+
+    def __init__(self, queue, worker_id, interval):
+        self.queue = queue
+        self.worker_id = worker_id
+        self.interval = interval
+        self.active = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                active = list(self.active)
+            if active:
+                try:
+                    self.queue.heartbeat(self.worker_id, active)
+                except Exception as e:
+                    print(f"⚠️ Heartbeat impossible : {str(e)[:80]}")
+
+    def track(self, vehicle_id):
+        with self._lock:
+            self.active.add(vehicle_id)
+
+    def untrack(self, vehicle_id):
+        with self._lock:
+            self.active.discard(vehicle_id)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_worker(queue, handler, worker_id=None, threads=1, poll_interval=0.5):
+    """Traite des tâches de `queue` jusqu'à ce qu'il n'en reste plus ni en file ni sous bail.
+
+    `handler(ctx_index, task)` renvoie le résultat publié pour `task.vehicle_id` ;
+    une exception rend la tâche à la file. `threads` tâches sont traitées en parallèle
+    par ce processus. Renvoie le nombre de tâches terminées.
+    """
+    worker_id = worker_id or default_worker_id()
+    heartbeat = _Heartbeat(queue, worker_id, interval=max(1.0, queue.lease_seconds / 3))
+    completed = [0]
+    completed_lock = threading.Lock()
+
+    def loop(index):
+        while True:
+            tasks = queue.claim(worker_id)
+            if not tasks:
+                # File vide : on attend les baux des autres workers, qui peuvent expirer et revenir
+                if queue.pending() == 0:
+                    return
+                instrumentation.sleep(poll_interval)
+                continue
+            for task in tasks:
+                heartbeat.track(task.vehicle_id)
+                try:
+                    result = handler(index, task)
+                except Exception as e:
+                    print(f"❌ [{worker_id}] {task.vehicle_id} : {str(e)[:80]}")
+                    queue.fail(worker_id, task.vehicle_id, e)
+                else:
+                    queue.complete(worker_id, task.vehicle_id, result)
+                    with completed_lock:
+                        completed[0] += 1
+                finally:
+                    heartbeat.untrack(task.vehicle_id)
+
+    workers = [threading.Thread(target=loop, args=(index,), daemon=True) for index in range(threads)]
+    try:
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+    finally:
+        heartbeat.stop()
+    return completed[0]
@@ -0,0 +1,215 @@
+# writers.py
+"""Écriture en flux des lignes produites : CSV, NDJSON et Parquet/Arrow typés."""
+import csv
+import json
+import os
+
+from catalog_index import ListingIndex
+from records import COLUMN_TYPES, CONVERTERS, EQUIPMENT_SEPARATOR, ListingRecord
+
+
+def typed_record(columns, row):
+    """Ligne positionnelle -> dictionnaire typé selon COLUMN_TYPES (schéma de records.py)"""
+    return {
+        column: CONVERTERS[COLUMN_TYPES.get(column, "str")](value)
+        for column, value in zip(columns, row)
+    }
+
+
+def csv_value(value):
+    """Valeur typée -> cellule CSV : None vide, listes jointes par EQUIPMENT_SEPARATOR"""
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return EQUIPMENT_SEPARATOR.join(value)
+    return value
+
+
+class RowWriter:
+    """Interface commune : `write(row)` ajoute une ligne, `close()` finalise le fichier.
+
+    `row` est une ligne positionnelle ou un enregistrement de records.py (ListingRecord, CarRecord).
+    """
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = list(columns)
+        self.rows_written = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def write(self, row):
+        if isinstance(row, ListingRecord):
+            row = row.to_row()
+        self._write(row)
+        self.rows_written += 1
+
+    def write_many(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def _write(self, row):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CsvRowWriter(RowWriter):
+    """CSV `;` compatible avec les fichiers historiques, vidé sur disque à chaque ligne"""
+
+    def __init__(self, path, columns, delimiter=';'):
+        super().__init__(path, columns)
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file, delimiter=delimiter)
+        self._writer.writerow(self.columns)
+        self._file.flush()
+
+    def _write(self, row):
+        self._writer.writerow([csv_value(value) for value in row])
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class NdjsonRowWriter(RowWriter):
+    """Un objet JSON typé par ligne"""
+
+    def __init__(self, path, columns):
+        super().__init__(path, columns)
+        self._file = open(path, "w", encoding="utf-8")
+
+    def _write(self, row):
+        self._file.write(json.dumps(typed_record(self.columns, row), ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def _arrow_schema(pa, columns):
+    types = {"int": pa.int64(), "price": pa.int64(), "year": pa.int64(),
+             "list": pa.list_(pa.string()), "str": pa.string()}
+    return pa.schema([(column, types[COLUMN_TYPES.get(column, "str")]) for column in columns])
+
+
+class ArrowRowWriter(RowWriter):
+    """Fichier colonnes typées, écrit par lots de `batch_size` lignes.
+
+    Format Parquet pour `.parquet`, fichier IPC Arrow pour `.arrow`. Nécessite pyarrow.
+    """
+
+    def __init__(self, path, columns, batch_size=500):
+        super().__init__(path, columns)
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise RuntimeError("pyarrow est requis pour les sorties Parquet/Arrow (pip install pyarrow)")
+        self._pa = pa
+        self.batch_size = batch_size
+        self.schema = _arrow_schema(pa, self.columns)
+        self._batch = []
+
+        if path.endswith(".parquet"):
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(path, self.schema)
+        else:
+            self._sink = pa.OSFile(path, "wb")
+            self._writer = pa.ipc.new_file(self._sink, self.schema)
+
+    def _write(self, row):
+        self._batch.append(typed_record(self.columns, row))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._batch:
+            return
+        table = self._pa.Table.from_pylist(self._batch, schema=self.schema)
+        self._writer.write_table(table)
+        self._batch = []
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+        if hasattr(self, "_sink"):
+            self._sink.close()
+
+
+class IndexRowWriter(RowWriter):
+    """Mise à jour incrémentale de l'index de recherche (catalog_index), par lots de `batch_size`"""
+
+    def __init__(self, path, columns, batch_size=200):
+        super().__init__(path, columns)
+        self.index = ListingIndex(path)
+        self.batch_size = batch_size
+        self._batch = []
+
+    def _write(self, row):
+        self._batch.append(typed_record(self.columns, row))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._batch:
+            self.index.upsert_many(self._batch)
+            self._batch = []
+
+    def close(self):
+        self.flush()
+        self.index.close()
+
+
+class MultiRowWriter(RowWriter):
+    """Diffuse chaque ligne vers plusieurs sorties"""
+
+    def __init__(self, writers):
+        self.writers = list(writers)
+        self.columns = self.writers[0].columns if self.writers else []
+        self.path = ", ".join(writer.path for writer in self.writers)
+        self.rows_written = 0
+
+    def _write(self, row):
+        for writer in self.writers:
+            writer.write(row)
+
+    def flush(self):
+        for writer in self.writers:
+            writer.flush()
+
+    def close(self):
+        for writer in self.writers:
+            writer.close()
+
+
+def open_writer(path, columns):
+    """Choisit le format d'après l'extension : .csv, .ndjson/.jsonl, .parquet, .arrow, .sqlite (index)"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return CsvRowWriter(path, columns)
+    if extension in (".ndjson", ".jsonl"):
+        return NdjsonRowWriter(path, columns)
+    if extension in (".parquet", ".arrow"):
+        return ArrowRowWriter(path, columns)
+    if extension in (".sqlite", ".db"):
+        return IndexRowWriter(path, columns)
+    raise ValueError(f"Format de sortie non supporté : {path}")
+
+
+def open_writers(paths, columns):
+    """Un writer unique pour une ou plusieurs sorties"""
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    if len(paths) == 1:
+        return open_writer(paths[0], columns)
+    return MultiRowWriter(open_writer(path, columns) for path in paths)